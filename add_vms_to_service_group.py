@@ -26,25 +26,30 @@
 import json
 import sys
 import tintri_1_1 as tintri
+import tintri_vm_index
 
 """
  This Python script adds VMs from a file that contains a VM name per line
  to a servcie group.
 
  Command usage:
- qos_on_service_group.py server_name user_name password service_group file_name
+ add_vms_to_service_group.py server_name user_name password service_group file_name [batch_size]
  Where:"
      server_name   - name of a TGC server
      user_name     - user name used to login into the TGC server
      password      - password for the user
      service_group = The service group to add VMs to
      file_name     - file name of VMs to be placed in the service group
+     batch_size    - number of VMs added per API call.  Default is 100.
 
 """
 
 # For exhaustive messages on console, make it to True; otherwise keep it False
 debug_mode = False
 
+# Default number of VMs added to the service group per API call.
+DEFAULT_BATCH_SIZE = 100
+
 
 def print_with_prefix(prefix, out):
     print(prefix + out)
@@ -106,51 +111,54 @@ def get_service_group(server_name, session_id, service_group):
     return sg_uuid
 
 
-# Return a dictionary of VMs key by VM name.
-def get_vms(server_name, session_id):
+# Return a dictionary of VMs key by VM name and the dictionary of names
+# shared by several VMs.  Only the VMs with names in vm_names are kept.
+# The names are resolved with the local VM index, so an up to date index
+# needs no API calls.  Names shared by several VMs are reported and
+# skipped.
+def get_vms(server_name, session_id, vm_names):
 
-    vms = {}
-    
-    # Get a list of VMs, but return a page size at a time
-    get_vm_url = "/v310/vm"
-    count = 1
-    page_size = 100
-    vm_paginated_result = {'next' : "offset=0&limit=" + str(page_size)}
-    
-    print_info("Collecting VMs from TGC.")
+    print_info("Resolving VMs with the VM index.")
 
-    # While there are more Vms, go get them
-    while 'next' in vm_paginated_result:
-        url = get_vm_url + "?" + vm_paginated_result['next']
-        print_debug("Next GET VM URL: " + str(count) + ": " + url)
-    
-        r = tintri.api_get(server_name, url, session_id)
-        print_debug("The JSON response of the get invoke to the server " +
-                    server_name + " is: " + r.text)
-        
-        # For each VM in the page, print the VM name and UUID.
-        vm_paginated_result = r.json()
-    
-        # Check for the first time through the loop and
-        # print the total number of VMs.
-        if count == 1:
-            num_vms = vm_paginated_result["filteredTotal"]
-            if num_vms == 0:
-                raise tintri.TintriRequestsException("No VMs present")
-    
-            print_debug(str(num_vms) + " VMs present")
-    
-        items = vm_paginated_result["items"]
-        for vm in items:
-            vm_name = vm["vmware"]["name"]
-            vm_uuid = vm["uuid"]["uuid"]
-            print_debug(str(count) + ": " + vm_name + ", " + vm_uuid)
-            count += 1
-            vms[vm_name] = vm_uuid
-        print_info("Collected " + str(count) + " VMs.")
+    with tintri_vm_index.open_vm_index(server_name, session_id) as vm_index:
+        (vms, unknown, duplicates) = vm_index.resolve_names(vm_names)
+
+    for vm_name in sorted(duplicates):
+        print_info(vm_name + " is not unique: " + ", ".join(duplicates[vm_name]) +
+                   ".  Skipped.")
+
+    print_info(str(len(vms)) + " VMs resolved.")
+    return (vms, duplicates)
 
-    print_info(str(count) + "VMs collected from TGC.")
-    return vms
+
+# Add a batch of VMs to the service group with one API call.  If the call
+# fails, the batch is split in half and each half is retried, down to
+# the single VMs that fail.  Returns a tuple of (number of VMs added,
+# list of (VM name, response) for the VMs that failed).
+def add_vm_batch(server_name, session_id, add_members_url, vm_batch, vms):
+    members_to_add = {'typeId': 'com.tintri.api.rest.v310.dto.CollectionChangeRequest',
+                      'objectIdsAdded': [vms[vm] for vm in vm_batch]
+                     }
+
+    r = tintri.api_put(server_name, add_members_url, members_to_add, session_id)
+    if (r.status_code == 204):
+        for vm in vm_batch:
+            print("Added vm: " + vm)
+        return (len(vm_batch), [])
+
+    print_debug("The HTTP response for the put invoke to the server " + server_name +
+                " is not 204, but is: " + str(r.status_code) + ". Batch size: " +
+                str(len(vm_batch)))
+    if (len(vm_batch) == 1):
+        return (0, [(vm_batch[0], r)])
+
+    # Bisect the batch to find the VMs that fail.
+    half = len(vm_batch) // 2
+    (first_count, first_failed) = add_vm_batch(server_name, session_id, add_members_url,
+                                               vm_batch[:half], vms)
+    (second_count, second_failed) = add_vm_batch(server_name, session_id, add_members_url,
+                                                 vm_batch[half:], vms)
+    return (first_count + second_count, first_failed + second_failed)
 
 
 # Return a list of VMs read from a file
@@ -182,13 +190,15 @@ def read_vms_from_file(file_name):
 if len(sys.argv) < 6:
     print("\nAdds VMs from a file to a service group.")
     print("The file format is one VM name per line.\n")
-    print("Usage: " + sys.argv[0] + " server_name user_name password file_name\n")
+    print("Usage: " + sys.argv[0] + " server_name user_name password service_group file_name [batch_size]\n")
     print("Where:")
     print("    server_name   - name of a TGC server")
     print("    user_name     - user name used to login into the TGC and VMstore servers")
     print("    password      - password for the TGC and VMstore users")
     print("    service_group - service group to add VMs to")
     print("    file_name     - the file name of VMs to be placed in the service group")
+    print("    batch_size    - number of VMs added per API call.  Default is " +
+          str(DEFAULT_BATCH_SIZE))
     sys.exit(-1)
 
 server_name = sys.argv[1]
@@ -196,6 +206,20 @@ user_name = sys.argv[2]
 password = sys.argv[3]
 service_group = sys.argv[4]
 file_name = sys.argv[5]
+if (len(sys.argv) == 7):
+    try:
+        batch_size = int(sys.argv[6])
+    except ValueError:
+        batch_size = 0
+    if batch_size < 1:
+        print_error("batch_size must be a whole number of at least 1, not " + sys.argv[6])
+        sys.exit(-1)
+else:
+    batch_size = DEFAULT_BATCH_SIZE
+
+# Pace the API calls to what the server can take.  The governor slows
+# down when the server gets slow or answers 5xx.
+tintri.set_governor(tintri.TintriGovernor())
 
 try:
     # Get the preferred version
@@ -232,38 +256,49 @@ try:
     sg_uuid = get_service_group(server_name, session_id, service_group)
     print("Service group '" + service_group + "' exists.")
     
-    # Get a dictionary of VMs that are associated with the TGC
-    vms = get_vms(server_name, session_id)
-
     # Get a list of VMs to be placed into the service group
     vms_from_file = read_vms_from_file(file_name)
 
-    # Create the change requst and URL
-    members_to_add = {'typeId': 'com.tintri.api.rest.v310.dto.CollectionChangeRequest',
-                      'objectIdsAdded': ""
-                     }
+    # Get a dictionary of the VMs from the file that are associated with the TGC
+    (vms, duplicates) = get_vms(server_name, session_id, vms_from_file)
+
+    # Create the URL
     add_members_url = "/v310/servicegroup/" + sg_uuid + "/members/static"
 
-    # For each vm from the file, validate it, and add it to
-    # the service group.  If API error, stop.
-    vm_count = 0
+    # Validate each vm from the file.  A VM listed twice is added once.
+    vms_to_add = []
+    seen_uuids = set()
     for vm in vms_from_file:
+        if vm in duplicates:
+            # Already reported by get_vms().
+            continue
         if (not(vm in vms)):
             print_info(vm + " not in TGC VM list.")
             continue
+        if vms[vm] in seen_uuids:
+            continue
+        seen_uuids.add(vms[vm])
+        vms_to_add.append(vm)
 
-        members_to_add['objectIdsAdded'] = vms[vm]
-        
-        # Add VM to service group
-        r = tintri.api_put(server_name, add_members_url, members_to_add, session_id) 
-        if (r.status_code != 204):
-            msg = "The HTTP response for the put invoke to the server " + \
-                  server_name + " is not 204, but is: " + str(r.status_code) + "."
-            raise tintri.TintriApiException(msg, r.status_code, add_members_url, str(members_to_add), r.text)
-        print ("Added vm: " + vm)
-        vm_count += 1
+    # Add the VMs to the service group a batch at a time.  VMs that
+    # fail are reported at the end.
+    vm_count = 0
+    failed_vms = []
+    for i in range(0, len(vms_to_add), batch_size):
+        vm_batch = vms_to_add[i:i + batch_size]
+        (added, failed) = add_vm_batch(server_name, session_id, add_members_url,
+                                       vm_batch, vms)
+        vm_count += added
+        failed_vms += failed
         
+    for (vm, r) in failed_vms:
+        print_error("Failed to add vm: " + vm + ": status code=" + str(r.status_code) +
+                    " response:" + r.text)
+
     print(str(vm_count) + " VMs added to service group '" + service_group + "'.")
+    if len(failed_vms) > 0:
+        print_error(str(len(failed_vms)) + " VMs not added to service group '" +
+                    service_group + "'.")
 
 except tintri.TintriRequestsException as tre:
     print_error(tre.__str__())
@@ -277,3 +312,5 @@ except tintri.TintriApiException as tae:
 # All pau, log out
 tintri.api_logout(server_name, session_id)
 
+if len(failed_vms) > 0:
+    exit(-7)
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import time
+import argparse
+import tintri_1_1 as tintri
+import tintri_stats_store
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+"""
+ This Python script collects the historical stats of the live VMs into a
+ local stats store.
+
+ Each run fetches the samples since the last sample stored for a VM, or
+ the last --days days for a new VM, so the script can run periodically
+ to build up a history.  See tintri_stats_store for the store layout.
+
+ Command usage: collect_vm_stats <server_name> <userName> <password>
+                [--store dir] [--days N] [--vmstore name] [--workers N]
+                [--cache [file]]
+
+ Requires NumPy.
+
+"""
+
+# For exhaustive messages on console, make it to True; otherwise keep it False
+debug_mode = False
+
+# Number of days to collect for a VM with no stored stats.
+default_days = 7
+
+# Maximum number of concurrent statsHistoric requests.
+default_workers = 8
+
+# Commit the store after this many VMs.
+flush_interval = 500
+
+
+# print functions
+def print_with_prefix(prefix, out):
+    print(prefix + out)
+    return
+
+
+def print_debug(out):
+    if debug_mode:
+        print_with_prefix("[DEBUG] : ", out)
+    return
+
+
+def print_info(out):
+    print_with_prefix("[INFO] : ", out)
+    return
+
+
+def print_error(out):
+    print_with_prefix("[ERROR] : ", out)
+    return
+
+
+# Return a list of (VM UUID, VM name, VMstore name) of the live VMs,
+# optionally only the VMs on a VMstore.
+def get_live_vms(client, vmstore_name=None):
+    vm_filter = {'live' : "TRUE"}
+    vms = []
+    for vm in client.iter_collection("/v310/vm", vm_filter,
+                                     include_fields=tintri.VM_VMSTORE_FIELDS):
+        vm_vmstore = vm.get("vmstoreName", "")
+        if vmstore_name is not None and vm_vmstore != vmstore_name:
+            continue
+        vms.append((vm["uuid"]["uuid"], vm["vmware"]["name"], vm_vmstore))
+    return vms
+
+
+# Return the historical stats of a VM between since and until, epoch
+# seconds.  The stats are the sortedStats of the response, or of each of
+# its items; any other shape raises TintriApiException.
+def get_vm_stats_historic(client, vm_uuid, since, until):
+    url = "/v310/vm/" + vm_uuid + "/statsHistoric"
+    query = {'since' : tintri.format_api_time(since),
+             'until' : tintri.format_api_time(until)}
+    r = client.get(url, query)
+    if r.status_code != 200:
+        raise tintri.TintriApiException("Failed to get VM historic stats",
+                                         r.status_code, url, str(query), r.text)
+
+    stats = r.json()
+    if isinstance(stats, dict) and "sortedStats" in stats:
+        samples = stats["sortedStats"]
+    elif isinstance(stats, dict) and isinstance(stats.get("items"), list):
+        samples = []
+        for item in stats["items"]:
+            if not isinstance(item, dict) or "sortedStats" not in item:
+                samples = None
+                break
+            samples += item["sortedStats"]
+    else:
+        samples = None
+
+    if not isinstance(samples, list) or \
+       not all(isinstance(sample, dict) and "timeEnd" in sample for sample in samples):
+        raise tintri.TintriApiException("Unexpected VM historic stats",
+                                         r.status_code, url, str(query), r.text)
+    return samples
+
+
+# main
+parser = argparse.ArgumentParser(description="Collect historical VM stats into a local store")
+
+parser.add_argument("server_name", help="VMstore or TGC server name")
+parser.add_argument("user_name", help="user name")
+parser.add_argument("password", help="user name password")
+parser.add_argument("--store", default=tintri_stats_store.DEFAULT_STATS_STORE,
+                    help="stats store directory. Default: " +
+                         tintri_stats_store.DEFAULT_STATS_STORE)
+parser.add_argument("--days", type=float, default=default_days,
+                    help="days of stats to collect for VMs not in the store. Default: " +
+                         str(default_days))
+parser.add_argument("--vmstore", help="only collect the VMs on this VMstore")
+parser.add_argument("--workers", type=int, default=default_workers,
+                    help="maximum concurrent requests. Default: " + str(default_workers))
+parser.add_argument("--cache", nargs='?', const=tintri.DEFAULT_SESSION_CACHE,
+                    help="reuse the login session saved in a cache file. " +
+                         "Default: " + tintri.DEFAULT_SESSION_CACHE)
+
+args = parser.parse_args()
+
+server_name = args.server_name
+
+# The client logs in on first use, or reuses a cached session.
+client = tintri.TintriClient(server_name, args.user_name, args.password,
+                             cache_file=args.cache)
+
+try:
+    vms = get_live_vms(client, args.vmstore)
+except (tintri.TintriApiException, tintri.TintriRequestsException) as tre:
+    print_error(tre.__str__())
+    try:
+        client.close()
+    except (tintri.TintriApiException, tintri.TintriRequestsException) as close_err:
+        print_debug("Logout failed: " + close_err.__str__())
+    sys.exit(-10)
+
+print_info("Collecting stats of " + str(len(vms)) + " VMs")
+
+store = tintri_stats_store.TintriStatsStoreWriter(args.store, server_name)
+
+until = time.time()
+window_start = until - args.days * 24 * 3600
+
+samples = 0
+failed = 0
+executor = ThreadPoolExecutor(max_workers=args.workers)
+try:
+    futures = {}
+    for vm in vms:
+        last = store.get_last_time(vm[0])
+        since = window_start if last is None else max(last, window_start)
+        future = executor.submit(get_vm_stats_historic, client, vm[0], since, until)
+        futures[future] = vm
+
+    # The store is only written from this thread.
+    count = 0
+    for future in as_completed(futures):
+        (vm_uuid, vm_name, vmstore_name) = futures[future]
+        try:
+            stats = future.result()
+        except (tintri.TintriApiException, tintri.TintriRequestsException) as tre:
+            print_error(vm_name + ": " + tre.__str__())
+            failed += 1
+            continue
+
+        appended = store.append(vm_uuid, vm_name, vmstore_name, stats)
+        print_debug(vm_name + ": " + str(appended) + " samples")
+        samples += appended
+
+        count += 1
+        if count % flush_interval == 0:
+            store.flush()
+finally:
+    executor.shutdown()
+    store.close()
+
+client.close()
+
+print_info(str(samples) + " samples of " + str(len(vms) - failed) + " VMs stored in " +
+           store.path)
+if failed > 0:
+    sys.exit(-1)
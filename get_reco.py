@@ -29,7 +29,10 @@ import argparse
 import json
 import smtplib
 import tintri_1_1 as tintri
+import tintri_vm_index
+from tintri_records import VmstorePool
 from email.mime.text import MIMEText
+from concurrent.futures import ThreadPoolExecutor
 
 """
  This Python script generates a recommendation.
@@ -43,30 +46,13 @@ from email.mime.text import MIMEText
 debug_mode = False
 beans = "com.tintri.api.rest.v310.dto.domain.beans."
 
+# Maximum number of concurrent recommendation requests.
+default_workers = 8
+
 # Global text
 output_text = []
 
 
-# Class for VMstore pool.
-class VmstorePool:
-    def __init__(self, name, uuid):
-        self.name = name
-        self.uuid = uuid
-        self.reco_uuid = None
-
-    def get_name(self):
-        return self.name
-
-    def get_uuid(self):
-        return self.uuid
-
-    def get_reco_uuid(self):
-        return self.reco_uuid
-
-    def set_reco_uuid(self, reco_uuid):
-        self.reco_uuid = reco_uuid
-
-
 # Output functions
 def print_with_prefix(prefix, out):
     print(prefix + out)
@@ -100,31 +86,27 @@ def format_json(out):
     return json.dumps(out, sort_keys=True, indent=4, separators=(',', ': '))
 
 
-# Convert VM UUIDs to VM names
-# This is a simple but time consuming way.
-def get_vm_names(server, tgc_sess_id, vm_uuids):
+# Convert VM UUIDs to VM names with the local VM index.
+def get_vm_names(client, vm_uuids):
     vm_names = []
 
-    for vm_uuid in vm_uuids:
-        vm_url = "/v310/vm/" + vm_uuid
+    with tintri_vm_index.TintriVmIndex(client.server_name, client.get) as vm_index:
+        uuid_to_name = vm_index.resolve_uuids(vm_uuids)
 
-        r = tintri.api_get(server, vm_url, tgc_sess_id)
-        print_debug("The JSON response of the vm get invoke to the server " + \
-                    server + " is: " + r.text)
-        vm_info = r.json()
-        vm_names.append(vm_info["vmware"]["name"])
+    for vm_uuid in vm_uuids:
+        vm_names.append(uuid_to_name.get(vm_uuid, vm_uuid))
 
     return vm_names
 
 
 # Return the the VMstore pools from a TGC server.
-def get_pools(server, tgc_sess_id):
+def get_pools(client):
     vmstore_pools = []
 
     url = "/v310/vmstorePool"
-    r = tintri.api_get(server, url, tgc_sess_id)
+    r = client.get(url)
     print_debug("The JSON response of the get invoke to the server " +
-                server + " is: " + r.text)
+                client.server_name + " is: " + r.text)
 
     vm_paginated_result = r.json()
     num_pools = int(vm_paginated_result["filteredTotal"])
@@ -202,7 +184,7 @@ def get_action_groups(reco):
 
 
 # Get the outcome summary.
-def get_my_summary(server_name, sessiond_id, outcome):
+def get_my_summary(client, outcome):
     my_summary = ""
     if "flashInfo" in outcome:
         my_summary += outcome["flashInfo"]["issueType"] + ": "
@@ -217,8 +199,7 @@ def get_my_summary(server_name, sessiond_id, outcome):
         else:
             my_summary += "VMs not able to replicatte: "
             if ("vmTintriUuids" in outcome["protectionInfo"]):
-                vm_names = get_vm_names(server_name, sessiond_id, \
-                                        outcome["protectionInfo"]["vmTintriUuids"])
+                vm_names = get_vm_names(client, outcome["protectionInfo"]["vmTintriUuids"])
                 my_summary += " ".join(vm_names)
             else:
                 my_summary += " No UUIDs"
@@ -230,7 +211,7 @@ def get_my_summary(server_name, sessiond_id, outcome):
 
 
 # Print outcomes
-def get_outcomes(server_name, sessiond_id, reco):
+def get_outcomes(client, reco):
     if (not ("expectedOutcomes" in reco)):
         buffer("No outcomes")
         return
@@ -238,34 +219,45 @@ def get_outcomes(server_name, sessiond_id, reco):
     buffer("Outcomes")
     outcomes = reco["expectedOutcomes"]
     for outcome in outcomes:
-        my_summary = get_my_summary(server_name, sessiond_id, outcome)
+        my_summary = get_my_summary(client, outcome)
         buffer("    " + outcome["vmStoreDisplayName"] + ": " + my_summary)
         print_debug(format_json(outcome))
 
 
 # Get the current recommendation
-def get_current_reco(server, tgc_sess_id, pool):
+def get_current_reco(client, pool):
     print_debug("Looking for recommendation on pool " + pool.get_name())
     reco_url = "/v310/vmstorePool/" + pool.get_uuid() + "/recommendation/current"
 
-    r = tintri.api_get(server, reco_url, tgc_sess_id)
+    r = client.get(reco_url)
     print_debug("The JSON response of the reco get invoke to the server " +
-                server + " is: " + r.text)
+                client.server_name + " is: " + r.text)
     reco = r.json()
 
     return reco
 
 
+# Get the current recommendations of the pools concurrently, with at most
+# workers requests in flight.  The recommendations are returned in pool
+# order.
+def get_current_recos(client, pools, workers=default_workers):
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(pools))))
+    try:
+        return list(executor.map(lambda pool: get_current_reco(client, pool), pools))
+    finally:
+        executor.shutdown()
+
+
 # Execute and accept the recommendation
-def execute_reco(server, tgc_sess_id, pool):
+def execute_reco(client, pool):
     reco_url = "/v310/vmstorePool/" + pool.get_uuid() + "/recommendation/" + \
                pool.get_reco_uuid() + "/accept"
-    r = tintri.api_post(server, reco_url, None, tgc_sess_id)
+    r = client.post(reco_url, None)
     print_debug("The JSON response of the accept reco invoke to the server " +
-                server + " is: " + r.text)
+                client.server_name + " is: " + r.text)
     if (r.status_code != 204):
         msg = "The HTTP response for the accept reco post invoke to the server is " + \
-              server + "not 200, but is: " + str(r.status_code) + "."
+              client.server_name + "not 200, but is: " + str(r.status_code) + "."
         raise tintri.TintriApiException(msg, r.status_code, reco_url, "No payload", r.text)
 
 
@@ -316,6 +308,12 @@ parser.add_argument("--accept", action = "store_true", help="accept the recommen
 parser.add_argument("--you", help="e-mail address to send (admin@x.y)")
 parser.add_argument("--me", help="e-mail address to send from (postmaster@x.y)")
 parser.add_argument("--smtp", help="SMTP server. Default: 'smtp.x.y>'")
+parser.add_argument("--cache", nargs='?', const=tintri.DEFAULT_SESSION_CACHE,
+                    help="reuse the login session saved in a cache file. " +
+                         "Default: " + tintri.DEFAULT_SESSION_CACHE)
+parser.add_argument("--workers", type=int, default=default_workers,
+                    help="maximum concurrent recommendation requests. Default: " +
+                         str(default_workers))
         
 
 args = parser.parse_args()
@@ -347,10 +345,12 @@ server_name = args.server_name
 user_name = args.user_name
 password = args.password
 
+# The client logs in on first use, or reuses a cached session.
+client = tintri.TintriClient(server_name, user_name, password, cache_file=args.cache)
+
 # Get the product name
 try:
-    r = tintri.api_version(server_name)
-    json_info = r.json()
+    json_info = client.get_info()
     preferred_version = json_info['preferredVersion']
     product_name = json_info['productName']
     if json_info['productName'] != "Tintri Global Center":
@@ -365,7 +365,7 @@ try:
         raise tintri.TintriRequestsException("Incorrect minor Version: " + minor_version + ".  Should be 51 or greater")
 
     # Login to Tintri server
-    session_id = tintri.api_login(server_name, user_name, password)
+    client.get_session_id()
 
 except tintri.TintriRequestsException as tre:
     print_error(tre.__str__())
@@ -377,12 +377,12 @@ except tintri.TintriApiException as tae:
 # Let's get to work.
 reco_available = False
 try:
-    pools = get_pools(server_name, session_id)
+    pools = get_pools(client)
 
-    # For each pool, get the current recommendation
-    for pool in pools:
-        reco = get_current_reco(server_name, session_id, pool)
+    # Get the current recommendation of each pool.
+    recos = get_current_recos(client, pools, args.workers)
 
+    for (pool, reco) in zip(pools, recos):
         buffer("Pool: " + pool.get_name() + ": " + reco["state"])
         if (reco["state"] == "NO_RECOMMENDATION_NEEDED"):
             continue
@@ -392,15 +392,15 @@ try:
 
             get_issues(reco)
             get_action_groups(reco)
-            get_outcomes(server_name, session_id, reco)
+            get_outcomes(client, reco)
             reco_available = True
 
         buffer("")
 
     if accept_reco:
         for pool in pools:
-            if reco["state"] == "AVAILABLE" and pool.get_reco_uuid():
-                execute_reco(server_name, session_id, pool)
+            if pool.get_reco_uuid():
+                execute_reco(client, pool)
                 buffer("Accepted and executed recommendation for pool " + pool.get_name())
 
         buffer("")
@@ -412,11 +412,11 @@ except tintri.TintriApiException as tae:
     print_error(tae.__str__())
     exit(-5)
 
-# Log out
-tintri.api_logout(server_name, session_id)
+# Log out, unless the session is cached for the next run.
+client.close()
 
 # Now print the text
-print ""
+print("")
 for text in output_text:
     print(text)
 
@@ -26,9 +26,21 @@
 
 import json
 import sys
+import argparse
 import tintri_1_1 as tintri
+from tintri_records import VmStat
 from prettytable import PrettyTable
 
+# NumPy is optional.  With it the stats are kept in a VmStatsFrame, which
+# can sort, rank, filter and group the VMs, and can be read from a local
+# stats store filled by collect_vm_stats.py.
+try:
+    import tintri_stats
+    import tintri_stats_store
+except ImportError:
+    tintri_stats = None
+    tintri_stats_store = None
+
 
 """
  This Python script displays VM stats.
@@ -37,35 +49,28 @@ from prettytable import PrettyTable
  historical statistics that were collected in the last 10 minutes
  or earlier. 
 
- Command usage: get_vm_status <server_name> <userName> <password>
+ Command usage: get_vm_status <server_name> [<userName> <password>] [--cache [file]]
+                [--sort field] [--top N] [--where 'field>value'] [--by_vmstore]
+                [--from_store [dir]] [--since time] [--until time]
+                [--aggregation agg]
+
+ With --from_store the stats are aggregated from the local stats store
+ that collect_vm_stats.py fills, between --since and --until, instead of
+ being read from the server.  The user name and password are not needed.
+
+ --sort, --top, --where, --by_vmstore and --from_store need NumPy.
 
 """
 
 # For exhaustive messages on console, make it to True; otherwise keep it False
 debug_mode = False
 
+# Define the statistic fields to display.  The fields can be changed
+# without modifying the print code below.  See the API documentation
+# for more statistic fields.
+stat_fields = ['spaceUsedGiB', 'operationsTotalIops', 'latencyTotalMs']
 
-# Holds VM name, UUID, and statistics.
-class VmStat:
-    def __init__(self, name, uuid, stats):
-        self.name = name
-        self.uuid = uuid
-        self.stats = stats
-
-    def get_name(self):
-        return self.name
-    
-    def get_uuid(self):
-        return self.uuid
-
-    def get_stats(self):
-        return self.stats
 
-    def get_stat(self, stat):
-        if stat in self.stats:
-            return self.stats[stat]
-        return None
-        
 # print functions
 def print_with_prefix(prefix, out):
     print(prefix + out)
@@ -88,102 +93,178 @@ def print_error(out):
     return
 
 
-# Returns a dictionary of live VM objects with statistics with
-# the VM name as the key.
-def get_vms(session_id):
+# Return the live VMs a page size at a time.  The VMs are processed as
+# each page arrives while the next page is in flight.
+def iter_live_vms(client, include_fields):
+    get_vm_url = "/v310/vm"
+    vm_filter = {'live' : "TRUE"}
+    return client.iter_collection(get_vm_url, vm_filter, include_fields=include_fields)
+
+
+# Returns a VmStatsFrame of the live VMs with the statistics in
+# stat_fields.
+def get_vm_frame(client, stat_fields,
+                 include_fields=tintri.VM_STAT_FIELDS + ["vmstoreName"]):
+    try:
+        frame = tintri_stats.VmStatsFrame.from_vms(iter_live_vms(client, include_fields),
+                                                   stat_fields)
+    except tintri.TintriApiException as tae:
+        print_error(tae.__str__())
+        client.close()
+        sys.exit(-10)
+
+    if len(frame) == 0:
+        print_error("No VMs present")
+        client.close()
+        sys.exit(-99)
+
+    return frame
+
 
-    page_size = 25  # default
+# Returns a dictionary of live VM objects with statistics with
+# the VM name as the key.  Only the statistics in stat_fields are kept.
+# include_fields are the VM fields requested from the server.
+def get_vms(client, stat_fields, include_fields=tintri.VM_STAT_FIELDS):
 
     # dictionary of VM objects
     vms = {}
 
-    # Get a list of VMs a page size at a time
-    get_vm_url = "/v310/vm"
     count = 1
-    vm_paginated_result = {'live' : "TRUE",
-                           'next' : "offset=0&limit=" + str(page_size)}
-    
-    # While there are more VMs, go get them
-    while 'next' in vm_paginated_result:
-        url = get_vm_url + "?" + vm_paginated_result['next']
-
-        # This is a work-around for a TGC bug.
-        chop_i = url.find("&replicationHasIssue")
-        if chop_i != -1:
-            url = url[:chop_i]
-            print_debug("Fixing URL")
-
-        print_debug("Next GET VM URL: " + str(count) + ": " + url)
-    
-        # Invoke the API
-        r = tintri.api_get(server_name, url, session_id)
-        print_debug("The JSON response of the get invoke to the server " +
-                    server_name + " is: " + r.text)
-        
-        # if HTTP Response is not 200 then raise an error
-        if r.status_code != 200:
-            print_error("The HTTP response for the get invoke to the server " +
-                  server_name + " is not 200, but is: " + str(r.status_code))
-            print_error("url = " + url)
-            print_error("response: " + r.text)
-            tintri.api_logout(server_name, session_id)
-            sys.exit(-10)
-    
-        # For each VM in the page, print the VM name and UUID.
-        vm_paginated_result = r.json()
-    
-        # Check for the first time through the loop and
-        # print the total number of VMs.
-        if count == 1:
-            num_filtered_vms = vm_paginated_result["filteredTotal"]
-            if num_filtered_vms == 0:
-                print_error("No VMs present")
-                tintri.api_logout(server_name, session_id)
-                sys_exit(-99)
-    
-        # Get and store the VM items and save in a VM object.
-        items = vm_paginated_result["items"]
-        for vm in items:
+
+    # One tuple of the stat fields is shared by all the VmStat objects.
+    stat_fields = tuple(stat_fields)
+
+    try:
+        for vm in iter_live_vms(client, include_fields):
+            # Get and store the VM items and save in a VM object.
             vm_name = vm["vmware"]["name"]
             vm_uuid = vm["uuid"]["uuid"]
-            vm_stats = VmStat(vm_name, vm_uuid, vm["stat"]["sortedStats"][0])
+            latest_stats = vm["stat"]["sortedStats"][0]
+            vm_stats = VmStat(vm_name, vm_uuid, latest_stats, stat_fields)
             print_debug(str(count) + ": " + vm_name + ", " + vm_uuid)
             count += 1
-			
-			# Store the VM stats object keyed by VM name.
+
+            # Store the VM stats object keyed by VM name.
             vms[vm_name] = vm_stats
 
+    except tintri.TintriApiException as tae:
+        print_error(tae.__str__())
+        client.close()
+        sys.exit(-10)
+
+    if count == 1:
+        print_error("No VMs present")
+        client.close()
+        sys.exit(-99)
+
     return vms
 
 
-# main
-if len(sys.argv) < 4:
-    print("\nCollect VM stats")
-    print("Usage: " + sys.argv[0] + " server_name user_name password");
-    sys.exit(-1)
+# Returns a VmStatsFrame of the stats in stat_fields aggregated per VM
+# from the local stats store.
+def get_store_frame(store_dir, server_name, stat_fields, since, until, aggregation):
+    try:
+        store = tintri_stats_store.TintriStatsStore(store_dir, server_name)
+    except IOError as ioe:
+        print_error(ioe.__str__())
+        sys.exit(-10)
 
-server_name = sys.argv[1]
-user_name = sys.argv[2]
-password = sys.argv[3]
+    frame = store.query(stat_fields, since, until, aggregation)
+    store.close()
 
-# Get the preferred version
-r = tintri.api_version(server_name)
-json_info = r.json()
+    # The store keeps float32 stats, round off the float32 noise.
+    for field in stat_fields:
+        frame.columns[field] = frame.columns[field].round(2)
 
-print_info("API Version: " + json_info['preferredVersion'])
+    if len(frame) == 0:
+        print_error("No VM stats stored for the time range")
+        sys.exit(-99)
 
-# Login to VMstore
-session_id = tintri.api_login(server_name, user_name, password)
+    return frame
 
-vms = get_vms(session_id)
 
-# Logout
-tintri.api_logout(server_name, session_id)
+# Parse a --since or --until time, a UTC date or an API time, to epoch
+# seconds.
+def parse_time_arg(value):
+    if len(value) == 10:
+        value += "T00:00:00Z"
+    return tintri.parse_api_time(value)
 
-# Define the statistic fields to display.  The fields can be changed
-# without modifying the print code below.  See the API documentation
-# for more statistic fields.
-stat_fields = ['spaceUsedGiB', 'operationsTotalIops', 'latencyTotalMs']
+
+# main
+parser = argparse.ArgumentParser(description="Collect VM stats")
+
+parser.add_argument("server_name", help="VMstore or TGC server name")
+parser.add_argument("user_name", nargs='?', help="user name, not needed with --from_store")
+parser.add_argument("password", nargs='?', help="user name password, not needed with --from_store")
+parser.add_argument("--cache", nargs='?', const=tintri.DEFAULT_SESSION_CACHE,
+                    help="reuse the login session saved in a cache file. " +
+                         "Default: " + tintri.DEFAULT_SESSION_CACHE)
+parser.add_argument("--sort", choices=stat_fields,
+                    help="sort the VMs by a stat, largest first")
+parser.add_argument("--top", type=int, help="only show the N VMs with the largest --sort stat")
+parser.add_argument("--where", help="only show the VMs with a stat over or under a value, " +
+                                    "e.g. 'latencyTotalMs>5'")
+parser.add_argument("--by_vmstore", action="store_true",
+                    help="show the mean of the stats per VMstore")
+parser.add_argument("--from_store", nargs='?', const="",
+                    help="read the stats from a local stats store. Default: " +
+                         "~/.tintri_stats")
+parser.add_argument("--since", help="with --from_store, the start of the time range, " +
+                                    "e.g. 2026-10-13 or 2026-10-13T08:00:00Z")
+parser.add_argument("--until", help="with --from_store, the end of the time range")
+parser.add_argument("--aggregation", default="last",
+                    help="with --from_store, how to aggregate the samples of a VM: " +
+                         "count, sum, mean, min, max, last or a percentile such as " +
+                         "p99. Default: last")
+
+args = parser.parse_args()
+
+# Parse --where into a stat field, operator and value.
+where = None
+if args.where is not None:
+    for op in ('>=', '<=', '!=', '==', '>', '<'):
+        (field, found, value) = args.where.partition(op)
+        if found:
+            try:
+                where = (field.strip(), op, float(value))
+            except ValueError:
+                parser.error("--where value is not a number: " + value.strip())
+            break
+    if where is None or where[0] not in stat_fields:
+        parser.error("--where needs a stat field, an operator and a value, e.g. " +
+                     "'latencyTotalMs>5'")
+
+use_frame = args.sort or args.top or where or args.by_vmstore or args.from_store is not None
+if use_frame and tintri_stats is None:
+    parser.error("--sort, --top, --where, --by_vmstore and --from_store need NumPy")
+if args.top is not None and args.sort is None:
+    parser.error("--top needs --sort")
+if args.from_store is None and (args.user_name is None or args.password is None):
+    parser.error("the user_name and password are required without --from_store")
+
+since = None
+until = None
+if args.from_store is not None:
+    try:
+        since = None if args.since is None else parse_time_arg(args.since)
+        until = None if args.until is None else parse_time_arg(args.until)
+    except ValueError as ve:
+        parser.error(ve.__str__())
+    try:
+        tintri_stats_store.check_aggregation(args.aggregation)
+    except ValueError as ve:
+        parser.error(ve.__str__())
+
+server_name = args.server_name
+
+if args.from_store is None:
+    # The client logs in on first use, or reuses a cached session.
+    client = tintri.TintriClient(server_name, args.user_name, args.password,
+                                 cache_file=args.cache)
+
+    # Get the preferred version
+    print_info("API Version: " + client.get_preferred_version())
 
 # Create the table header with the fields
 table_header = ["VM name"]
@@ -193,6 +274,50 @@ for field in stat_fields:
 table = PrettyTable(table_header)
 table.align["VM name"] = "l"
 
+if tintri_stats is not None:
+    if args.from_store is not None:
+        store_dir = args.from_store or tintri_stats_store.DEFAULT_STATS_STORE
+        frame = get_store_frame(store_dir, server_name, stat_fields, since, until,
+                                args.aggregation)
+    else:
+        frame = get_vm_frame(client, stat_fields)
+
+        # Logout, unless the session is cached for the next run.
+        client.close()
+
+    if where is not None:
+        frame = frame.where(*where)
+    if args.top is not None:
+        frame = frame.top(args.sort, args.top)
+    elif args.sort is not None:
+        frame = frame.sort(args.sort, descending=True)
+    else:
+        frame = frame.sort()
+
+    # Build the table rows based on the statistic fields
+    for (name, uuid, stats) in frame.rows(stat_fields):
+        print_debug(name + " " + uuid)
+        table.add_row([name] + ["---" if stat is None else stat for stat in stats])
+
+    # Print the table
+    print(table)
+
+    if args.by_vmstore:
+        vmstore_table = PrettyTable(["VMstore", "VMs"] + ["mean " + field for field in stat_fields])
+        vmstore_table.align["VMstore"] = "l"
+        counts = frame.group_by_vmstore(stat_fields[0], 'count')
+        means = [frame.group_by_vmstore(field, 'mean') for field in stat_fields]
+        for vmstore in sorted(counts):
+            vmstore_table.add_row([vmstore, int(counts[vmstore])] +
+                                  [round(mean[vmstore], 2) for mean in means])
+        print(vmstore_table)
+    sys.exit(0)
+
+vms = get_vms(client, stat_fields)
+
+# Logout, unless the session is cached for the next run.
+client.close()
+
 # Build the table rows based on the statistic fields
 for key, value in sorted(vms.items()):
     print_debug(key + " " + value.get_uuid())
@@ -90,8 +90,11 @@ try:
     # Get a list of VMs, but only return a page size
     url = "/v310/vm"
     r = tintri.api_get(server_name, url, session_id)
-    print_debug("The JSON response of the get invoke to the server " +
-                server_name + " is: " + r.text)
+
+    # Formatting r.text decodes the whole page, so only do it for debug.
+    if debug_mode:
+        print_debug("The JSON response of the get invoke to the server " +
+                    server_name + " is: " + r.text)
 
     vm_paginated_result = r.json()
     num_vms = int(vm_paginated_result["filteredTotal"])
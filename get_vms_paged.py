@@ -32,7 +32,9 @@ import tintri_1_1 as tintri
  Paged invocations are useful so that the client doesn't have to suck-in
  all the information at one time.
 
- Command usage: get_vms_paged <server_name> <userName> <password>
+ After the first page, the remaining pages are fetched in parallel.
+
+ Command usage: get_vms_paged <server_name> <userName> <password> [page_size]
 
 """
 
@@ -61,18 +63,33 @@ def print_error(out):
     return
 
 
+def print_usage():
+    print("\nPrints VM information using pagination\n")
+    print("Usage: " + sys.argv[0] + " server_name user_name password [page_size]\n")
+    print("Where page_size is a whole number of VMs of at least 1, default " +
+          str(tintri.DEFAULT_PAGE_SIZE) + ".\n")
+    return
+
+
 # main
 if len(sys.argv) < 4:
-    print("\nPrints VM information using pagination\n")
-    print("Usage: " + sys.argv[0] + " server_name user_name password\n")
+    print_usage()
     sys.exit(-1)
 
 server_name = sys.argv[1]
 user_name = sys.argv[2]
 password = sys.argv[3]
-
-# Could make this an input parameter
-page_size = 25
+if (len(sys.argv) == 5):
+    try:
+        page_size = int(sys.argv[4])
+    except ValueError:
+        page_size = 0
+    if page_size < 1:
+        print_error("Invalid page_size: " + sys.argv[4])
+        print_usage()
+        sys.exit(-1)
+else:
+    page_size = tintri.DEFAULT_PAGE_SIZE
 
 # Get the preferred version
 r = tintri.api_version(server_name)
@@ -83,49 +100,37 @@ print_info("API Version: " + json_info['preferredVersion'])
 # Login to VMstore
 session_id = tintri.api_login(server_name, user_name, password)
 
-# Get a list of VMs, but return a page size at a time
+# Get a list of VMs, but return a page size at a time.  After the first
+# page, the remaining pages are fetched in parallel.  Only the name and
+# UUID fields are requested and decoded.
 get_vm_url = "/v310/vm"
 count = 1
-vm_paginated_result = {'next' : "offset=0&limit=" + str(page_size)}
-
-# While there are more Vms, go get them
-while 'next' in vm_paginated_result:
-    url = get_vm_url + "?" + vm_paginated_result['next']
-    print_debug("Next GET VM URL: " + str(count) + ": " + url)
-
-    r = tintri.api_get(server_name, url, session_id)
-    print_debug("The JSON response of the get invoke to the server " +
-                server_name + " is: " + r.text)
-    
-    # if HTTP Response is not 200 then raise an error
-    if r.status_code != 200:
-        print_error("The HTTP response for the get invoke to the server " +
-              server_name + " is not 200, but is: " + str(r.status_code))
-        print_error("url = " + url)
-        print_error("response: " + r.text)
-        tintri.api_logout(server_name, session_id)
-        sys.exit(-10)
+vm_pages = tintri.api_paginator(server_name, get_vm_url, None, session_id, page_size,
+                                fields=tintri.VM_UUID_NAME_PATHS)
 
+try:
     # For each VM in the page, print the VM name and UUID.
-    vm_paginated_result = r.json()
+    for vm in vm_pages:
+        # Check for the first time through the loop and
+        # print the total number of VMs.
+        if count == 1:
+            print_info(str(vm_pages.total) + " VMs present")
 
-    # Check for the first time through the loop and
-    # print the total number of VMs.
-    if count == 1:
-        num_vms = vm_paginated_result["filteredTotal"]
-        if num_vms == 0:
-            print_error("No VMs present")
-            break
-
-        print_info(str(num_vms) + " VMs present")
-
-    items = vm_paginated_result["items"]
-    for vm in items:
-        vm_name = vm["vmware"]["name"]
-        vm_uuid = vm["uuid"]["uuid"]
+        (vm_uuid, vm_name) = vm
         print(str(count) + ": " + vm_name + ", " + vm_uuid)
         count += 1
 
+    if count == 1:
+        print_error("No VMs present")
+
+except tintri.TintriRequestsException as tre:
+    print_error(tre.__str__())
+    tintri.api_logout(server_name, session_id)
+    sys.exit(-10)
+except tintri.TintriApiException as tae:
+    print_error(tae.__str__())
+    tintri.api_logout(server_name, session_id)
+    sys.exit(-10)
+
 # All pau, log out
 tintri.api_logout(server_name, session_id)
-
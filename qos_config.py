@@ -26,6 +26,7 @@
 import sys
 import json
 import tintri_1_1 as tintri
+from tintri_records import VmQosInfo
 
 """
  This Python script configures QoS on the first 2 live VMs
@@ -38,36 +39,6 @@ import tintri_1_1 as tintri
 # For exhaustive messages on console, make it to True; otherwise keep it False
 debug_mode = False
 
-# Class to hold the VM name, UUID, and QOS information, min and max IOPs.
-class VmQosInfo:
-    def __init__(self, name, uuid, min_value, max_value):
-        self.name = name
-        self.uuid = uuid
-        self.min_value = min_value
-        self.max_value = max_value
-
-    def get_name(self):
-        return self.name
-
-    def get_uuid(self):
-        return self.uuid
-
-    def get_min_value(self):
-        return self.min_value
-
-    def get_max_value(self):
-        return self.max_value
-
-    def set_min_value(self, new_value):
-        self.min_value = new_value
-
-    def set_max_value(self, new_value):
-        self.max_value = new_value
-
-    def __str__(self):
-        return ("VM name: " + self.name + " UUID: " + self.uuid +
-               " (" + str(self.min_value) + ", " + str(self.max_value) + ")")
-
 # Helper print routines.
 def print_with_prefix(prefix, out):
     print(prefix + out)
@@ -117,8 +88,11 @@ q_filter = {'live': 'TRUE'}
 # Get a list of live VMs
 url = "/v310/vm"
 r = tintri.api_get_query(server_name, url, q_filter, session_id)
-print_debug("The JSON response of the get invoke to the server " +
-            server_name + " is: " + r.text)
+
+# Formatting r.text decodes the whole page, so only do it for debug.
+if debug_mode:
+    print_debug("The JSON response of the get invoke to the server " +
+                server_name + " is: " + r.text)
 
 # if HTTP Response is not 200 then raise an exception
 if r.status_code != 200:
@@ -23,16 +23,53 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import io
 import sys
 import csv
+import json
+import time
+import hashlib
+import shutil
 import os.path
 import getpass
+import zipfile
+import argparse
+import tempfile
 import tintri_1_1 as tintri
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# NumPy is needed to convert the report to a .npz file and pyarrow to
+# convert it to a Parquet file.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 """
  This Python script prints a URL that downloads a CSV report.
 
  Command usage: get_vm_report.py <server_name> <field_file_name> <csv_file_name>
+                [columnar_file_name] [--user user] [--password password]
+
+ server_name can be a comma separated list of TGCs.  Their reports are
+ then requested and downloaded in parallel and merged into one report
+ with a SourceTGC column, without duplicate VMs.
+
+ --since and --until report a time window.  With --dataset dir, each run
+ reports the window from the last run's until to now, per TGC and field
+ set, and also saves each TGC's window report in the dataset directory:
+
+   <dir>/state.json                               last until per TGC and field set
+   <dir>/<field set>/<TGC>/<day>/<since>_<until>.csv  one file per window
+
+ With columnar_file_name, a .npz or .parquet file, the CSV report is also
+ converted to one typed column per field.  The conversion reads the CSV
+ a batch of rows at a time.
 
 """
 
@@ -40,6 +77,20 @@ import tintri_1_1 as tintri
 debug_mode = False
 BEANS_VM = "com.tintri.api.rest.v310.dto.domain.beans.vm."
 
+# Report field types.
+FIELD_STRING = "string"
+FIELD_FLOAT = "float"
+FIELD_BOOL = "bool"
+
+# Rows converted at a time.
+batch_rows = 10000
+
+# Column of the TGC a row of a merged report is from.
+SOURCE_TGC_FIELD = "SourceTGC"
+
+# State file of a report dataset.
+DATASET_STATE = "state.json"
+
 
 def print_with_prefix(prefix, out):
     print(prefix + out)
@@ -85,20 +136,382 @@ def get_fields(field_file_loc):
         sys.exit(4)
 
 
+# Return a dictionary of field name to field type for the fields in a
+# field file, commented out or not.  The type is inferred from the field
+# description: "Indicates if ..." fields are booleans, names, UUIDs and
+# dates are strings and the rest are numbers.
+def get_field_types(field_file_loc):
+    field_types = {}
+
+    with open(field_file_loc, 'r') as csv_file:
+        for row in csv.reader(csv_file):
+            if len(row) < 2:
+                continue
+            field = row[0].strip(' ').lstrip('#').strip(' ')
+            description = row[1].strip(' ').lower()
+            if description.startswith("indicates if"):
+                field_types[field] = FIELD_BOOL
+            elif "name" in description or "uuid" in description or "date" in description:
+                field_types[field] = FIELD_STRING
+            else:
+                field_types[field] = FIELD_FLOAT
+
+    return field_types
+
+
+# Convert a batch of CSV rows to a dictionary of field to column.  Numbers
+# are float64 with NaN for a blank or bad value, booleans are bool and
+# strings are lists.
+def convert_rows(rows, fields, field_types):
+    columns = {}
+    for (index, field) in enumerate(fields):
+        values = [row[index] if index < len(row) else "" for row in rows]
+        field_type = field_types.get(field, FIELD_STRING)
+        if field_type == FIELD_FLOAT:
+            column = np.empty(len(values), dtype=np.float64)
+            for (row, value) in enumerate(values):
+                try:
+                    column[row] = float(value)
+                except ValueError:
+                    column[row] = np.nan
+        elif field_type == FIELD_BOOL:
+            column = np.array([value.strip().lower() in ("true", "yes", "1")
+                               for value in values], dtype=np.bool_)
+        else:
+            column = values
+        columns[field] = column
+    return columns
+
+
+# Writes the columns of a report to a .npz file, one array per field.  The
+# batches are appended to a scratch file per field, and the arrays are
+# copied into the .npz when the row count and the string widths are
+# known.
+class NpzReportWriter:
+    def __init__(self, file_name, fields, field_types):
+        self.file_name = file_name
+        self.fields = fields
+        self.field_types = field_types
+        self.rows = 0
+        self.widths = dict((field, 1) for field in fields)
+        self.scratch_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(file_name)))
+        self.scratch = {}
+        for field in fields:
+            self.scratch[field] = open(os.path.join(self.scratch_dir, str(len(self.scratch))), 'w+b')
+
+
+    def write_batch(self, columns):
+        for field in self.fields:
+            column = columns[field]
+            if isinstance(column, list):
+                # Strings are stored as JSON string lines.
+                lines = [json.dumps(value) for value in column]
+                if len(lines) > 0:
+                    self.widths[field] = max(self.widths[field], max(len(value) for value in column))
+                self.scratch[field].write(("\n".join(lines) + "\n").encode('utf-8'))
+            else:
+                column.tofile(self.scratch[field])
+        self.rows += len(columns[self.fields[0]]) if len(self.fields) > 0 else 0
+
+
+    def _strings(self, field):
+        scratch = self.scratch[field]
+        scratch.seek(0)
+        batch = []
+        for line in io.TextIOWrapper(scratch, encoding='utf-8', newline="\n"):
+            batch.append(json.loads(line))
+            if len(batch) == batch_rows:
+                yield np.array(batch, dtype="<U" + str(self.widths[field]))
+                batch = []
+        yield np.array(batch, dtype="<U" + str(self.widths[field]))
+
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.file_name, 'w', zipfile.ZIP_STORED, allowZip64=True) as npz:
+                for field in self.fields:
+                    field_type = self.field_types.get(field, FIELD_STRING)
+                    if field_type == FIELD_FLOAT:
+                        dtype = np.dtype(np.float64)
+                    elif field_type == FIELD_BOOL:
+                        dtype = np.dtype(np.bool_)
+                    else:
+                        dtype = np.dtype("<U" + str(self.widths[field]))
+                    header = {'descr': np.lib.format.dtype_to_descr(dtype),
+                              'fortran_order': False, 'shape': (self.rows,)}
+
+                    with npz.open(field + ".npy", 'w', force_zip64=True) as array_file:
+                        np.lib.format.write_array_header_2_0(array_file, header)
+                        if field_type in (FIELD_FLOAT, FIELD_BOOL):
+                            self.scratch[field].seek(0)
+                            shutil.copyfileobj(self.scratch[field], array_file)
+                        else:
+                            for column in self._strings(field):
+                                array_file.write(column.tobytes())
+        finally:
+            for scratch in self.scratch.values():
+                scratch.close()
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+# Writes the columns of a report to a Parquet file, a row group per batch.
+class ParquetReportWriter:
+    def __init__(self, file_name, fields, field_types):
+        types = {FIELD_STRING: pyarrow.string(), FIELD_FLOAT: pyarrow.float64(),
+                 FIELD_BOOL: pyarrow.bool_()}
+        self.fields = fields
+        self.schema = pyarrow.schema([(field, types[field_types.get(field, FIELD_STRING)])
+                                      for field in fields])
+        self.writer = pyarrow.parquet.ParquetWriter(file_name, self.schema)
+
+
+    def write_batch(self, columns):
+        arrays = [pyarrow.array(columns[field], type=self.schema.field(field).type,
+                                from_pandas=True)
+                  for field in self.fields]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+
+    def close(self):
+        self.writer.close()
+
+
+# Convert a CSV report to a columnar file, a batch of rows at a time.  The
+# CSV columns are the fields in order; the CSV header row is skipped.
+def convert_report(csv_file_name, columnar_file_name, fields, field_types):
+    if columnar_file_name.endswith(".parquet"):
+        writer = ParquetReportWriter(columnar_file_name, fields, field_types)
+    else:
+        writer = NpzReportWriter(columnar_file_name, fields, field_types)
+
+    rows = 0
+    try:
+        with open(csv_file_name, 'r', newline='') as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader, None)
+            batch = []
+            for row in reader:
+                batch.append(row)
+                if len(batch) == batch_rows:
+                    writer.write_batch(convert_rows(batch, fields, field_types))
+                    rows += len(batch)
+                    batch = []
+            if len(batch) > 0 or rows == 0:
+                writer.write_batch(convert_rows(batch, fields, field_types))
+                rows += len(batch)
+    finally:
+        writer.close()
+
+    return rows
+
+
+# Download a VM report from a TGC into report_file_name.  since and until
+# are API times of the report window, "" for unbounded.  Raises
+# TintriRequestsException or TintriApiException.
+def get_report(server_name, user_name, password, attributes, report_file_name,
+               since="", until=""):
+    # Login into the TGC.
+    r = tintri.api_get(server_name, '/info')
+    json_info = r.json()
+    product_name = json_info['productName']
+
+    # Check for correct product
+    if product_name != "Tintri Global Center":
+        raise tintri.TintriRequestsException(server_name + " is not a Tintri Global Center server.")
+
+    session_id = tintri.api_login(server_name, user_name, password)
+
+    try:
+        url = "/v310/vm/vmListDownloadable"
+
+        # Create the report filter.
+        report_filter = {"typeId" : BEANS_VM + "VirtualMachineDownloadableReportFilter",
+                         "attachment" : os.path.basename(report_file_name),
+                         "attributes" : attributes,
+                         "since"  :     since,
+                         "until"  :     until,
+                         "format" :     "CSV"
+                        }
+
+        # Invoke API to get a useable report URL.
+        r = tintri.api_post(server_name, url, report_filter, session_id)
+        if r.status_code != 200:
+            message = "The HTTP response for report call to the server is not 200."
+            raise tintri.TintriApiException(message, r.status_code, url, report_filter, r.text)
+
+        report_url = r.text
+
+        # Print the URL.
+        print(server_name + " URL: {" + report_url + "} is good for 30 days")
+
+        # Get the report.
+        tintri.download_file(server_name, report_url, session_id, report_file_name)
+    finally:
+        tintri.api_logout(server_name, session_id)
+
+
+# Download the reports of several TGCs in parallel.  windows is a
+# dictionary of server name to its (since, until) report window.  Returns
+# a list of (server name, report file name) of the reports downloaded.
+def get_reports(server_names, user_name, password, attributes, csv_file_name, windows):
+    reports = []
+
+    executor = ThreadPoolExecutor(max_workers=len(server_names))
+    try:
+        futures = {}
+        for server_name in server_names:
+            report_file_name = csv_file_name + "." + server_name.replace(":", "_") + ".csv"
+            (since, until) = windows[server_name]
+            future = executor.submit(get_report, server_name, user_name, password,
+                                     attributes, report_file_name, since, until)
+            futures[future] = (server_name, report_file_name)
+
+        for future in as_completed(futures):
+            (server_name, report_file_name) = futures[future]
+            try:
+                future.result()
+            except (tintri.TintriRequestsException, tintri.TintriApiException) as tre:
+                print_error(server_name + ": " + tre.__str__())
+                continue
+            print_info(server_name + " report downloaded")
+            reports.append((server_name, report_file_name))
+    finally:
+        executor.shutdown()
+
+    # Merge in the order the TGCs were given.
+    return sorted(reports, key=lambda report: server_names.index(report[0]))
+
+
+# Merge the reports of several TGCs into one CSV with a SourceTGC column.
+# A VM reported by more than one TGC is kept once, from the first TGC.  VMs
+# are matched by Uuid when it is a report field, otherwise by the whole
+# row.  The reports are read a row at a time.  Returns the number of rows.
+def merge_reports(reports, attributes, csv_file_name):
+    key_index = attributes.index("Uuid") if "Uuid" in attributes else None
+    seen = set()
+    rows = 0
+
+    with open(csv_file_name, 'w', newline='') as merged_file:
+        writer = csv.writer(merged_file)
+        header_written = False
+        for (server_name, report_file_name) in reports:
+            with open(report_file_name, 'r', newline='') as report_file:
+                reader = csv.reader(report_file)
+                header = next(reader, None)
+                if not header_written and header is not None:
+                    writer.writerow([SOURCE_TGC_FIELD] + header)
+                    header_written = True
+                for row in reader:
+                    key = tuple(row) if key_index is None or key_index >= len(row) \
+                        else row[key_index]
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    writer.writerow([server_name] + row)
+                    rows += 1
+            os.remove(report_file_name)
+
+    return rows
+
+
+# Return the dataset key of a field set, a short hash of the fields.
+def get_field_set_id(attributes):
+    return hashlib.sha1(",".join(attributes).encode('utf-8')).hexdigest()[:12]
+
+
+def read_dataset_state(dataset_dir):
+    try:
+        with open(os.path.join(dataset_dir, DATASET_STATE), 'r') as state_file:
+            return json.load(state_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def write_dataset_state(dataset_dir, state):
+    state_name = os.path.join(dataset_dir, DATASET_STATE)
+    with open(state_name + ".tmp", 'w') as state_file:
+        json.dump(state, state_file, indent=2, sort_keys=True)
+    os.replace(state_name + ".tmp", state_name)
+
+
+# Return the until of the last window collected from a TGC for a field
+# set, or None.
+def get_last_until(state, field_set_id, server_name):
+    return state.get(field_set_id, {}).get('tgcs', {}).get(server_name)
+
+
+# Copy a TGC's window report into the dataset and record its until.
+def save_window(dataset_dir, state, attributes, server_name, since, until, report_file_name):
+    field_set_id = get_field_set_id(attributes)
+    compact_until = until.replace("-", "").replace(":", "").split(".")[0]
+    compact_since = since.replace("-", "").replace(":", "").split(".")[0] or "start"
+    window_dir = os.path.join(dataset_dir, field_set_id, server_name.replace(":", "_"),
+                              until[:10])
+    if not os.path.isdir(window_dir):
+        os.makedirs(window_dir)
+    window_name = os.path.join(window_dir, compact_since + "_" + compact_until + ".csv")
+    shutil.copyfile(report_file_name, window_name)
+
+    field_set = state.setdefault(field_set_id, {'fields': attributes, 'tgcs': {}})
+    field_set['tgcs'][server_name] = until
+    print_info(server_name + " window " + (since or "start") + " to " + until +
+               " saved in " + window_name)
+
+
+# Parse a --since or --until time, a UTC date or an API time, to an API
+# time.
+def parse_time_arg(value):
+    if len(value) == 10:
+        value += "T00:00:00Z"
+    return tintri.format_api_time(tintri.parse_api_time(value))
+
+
 # main
-if len(sys.argv) < 4:
-    print("\nDownloads a CSV VM report. \n")
-    print("Usage: " + sys.argv[0] + " server_name field_file_name csv_file_name\n")
-    print("Where:")
-    print("   server_name:     TGC server name or IP address")
-    print("   field_file_name: input file name that contains the fields to report")
-    print("   csv_file_name:   output report CSV file name")
-    print ""
-    sys.exit(1)
+parser = argparse.ArgumentParser(description="Downloads a CSV VM report.")
+
+parser.add_argument("server_name",
+                    help="TGC server name or IP address, or a comma separated list of TGCs " +
+                         "whose reports are merged")
+parser.add_argument("field_file_name", help="input file name that contains the fields to report")
+parser.add_argument("csv_file_name", help="output report CSV file name")
+parser.add_argument("columnar_file_name", nargs='?',
+                    help="optional output .npz or .parquet file name")
+parser.add_argument("--user", default=os.environ.get("TINTRI_USER"),
+                    help="user name, the same on every TGC. Default: $TINTRI_USER or prompt")
+parser.add_argument("--password", default=os.environ.get("TINTRI_PASSWORD"),
+                    help="password. Default: $TINTRI_PASSWORD or prompt")
+parser.add_argument("--since", help="start of the report window, e.g. 2026-10-01 or " +
+                                    "2026-10-01T08:00:00Z. With --dataset, the start of " +
+                                    "the first window only")
+parser.add_argument("--until", help="end of the report window. Default: now with --dataset")
+parser.add_argument("--dataset",
+                    help="report only the window since the last run, per TGC and field " +
+                         "set, and save the window reports in this directory")
+
+args = parser.parse_args()
 
-server_name = sys.argv[1]
-field_file_name = sys.argv[2]
-csv_file_name = sys.argv[3]
+try:
+    since = "" if args.since is None else parse_time_arg(args.since)
+    until = "" if args.until is None else parse_time_arg(args.until)
+except ValueError as ve:
+    parser.error(ve.__str__())
+
+server_names = [name.strip() for name in args.server_name.split(",") if name.strip()]
+field_file_name = args.field_file_name
+csv_file_name = args.csv_file_name
+columnar_file_name = args.columnar_file_name
+
+if columnar_file_name is not None:
+    if columnar_file_name.endswith(".parquet"):
+        if pyarrow is None:
+            print_error("Converting to Parquet needs pyarrow")
+            sys.exit(1)
+    elif not columnar_file_name.endswith(".npz"):
+        print_error("The columnar file name must end in .npz or .parquet")
+        sys.exit(1)
+    if np is None:
+        print_error("Converting the report needs NumPy")
+        sys.exit(1)
 
 # Get the field attributes to report
 attributes = get_fields(field_file_name)
@@ -108,74 +521,71 @@ if len(attributes) == 0:
 
 print("Fields to report:\n" + str(attributes))
 
-# Credentials Gathering - support Python 2.X and 3.X
-try: 
-	user_name = raw_input("Enter user name: ")
-except NameError:
-	user_name = input("Enter user name: ")
-password = getpass.getpass("Enter password: ")
-print("")
-
-session_id = None
+# Credentials Gathering, unless given.
+user_name = args.user
+if user_name is None:
+    user_name = input("Enter user name: ")
+password = args.password
+if password is None:
+    password = getpass.getpass("Enter password: ")
+    print("")
+
+# The report window of each TGC.  With a dataset, a TGC's window starts
+# at the until of its last window.
+state = None
+windows = dict((server_name, (since, until)) for server_name in server_names)
+if args.dataset is not None:
+    if until == "":
+        until = tintri.format_api_time(time.time())
+    state = read_dataset_state(args.dataset)
+    field_set_id = get_field_set_id(attributes)
+    for server_name in server_names:
+        last_until = get_last_until(state, field_set_id, server_name)
+        windows[server_name] = (since if last_until is None else last_until, until)
 
-# Try to login into the TGC.
 try:
-    r = tintri.api_get(server_name, '/info')
-    json_info = r.json()
-    product_name = json_info['productName']
-
-    # Check for correct product
-    if product_name  != "Tintri Global Center":
-        raise tintri.TintriRequestException(server_name + "is not a Tintri Global Center server.")
+    if len(server_names) == 1:
+        server_name = server_names[0]
+        get_report(server_name, user_name, password, attributes, csv_file_name,
+                   *windows[server_name])
+        if state is not None:
+            save_window(args.dataset, state, attributes, server_name,
+                        windows[server_name][0], windows[server_name][1], csv_file_name)
+            write_dataset_state(args.dataset, state)
+        report_fields = attributes
+    else:
+        reports = get_reports(server_names, user_name, password, attributes, csv_file_name,
+                              windows)
+        if len(reports) == 0:
+            print_error("No reports downloaded")
+            sys.exit(5)
+        if state is not None:
+            for (server_name, report_file_name) in reports:
+                save_window(args.dataset, state, attributes, server_name,
+                            windows[server_name][0], windows[server_name][1],
+                            report_file_name)
+            write_dataset_state(args.dataset, state)
+        rows = merge_reports(reports, attributes, csv_file_name)
+        print_info(str(rows) + " VMs from " + str(len(reports)) + " TGCs merged")
+        report_fields = [SOURCE_TGC_FIELD] + attributes
 
-    session_id = tintri.api_login(server_name, user_name, password)
-except tintri.TintriRequestsException as tre:
-    print_error(tre.__str__())
-    sys.exit(1)
-except tintri.TintriApiException as tae:
-    print_error(tae.__str__())
-    sys.exit(2)
-    
-try:
-    url = "/v310/vm/vmListDownloadable"
-
-    # Create the report filter.
-    report_filter = {"typeId" : BEANS_VM + "VirtualMachineDownloadableReportFilter",
-                     "attachment" : csv_file_name,
-                     "attributes" : attributes,
-                     "since"  :     "",
-                     "until"  :     "",
-                     "format" :     "CSV"
-                    }
-
-    # Invoke API to get a useable report URL.
-    r = tintri.api_post(server_name, url, report_filter, session_id)
-    if r.status_code != 200:
-        message = "The HTTP response for report call to the server is not 200."
-        raise tintri.TintriApiException(message, r.status_code, url, report_filter, r.text)
-    
-    report_url = r.text
-
-    # Print the URL.
-    print("URL: {" + report_url + "} is good for 30 days")
-    
-    # Get the report.
-    tintri.download_file(server_name, report_url, session_id, csv_file_name)
-    
     print(csv_file_name + " is ready")
 
+    if columnar_file_name is not None:
+        field_types = get_field_types(field_file_name)
+        field_types[SOURCE_TGC_FIELD] = FIELD_STRING
+        rows = convert_report(csv_file_name, columnar_file_name, report_fields, field_types)
+        print(columnar_file_name + " is ready with " + str(rows) + " rows")
 
-    tintri.api_logout(server_name, session_id)
+    if len(server_names) > 1 and len(reports) < len(server_names):
+        sys.exit(5)
 
 except tintri.TintriRequestsException as tre:
     print_error(tre.__str__())
-    tintri.api_logout(server_name, session_id)
     sys.exit(5)
 except tintri.TintriApiException as tae:
     print_error(tae.__str__())
-    tintri.api_logout(server_name, session_id)
     sys.exit(6)
 except Exception as e:
     print_error(e.__str__())
-    tintri.api_logout(server_name, session_id)
     sys.exit(6)
@@ -27,10 +27,21 @@ import json
 import sys
 import tintri_1_1 as tintri
 
+# The asyncio helpers need Python 3 and aiohttp.  Without them, the
+# VMstores are processed one at a time.
+try:
+    import asyncio
+    import tintri_async
+except ImportError:
+    tintri_async = None
+
 """
  This scripts sets the primary DNS for a list of VMstores in a file.
 
- Command usage: set_dns_primary <file_name> <userName> <password> <new_dns_primary>
+ When aiohttp is available, the VMstores are processed concurrently, at
+ most 'concurrency' at a time.
+
+ Command usage: set_dns_primary <file_name> <userName> <password> <new_dns_primary> [concurrency]
 
 """
 
@@ -82,6 +93,31 @@ def get_dns_info(server_name, session_id):
     return appliance_dns
 
 
+# Create the Request object that sets the primary DNS.
+def new_dns_request(new_dns_primary, new_dns_secondary):
+    # Create the ApplianceDns DTO.
+    new_dns_info = \
+        {'typeId': 'com.tintri.api.rest.v310.dto.domain.beans.hardware.ApplianceDns',
+         'dnsPrimary': new_dns_primary,
+         'dnsSecondary': new_dns_secondary
+        }
+    
+    # Create the Appliance object wit the new ApplianceDns DTO.
+    new_appliance = \
+        {'typeId': 'com.tintri.api.rest.v310.dto.domain.Appliance',
+         'dnsConfig': new_dns_info
+        }
+                 
+    # Create the Request object with the Appliance DTO.
+    Request = \
+        {'typeId': 'com.tintri.api.rest.v310.dto.Request',
+         'objectsWithNewValues': new_appliance,
+         'propertiesToBeUpdated': ['dnsConfig']
+        }
+
+    return Request
+
+
 # Process each VMstore:
 # 1. login
 # 2. get the current DNS info
@@ -107,27 +143,7 @@ def process_vmstore(vmstore_name, user_name, password, new_dns_primary):
     dns_info = get_dns_info(server_name, session_id)
     print_dns_info(dns_info, server_name + " current: ")
     
-    new_dns_secondary = dns_info['dnsSecondary']
-    
-    # Create the ApplianceDns DTO.
-    new_dns_info = \
-        {'typeId': 'com.tintri.api.rest.v310.dto.domain.beans.hardware.ApplianceDns',
-         'dnsPrimary': new_dns_primary,
-         'dnsSecondary': new_dns_secondary
-        }
-    
-    # Create the Appliance object wit the new ApplianceDns DTO.
-    new_appliance = \
-        {'typeId': 'com.tintri.api.rest.v310.dto.domain.Appliance',
-         'dnsConfig': new_dns_info
-        }
-                 
-    # Create the Request object with the Appliance DTO.
-    Request = \
-        {'typeId': 'com.tintri.api.rest.v310.dto.Request',
-         'objectsWithNewValues': new_appliance,
-         'propertiesToBeUpdated': ['dnsConfig']
-        }
+    Request = new_dns_request(new_dns_primary, dns_info['dnsSecondary'])
         
     url = APPLIANCE_URL
     r = tintri.api_put(server_name, url, Request, session_id)
@@ -147,16 +163,77 @@ def process_vmstore(vmstore_name, user_name, password, new_dns_primary):
     tintri.api_logout(server_name, session_id)
 
 
+# Asyncio version of get_dns_info().
+async def async_get_dns_info(pool, server_name, session_id):
+    url = APPLIANCE_URL + "/dns"
+    r = await pool.api_get(server_name, url, session_id)
+    if debug_mode:
+        print_debug("The JSON response of the get invoke to the server " +
+                    server_name + " is: " + r.text)
+    return r.json()
+
+
+# Asyncio version of process_vmstore().  Always logs out once logged in.
+# A failed logout is only a debug message, so it does not hide the error
+# of the VMstore.
+async def async_process_vmstore(pool, vmstore_name, user_name, password, new_dns_primary):
+
+    server_name = vmstore_name
+
+    # Get the server type
+    r = await pool.api_version(server_name)
+    json_info = r.json()
+    if json_info['productName'] != "Tintri VMstore":
+        raise tintri.TintriRequestsException("Server needs to be a VMstore")
+
+    session_id = await pool.api_login(server_name, user_name, password)
+    try:
+        dns_info = await async_get_dns_info(pool, server_name, session_id)
+        print_dns_info(dns_info, server_name + " current: ")
+
+        Request = new_dns_request(new_dns_primary, dns_info['dnsSecondary'])
+
+        url = APPLIANCE_URL
+        r = await pool.api_put(server_name, url, Request, session_id)
+
+        # if HTTP Response is not 204 then raise exception
+        if r.status_code != 204:
+            message = "The HTTP response for put call to the server is not 204."
+            raise tintri.TintriApiException(message, r.status_code, url, str(Request), r.text)
+
+        dns_info = await async_get_dns_info(pool, server_name, session_id)
+        print_dns_info(dns_info, server_name + " now: ")
+    finally:
+        try:
+            await pool.api_logout(server_name, session_id)
+        except (tintri.TintriRequestsException, tintri.TintriApiException) as logout_err:
+            print_debug(server_name + " logout failed: " + logout_err.__str__())
+
+
+# Process all the VMstores concurrently.  Returns a list with an
+# exception or None for each VMstore.
+async def async_process_vmstores(vmstores, user_name, password, new_dns_primary, concurrency):
+    async with tintri_async.TintriAsyncPool(concurrency) as pool:
+        async def process(vmstore):
+            await async_process_vmstore(pool, vmstore, user_name, password, new_dns_primary)
+
+        return await tintri_async.run_all(process, vmstores, concurrency)
+
+
 # main
 if len(sys.argv) < 5:
-    print("\nSets allow complete snapshot flag\n")
-    print("Usage: " + sys.argv[0] + " file_name user_name password dns_primary\n")
+    print("\nSets the primary DNS for a list of VMstores in a file\n")
+    print("Usage: " + sys.argv[0] + " file_name user_name password dns_primary [concurrency]\n")
     sys.exit(-1)
 
 file_name = sys.argv[1]
 user_name = sys.argv[2]
 password = sys.argv[3]
 new_dns_primary = sys.argv[4]
+if (len(sys.argv) == 6):
+    concurrency = int(sys.argv[5])
+else:
+    concurrency = 100
 
 print_info("file: " + file_name + "  DNS: " + new_dns_primary)
 
@@ -171,20 +248,40 @@ error_file = open (error_file_name, "w")
 
 count = 0
 err_count = 0
-for vmstore in vmstores:
-    vmstore = vmstore[:-1]  # strip off linefeed
-
-    try:
-        status = process_vmstore(vmstore, user_name, password, new_dns_primary)
-    except tintri.TintriRequestsException as tre:
-        err_msg = "[ERROR] " + vmstore + ": " + tre.__str__() + "\n"
-        error_file.write(err_msg)
-        err_count += 1
-    except tintri.TintriApiException as tae:
-        err_msg = "[ERROR] " + vmstore + ": " + tae.__str__() + "\n"
-        error_file.write(err_msg)
-        err_count += 1
-    count += 1
+vmstores = [vmstore.rstrip('\r\n') for vmstore in vmstores]  # strip off linefeed
+vmstores = [vmstore for vmstore in vmstores if vmstore != ""]
+
+if tintri_async is not None:
+    # Process the VMstores concurrently.
+    results = asyncio.run(
+        async_process_vmstores(vmstores, user_name, password, new_dns_primary, concurrency))
+
+    # Unexpected exceptions are recorded with their type, so every
+    # VMstore's result reaches the error file.
+    for vmstore, result in zip(vmstores, results):
+        if isinstance(result, (tintri.TintriRequestsException, tintri.TintriApiException)):
+            err_msg = "[ERROR] " + vmstore + ": " + result.__str__() + "\n"
+            error_file.write(err_msg)
+            err_count += 1
+        elif isinstance(result, BaseException):
+            err_msg = "[ERROR] " + vmstore + ": " + type(result).__name__ + ": " + \
+                      result.__str__() + "\n"
+            error_file.write(err_msg)
+            err_count += 1
+        count += 1
+else:
+    for vmstore in vmstores:
+        try:
+            status = process_vmstore(vmstore, user_name, password, new_dns_primary)
+        except tintri.TintriRequestsException as tre:
+            err_msg = "[ERROR] " + vmstore + ": " + tre.__str__() + "\n"
+            error_file.write(err_msg)
+            err_count += 1
+        except tintri.TintriApiException as tae:
+            err_msg = "[ERROR] " + vmstore + ": " + tae.__str__() + "\n"
+            error_file.write(err_msg)
+            err_count += 1
+        count += 1
 
 in_file.close()
 error_file.close()
@@ -25,42 +25,49 @@
 
 import json
 import sys
+import collections
 import tintri_1_1 as tintri
+from tintri_records import VmInfo
+from concurrent.futures import ThreadPoolExecutor
+
+# The asyncio helpers need Python 3 and aiohttp.  Without them, the
+# VMstores are processed on a thread pool.
+try:
+    import asyncio
+    import tintri_async
+except ImportError:
+    tintri_async = None
 
 """
  This Python script sets the QoS of the VMs in the first TGC service group with
  more than 2 VMs.  The script first invokes the service group API on the TGC,
- then for each VM, the script invokes config QoS for each VMstore.
+ then groups the VMs by VMstore and invokes config QoS once per VMstore,
+ on the VMstores concurrently.  When aiohttp is available, the VMstores
+ are processed with asyncio, at most 'concurrency' at a time; otherwise
+ on at most 16 threads.
 
  This script assumes Tintri Global Center and VMstores have same user names
  and passwords.
      
  Command usage:
- set_qos_service_group.py server_name user_name password min_value max_value
+ set_qos_service_group.py server_name user_name password min_value max_value [concurrency]
  Where:"
      server_name - name of a TGC server
      user_name   - user name used to login into the TGC server
      password    - password for the user
      min_value   - the QoS minimum value for the VM
      max_value   - the QoS maximum value for the VM
+     concurrency - the maximum number of VMstores processed at once
 
 """
 
-# Holds the VM information.
-class VmInfo:
-    def __init__(self, name, uuid, vmstore):
-        self.name = name
-        self.uuid = uuid
-        self.vmstore = vmstore
-
-    def __str__(self):
-        return ("VM name: " + self.name + " UUID: " + self.uuid +
-               " (" + self.vmstore + ")")
-
-
 # For exhaustive messages on console, make it to True; otherwise keep it False
 debug_mode = False
 
+# Maximum number of VMstores processed concurrently on threads, without
+# aiohttp.
+max_vmstore_workers = 16
+
 
 def print_with_prefix(prefix, out):
     print(prefix + out)
@@ -84,7 +91,9 @@ def print_error(out):
 
 
 # Return a list of VmInfo obects that are in the specified service group.
-def get_sg_members(server_name, session_id, sg_uuid):
+# include_fields are the VM fields requested from the server.
+def get_sg_members(server_name, session_id, sg_uuid,
+                   include_fields=tintri.VM_VMSTORE_FIELDS):
     sg_members = []
 
     # Create filter to obtain live VMs and VMs that belong in specified
@@ -94,68 +103,54 @@ def get_sg_members(server_name, session_id, sg_uuid):
 
     url = "/v310/vm"
 
-    r = tintri.api_get_query(server_name, url, sg_filter, session_id)
-    print_debug("The JSON response of the get invoke to the server " +
-                server_name + " is: " + r.text)
-    
-    # if HTTP Response is not 200 then raise an error
-    if r.status_code != 200:
-        print_error("The HTTP response for the get invoke to the server " +
-              server_name + " is not 200, but is: " + str(r.status_code))
-        print_error("url = " + url)
-        print_error("response: " + r.text)
+    try:
+        members = tintri.iter_collection(server_name, url, sg_filter, session_id,
+                                         include_fields=include_fields)
+
+        # For each live VM, create a VM info object
+        for vm in members:
+            if not vm["isLive"]:
+                continue
+            member_vm = vm["vmware"]["name"]
+            member_vmstore = vm["vmstoreName"]
+            member_vm_uuid = vm["uuid"]["uuid"]
+            print_debug("   " + member_vm + " (" + member_vmstore + ")")
+
+            vm_info = VmInfo(member_vm, member_vm_uuid, member_vmstore)
+            sg_members.append(vm_info)
+
+    except tintri.TintriApiException as tae:
+        print_error(tae.__str__())
         tintri.api_logout(server_name, session_id)
         sys.exit(-10)
-    
-    member_paginated_result = r.json()
-    num_members = int(member_paginated_result["filteredTotal"])
-    if num_members == 0:
+
+    if len(sg_members) == 0:
         print_debug("No Service Groups members present")
         return sg_members
     
-    print_debug(str(num_members) + " Service Group Members present")
-    
-    # For each live VM, create a VM info object
-    items = member_paginated_result["items"]
-    for vm in items:
-        if not vm["isLive"]:
-            continue
-        member_vm = vm["vmware"]["name"]
-        member_vmstore = vm["vmstoreName"]
-        member_vm_uuid = vm["uuid"]["uuid"]
-        print_debug("   " + member_vm + " (" + member_vmstore + ")")
-
-        vm_info = VmInfo(member_vm, member_vm_uuid, member_vmstore)
-        sg_members.append(vm_info)
-
+    print_debug(str(len(sg_members)) + " Service Group Members present")
     return sg_members
 
 
-# Sets the min/max QoS values from a list of VM UUIDs.
-# Returns "OK" or "Error".
-def set_qos(server_name, user_name, password, vm_uuids, new_min_value, new_max_value):
-
-    # Get the preferred version
-    r = tintri.api_version(server_name)
-    json_info = r.json()
+# Verify the correct major and minor versions of a VMstore from its
+# version information.  Returns True if the version is supported.
+def check_version(json_info):
     preferred_version = json_info['preferredVersion']
-    
-    # Verify the correct major and minor versions.
     versions = preferred_version.split(".")
     major_version = versions[0]
     minor_version = int(versions[1])
     if major_version != "v310":
         print_error("Incorrect major version: " + major_version + ".  Should be v310.")
-        return "Error"
+        return False
     if minor_version < 21:
         print_error("Incorrect minor Version: " + str(minor_version) + ".  Should be 21 or greater")
-        return "Error"
+        return False
+    return True
 
-    # Login into the appropriate VMstore
-    session_id = tintri.api_login(server_name, user_name, password)
-    if session_id is None:
-        return "Error"
-    print_info("Logged onto " + server_name)
+
+# Return the MultipleSelectionRequest that sets the min/max QoS values of
+# a list of VM UUIDs.
+def new_qos_request(vm_uuids, new_min_value, new_max_value):
 
     # Create new QoS object with the fields to be changed
     modify_qos_info = {'minNormalizedIops': int(new_min_value),
@@ -169,7 +164,34 @@ def set_qos(server_name, user_name, password, vm_uuids, new_min_value, new_max_v
                   'newValue': modify_qos_info,
                   'propertyNames': ["minNormalizedIops", "maxNormalizedIops"]
                  }
-    
+    return MS_Request
+
+
+# Print the error of a failed QoS put.
+def print_put_error(server_name, url, MS_Request, r):
+    print_error("The HTTP response for the put invoke to the server " +
+          server_name + " is not 204, but is: " + str(r.status_code))
+    print_error("url = " + url)
+    print_error("payload = " + str(MS_Request))
+    print_error("response: " + r.text)
+
+
+# Sets the min/max QoS values from a list of VM UUIDs.
+# Returns "OK" or "Error".
+def set_qos(server_name, user_name, password, vm_uuids, new_min_value, new_max_value):
+
+    # Get the preferred version
+    r = tintri.api_version(server_name)
+    if not check_version(r.json()):
+        return "Error"
+
+    # Login into the appropriate VMstore
+    session_id = tintri.api_login(server_name, user_name, password)
+    if session_id is None:
+        return "Error"
+    print_info("Logged onto " + server_name)
+
+    MS_Request = new_qos_request(vm_uuids, new_min_value, new_max_value)
     print_debug("Changing min and max QOS values to (" + str(new_min_value) + ", " + str(new_max_value) + ")")
     
     # Update the min and max QoS IOPs
@@ -180,11 +202,7 @@ def set_qos(server_name, user_name, password, vm_uuids, new_min_value, new_max_v
     
     # if HTTP Response is not 204 then raise an exception
     if r.status_code != 204:
-        print_error("The HTTP response for the put invoke to the server " +
-              server_name + " is not 204, but is: " + str(r.status_code))
-        print_error("url = " + modify_qos_url)
-        print_error("payload = " + str(MS_Request))
-        print_error("response: " + r.text)
+        print_put_error(server_name, modify_qos_url, MS_Request, r)
         tintri.api_logout(server_name, session_id)
         print_info("Error log off " + server_name)
         return "Error"
@@ -194,16 +212,116 @@ def set_qos(server_name, user_name, password, vm_uuids, new_min_value, new_max_v
     return "OK"
 
 
+# Sets the QoS values of VMs on one VMstore.  Returns "OK" or "Error".
+def set_vmstore_qos(vmstore, user_name, password, vm_uuids, new_min_value, new_max_value):
+    try:
+        return set_qos(vmstore, user_name, password, vm_uuids, new_min_value, new_max_value)
+    except tintri.TintriRequestsException as tre:
+        print_error(vmstore + ": " + tre.__str__())
+    except tintri.TintriApiException as tae:
+        print_error(vmstore + ": " + tae.__str__())
+    return "Error"
+
+
+# Sets the QoS values of VMs on the VMstores on a thread pool.  Returns
+# the status of each VMstore.
+def set_qos_vmstores(vmstores, vmstore_vms, user_name, password,
+                     new_min_value, new_max_value, concurrency):
+    executor = ThreadPoolExecutor(max_workers=min(len(vmstores), concurrency,
+                                                  max_vmstore_workers))
+    statuses = list(executor.map(
+        lambda vmstore: set_vmstore_qos(vmstore, user_name, password, vmstore_vms[vmstore],
+                                        new_min_value, new_max_value),
+        vmstores))
+    executor.shutdown()
+    return statuses
+
+
+# Asyncio version of set_qos().  Always logs out once logged in.  A
+# failed logout is only a debug message, so it does not hide the error
+# of the VMstore.
+async def async_set_qos(pool, server_name, user_name, password, vm_uuids,
+                        new_min_value, new_max_value):
+
+    # Get the preferred version
+    r = await pool.api_version(server_name)
+    if not check_version(r.json()):
+        return "Error"
+
+    # Login into the appropriate VMstore
+    session_id = await pool.api_login(server_name, user_name, password)
+    print_info("Logged onto " + server_name)
+    status = "Error"
+    try:
+        MS_Request = new_qos_request(vm_uuids, new_min_value, new_max_value)
+        print_debug("Changing min and max QOS values to (" + str(new_min_value) + ", " +
+                    str(new_max_value) + ")")
+
+        # Update the min and max QoS IOPs
+        modify_qos_url = "/v310/vm/qosConfig"
+        r = await pool.api_put(server_name, modify_qos_url, MS_Request, session_id)
+        print_debug("The JSON response of the get invoke to the server " +
+                    server_name + " is: " + r.text)
+
+        if r.status_code != 204:
+            print_put_error(server_name, modify_qos_url, MS_Request, r)
+        else:
+            status = "OK"
+    finally:
+        try:
+            await pool.api_logout(server_name, session_id)
+            print_info(("Sucesss" if status == "OK" else "Error") + " log off " + server_name)
+        except (tintri.TintriRequestsException, tintri.TintriApiException) as logout_err:
+            print_debug(server_name + " logout failed: " + logout_err.__str__())
+    return status
+
+
+# Asyncio version of set_vmstore_qos().
+async def async_set_vmstore_qos(pool, vmstore, user_name, password, vm_uuids,
+                                new_min_value, new_max_value):
+    try:
+        return await async_set_qos(pool, vmstore, user_name, password, vm_uuids,
+                                   new_min_value, new_max_value)
+    except tintri.TintriRequestsException as tre:
+        print_error(vmstore + ": " + tre.__str__())
+    except tintri.TintriApiException as tae:
+        print_error(vmstore + ": " + tae.__str__())
+    return "Error"
+
+
+# Sets the QoS values of VMs on the VMstores with asyncio, at most
+# concurrency VMstores at a time.  Returns the status of each VMstore;
+# an unexpected exception is printed and counts as "Error".
+async def async_set_qos_vmstores(vmstores, vmstore_vms, user_name, password,
+                                 new_min_value, new_max_value, concurrency):
+    async with tintri_async.TintriAsyncPool(concurrency) as pool:
+        async def process(vmstore):
+            return await async_set_vmstore_qos(pool, vmstore, user_name, password,
+                                               vmstore_vms[vmstore], new_min_value,
+                                               new_max_value)
+
+        results = await tintri_async.run_all(process, vmstores, concurrency)
+
+    statuses = []
+    for vmstore, result in zip(vmstores, results):
+        if isinstance(result, BaseException):
+            print_error(vmstore + ": " + type(result).__name__ + ": " + result.__str__())
+            result = "Error"
+        statuses.append(result)
+    return statuses
+
+
 # main
 if len(sys.argv) < 6:
     print("\nsets the QoS of the VMs in a TGC service group with more than 2 VMs.\n")
-    print("Usage: " + sys.argv[0] + " server_name user_name password min_value max_value\n")
+    print("Usage: " + sys.argv[0] + " server_name user_name password min_value max_value [concurrency]\n")
     print("Where:")
     print("    server_name - name of a TGC server")
     print("    user_name   - user name used to login into the TGC and VMstore servers")
     print("    password    - password for the TGC and VMstore users")
     print("    min_value   - the QoS minimum value for the VM")
     print("    max_value   - the QoS maximum value for the VM")
+    print("    concurrency - the maximum number of VMstores processed at once, default 100")
     sys.exit(-1)
 
 server_name = sys.argv[1]
@@ -211,6 +329,13 @@ user_name = sys.argv[2]
 password = sys.argv[3]
 new_min_value = sys.argv[4]
 new_max_value = sys.argv[5]
+if (len(sys.argv) == 7):
+    concurrency = int(sys.argv[6])
+else:
+    concurrency = 100
+if concurrency < 1:
+    print_error("concurrency must be at least 1, not " + str(concurrency))
+    sys.exit(-1)
 
 # Could make this an input parameter
 # Get the preferred version
@@ -290,18 +415,36 @@ if not found:
 # Get the VMs in the service group
 sg_members = get_sg_members(server_name, session_id, sg_uuid)
 
-# Set the QoS for each VM member in the service group
+# Group the VM members in the service group by VMstore
+vmstore_vms = collections.OrderedDict()
 count = 1
 for vm_member in sg_members:
-    vms = []
     print(str(count) + ": " + vm_member.name + " on " + vm_member.vmstore)
-    vms.append(vm_member.uuid)
-    status = set_qos(vm_member.vmstore, user_name, password,
-                     vms, new_min_value, new_max_value)
-    if status != "OK":
-        break
+    vmstore_vms.setdefault(vm_member.vmstore, []).append(vm_member.uuid)
     count += 1
 
+# Set the QoS with one login and one call per VMstore.  The VMstores are
+# processed concurrently.
+vmstores = list(vmstore_vms.keys())
+if len(vmstores) > 0:
+    if tintri_async is not None:
+        statuses = asyncio.run(
+            async_set_qos_vmstores(vmstores, vmstore_vms, user_name, password,
+                                   new_min_value, new_max_value, concurrency))
+    else:
+        statuses = set_qos_vmstores(vmstores, vmstore_vms, user_name, password,
+                                    new_min_value, new_max_value, concurrency)
+
+    vm_count = 0
+    for vmstore, status in zip(vmstores, statuses):
+        if status == "OK":
+            vm_count += len(vmstore_vms[vmstore])
+        else:
+            print_error("QoS not set on the " + str(len(vmstore_vms[vmstore])) +
+                        " VMs on " + vmstore)
+    print_info("QoS set on " + str(vm_count) + " of " + str(len(sg_members)) +
+               " VMs on " + str(len(vmstores)) + " VMstores")
+
 # All pau, log out
 tintri.api_logout(server_name, session_id)
 
@@ -27,6 +27,8 @@ import sys
 import argparse
 import json
 import tintri_1_1 as tintri
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import tintri_vm_index
 
 """
  This Python script sets VM affinity for VM migration rules.
@@ -38,6 +40,18 @@ debug_mode = False
 beans = "com.tintri.api.rest.v310.dto.domain.beans."
 page_size = 100
 
+# Maximum number of concurrent VM affinity updates.  The tintri_1_1
+# governor lowers the concurrency and rate when the server is busy.
+default_workers = 16
+
+# Maximum affinity updates per second.
+default_max_rate = 25.0
+
+# Affinity PUTs are also retried on 500, on top of the statuses the
+# tintri_1_1 policy retries.
+affinity_retry_policy = tintri.TintriRetryPolicy(
+    statuses=(500,) + tintri.DEFAULT_RETRY_STATUSES)
+
 
 # Output functions
 def print_with_prefix(prefix, out):
@@ -87,37 +101,21 @@ def get_sg_by_name(server_name, session_id, service_group):
     return ""
     
 
-# Return a list of VM UUIDs from a list of VM names
+# Return a list of VM UUIDs from a list of VM names.  The names are
+# resolved with the local VM index.  Names shared by several VMs are
+# reported and skipped.
 def get_vms_in_list(server_name, session_id, vms):
     vm_uuids = []
-    vm_name_to_uuid = {}
 
-    # Get a list of VMs, but return a page size at a time
-    get_vm_url = "/v310/vm"
-    vm_paginated_result = {'next' : "offset=0&limit=" + str(page_size)}
-    vm_filter = {"includeFields"   : ["uuid", "vmware"] }
-    
-    # While there are more VMs, go get them, and build a dictionary
-    # of name to UUID.
-    while 'next' in vm_paginated_result:
-        url = get_vm_url + "?" + vm_paginated_result['next']
-    
-        r = tintri.api_get_query(server_name, url, vm_filter, session_id)
-        print_debug("The JSON response of the VM get invoke to the server " +
-                    server_name + " is: " + r.text)
-        
-        # For each VM in the page, print the VM name and UUID.
-        vm_paginated_result = r.json()
-        print_debug("VMs:\n" + format_json(vm_paginated_result))
-    
-        # Build a dictionary
-        items = vm_paginated_result["items"]
-        for vm in items:
-            vm_name_to_uuid[vm["vmware"]["name"]] = vm["uuid"]["uuid"]
+    with tintri_vm_index.open_vm_index(server_name, session_id) as vm_index:
+        (vm_name_to_uuid, unknown, duplicates) = vm_index.resolve_names(vms)
 
     for vm in vms:
         if vm in vm_name_to_uuid:
             vm_uuids.append(vm_name_to_uuid[vm])
+        elif vm in duplicates:
+            print_info("VM, " + vm + ", is not unique on TGC, " + server_name +
+                       ": " + ", ".join(duplicates[vm]))
         else:
             print_info("VM, " + vm + ", is unknown to TGC, " + server_name)
 
@@ -130,25 +128,13 @@ def get_vms(server_name, session_id, vm_filter):
 
     # Get a list of VMs, but return a page size at a time
     get_vm_url = "/v310/vm"
-    vm_paginated_result = {'next' : "offset=0&limit=" + str(page_size)}
     
-    # While there are more VMs, go get them, and build a dictionary
-    # of name to UUID.
-    while 'next' in vm_paginated_result:
-        url = get_vm_url + "?" + vm_paginated_result['next']
-    
-        r = tintri.api_get_query(server_name, url, vm_filter, session_id)
-        print_debug("The JSON response of the VM get invoke to the server " +
-                    server_name + " is: " + r.text)
-        
-        # For each VM in the page, print the VM name and UUID.
-        vm_paginated_result = r.json()
-        print_debug("VMs:\n" + format_json(vm_paginated_result))
-    
-        # Get the VMs
-        items = vm_paginated_result["items"]
-        for vm in items:
-            vm_uuids.append(vm["uuid"]["uuid"])
+    # Go get the VMs, and build a list of UUIDs.
+    vm_pages = tintri.api_paginator(server_name, get_vm_url, vm_filter,
+                                    session_id, page_size,
+                                    fields=tintri.VM_UUID_PATHS)
+    for (vm_uuid,) in vm_pages:
+        vm_uuids.append(vm_uuid)
 
     return vm_uuids
 
@@ -158,9 +144,7 @@ def get_vms_by_sg(server_name, session_id, sg_uuid):
     vm_uuids = []
 
     # Get a list of VMs, but return a page size at a time
-    vm_filter = {"includeFields"   : ["uuid", "vmware"],
-                 "serviceGroupIds" : sg_uuid
-                }
+    vm_filter = {"serviceGroupIds" : sg_uuid}
     
     vm_uuids = get_vms(server_name, session_id, vm_filter)
 
@@ -170,33 +154,65 @@ def get_vms_by_sg(server_name, session_id, sg_uuid):
 # Return a list of VM UUIDs base of a string contained in VMs.
 def get_vms_by_name(server_name, session_id, name):
 
-    vm_filter = {"includeFields" : ["uuid", "vmware"],
-                 "name" : name
-                }
+    vm_filter = {"name" : name}
     
     vm_uuids = get_vms(server_name, session_id, vm_filter)
 
     return vm_uuids
 
+# Set the affinity rule of one VM.  Busy servers and 500 responses are
+# retried with backoff.  Returns the response.
+def put_vm_affinity(server_name, session_id, vm_uuid, affinity_rule):
+    rule_url = "/v310/vm/" + vm_uuid + "/affinity"
+    return tintri.api_put(server_name, rule_url, affinity_rule, session_id,
+                          affinity_retry_policy)
+
+
 # A helper function  that sets the VM affinity rule for migration recommendations.
-def set_vm_affinity(server_name, session_id, vm_uuids, affinity_rule):
-    url = "/v310/vm/"
-
-    for vm_uuid in vm_uuids:
-        rule_url = url + vm_uuid + "/affinity"
-
-        r = tintri.api_put(server_name, rule_url, affinity_rule, session_id)
-        if r.status_code != 204:
-            tintri.api_logout(server_name, session_id)
-            message = "The HTTP response for put affinity rule to the server is not 204."
-            raise tintri.TintriApiException(message, r.status_code,
-                                            rule_url, str(affinity_rule), r.text)
-        sys.stdout.write(".")
+# The VMs are updated concurrently by a bounded pool of workers.  There is
+# no bulk affinity API, so each VM gets its own PUT.  Returns a list of
+# (VM UUID, error message) for the VMs that failed.
+def set_vm_affinity(server_name, session_id, vm_uuids, affinity_rule,
+                    workers=default_workers):
+    failed_vms = []
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {}
+        for vm_uuid in vm_uuids:
+            future = executor.submit(put_vm_affinity, server_name, session_id,
+                                     vm_uuid, affinity_rule)
+            futures[future] = vm_uuid
+
+        for future in as_completed(futures):
+            vm_uuid = futures[future]
+            try:
+                r = future.result()
+            except tintri.TintriRequestsException as tre:
+                failed_vms.append((vm_uuid, tre.__str__()))
+                continue
+
+            if r.status_code != 204:
+                failed_vms.append((vm_uuid, "status code=" + str(r.status_code) +
+                                   " response:" + r.text))
+                continue
+
+            sys.stdout.write(".")
+            sys.stdout.flush()
+    finally:
+        executor.shutdown()
+
     print("")
+    print(str(len(vm_uuids) - len(failed_vms)) + " of " + str(len(vm_uuids)) +
+          " VM affinity rules set")
+    for (vm_uuid, error) in failed_vms:
+        print_error(vm_uuid + ": " + error)
+
+    return failed_vms
 
 
 # Set the VM affinity rule to never for a list of VMs.
-def set_vm_affinity_never(server_name, session_id, vm_uuids):
+def set_vm_affinity_never(server_name, session_id, vm_uuids, workers=default_workers):
     print("Setting " + str(len(vm_uuids)) + " VMs to never migrate")
 
     affinity_rule = \
@@ -204,18 +220,18 @@ def set_vm_affinity_never(server_name, session_id, vm_uuids):
          "ruleType" : "NEVER"
         }
 
-    set_vm_affinity(server_name, session_id, vm_uuids, affinity_rule)
+    return set_vm_affinity(server_name, session_id, vm_uuids, affinity_rule, workers)
 
 
 # Clear the VM affinity rule for a list of VMs
-def clear_vm_affinity(server_name, session_id, vm_uuids):
+def clear_vm_affinity(server_name, session_id, vm_uuids, workers=default_workers):
     print("Clearing " + str(len(vm_uuids)) + " VMs affinity rules")
 
     affinity_rule = \
         {"typeId" : beans + "vm.VirtualMachineAffinityRule",
         }
 
-    set_vm_affinity(server_name, session_id, vm_uuids, affinity_rule)
+    return set_vm_affinity(server_name, session_id, vm_uuids, affinity_rule, workers)
 
 
 # main
@@ -238,11 +254,22 @@ parser.add_argument("--vms", nargs='+', help="a list of VMs")
 parser.add_argument("--name", help="matches VMs that contain name")
 parser.add_argument("--affinity", choices=["never", "clear"],
                      help="affinity to set. Default is 'never'")
+parser.add_argument("--workers", type=int, default=default_workers,
+                     help="maximum number of concurrent VM updates. Default is " +
+                          str(default_workers))
+parser.add_argument("--max_rate", type=float, default=default_max_rate,
+                     help="maximum VM updates per second. Default is " +
+                          str(default_max_rate))
         
 
 args = parser.parse_args()
 to_do = False
 
+# Pace the updates to what the server can take.
+tintri.set_governor(tintri.TintriGovernor({'write': {'rate': args.max_rate,
+                                                     'burst': args.workers,
+                                                     'max_in_flight': args.workers}}))
+
 # Check for a service group name.
 if args.sg != None:
     service_group = args.sg
@@ -339,10 +366,10 @@ try:
 
     # Process according to affinity
     if (affinity == "never"):
-        set_vm_affinity_never(server_name, session_id, vm_uuids)
+        failed_vms = set_vm_affinity_never(server_name, session_id, vm_uuids, args.workers)
 
     elif (affinity == "clear"):
-        clear_vm_affinity(server_name, session_id, vm_uuids)
+        failed_vms = clear_vm_affinity(server_name, session_id, vm_uuids, args.workers)
 
     else:
         raise tintri.TintriRequestsException("Bad affinity rule: " + affinity)
@@ -358,3 +385,5 @@ except tintri.TintriApiException as tae:
 # All pau, log out
 tintri.api_logout(server_name, session_id)
 
+if len(failed_vms) > 0:
+    sys.exit(6)
@@ -32,6 +32,7 @@
 
 # Standard python libraries
 import tintri_1_1 as tt
+import tintri_vm_index
 import json
 import csv
 import sys
@@ -65,17 +66,24 @@ def print_error(out):
 
 # Obtains VM UUIDs for all the VM names in a list.
 # Returns a tuple of (VM UUID list, VM name list).
+# The names are resolved with the local VM index.  Names shared by
+# several VMs are an error.
 def get_vm_uuids(vm_list):
     uuid_list = []
     vms_found = []
 
-    result = tt.api_get(server_name, "/v310/vm", session_id)
-    all_vms = result.json()
+    with tintri_vm_index.open_vm_index(server_name, session_id) as vm_index:
+        (name_to_uuid, unknown, duplicates) = vm_index.resolve_names(vm_list)
 
-    for vm in all_vms["items"]:
-        if vm["vmware"]["name"] in vm_list:
-            uuid_list.append(vm["uuid"]["uuid"])
-            vms_found.append(vm["vmware"]["name"])
+    if len(duplicates) > 0:
+        for vm_name in sorted(duplicates):
+            print_error(vm_name + " is not unique: " + ", ".join(duplicates[vm_name]))
+        raise tt.TintriRequestsException("VM names in the list are not unique")
+
+    for vm_name in vm_list:
+        if vm_name in name_to_uuid:
+            uuid_list.append(name_to_uuid[vm_name])
+            vms_found.append(vm_name)
     return (uuid_list, vms_found)
 
 
@@ -175,9 +183,9 @@ try:
     
     if len(vms_found) != len(vm_list):
         print_error("VMs found: " + str(len(vms_found)) + " != VMs read: " + str(len(vm_list)))
-    	print_error("VMs in list:\n   " + ", ".join(vm_list))
-    	print_error("VMs found:\n   " + ", ".join(vms_found))
-    	raise tt.TintriRequestsException("The servers specified do not match what was returned")
+        print_error("VMs in list:\n   " + ", ".join(vm_list))
+        print_error("VMs found:\n   " + ", ".join(vms_found))
+        raise tt.TintriRequestsException("The servers specified do not match what was returned")
     
     payload = {'typeId': 'com.tintri.api.rest.v310.dto.CollectionChangeRequest', \
                'objectIdsAdded': uuid_list
@@ -27,6 +27,7 @@ import sys
 import json
 import datetime
 import tintri_1_1 as tintri
+import tintri_vm_index
 
 """
  This Python script takes a snapshot for the specified VM.
@@ -129,25 +130,16 @@ except tintri.TintriApiException as tae:
     
 
 try:
-    # Create query filter to get the VM specified by the VM name.
-    q_filter = {'name': vm_name}
+    # Get the UUID of the specified VM from the local VM index.
+    with tintri_vm_index.open_vm_index(server_name, session_id) as vm_index:
+        vm_uuids = vm_index.lookup_uuids(vm_name)
 
-    # Get the UUID of the specified VM
-    vm_url = "/v310/vm"
-    r = tintri.api_get_query(server_name, vm_url, q_filter, session_id)
-    print_debug("The JSON response of the get invoke to the server " +
-                server_name + " is: " + r.text)
-
-    vm_paginated_result = r.json()
-    num_vms = int(vm_paginated_result["filteredTotal"])
-    if num_vms == 0:
+    if len(vm_uuids) == 0:
         raise tintri.TintriRequestsException("VM " + vm_name + " doesn't exist")
-
-    # Get the information from the first item and hopefully the only item.
-    items = vm_paginated_result["items"]
-    vm = items[0]
-    vm_name = vm["vmware"]["name"]
-    vm_uuid = vm["uuid"]["uuid"]
+    if len(vm_uuids) > 1:
+        raise tintri.TintriRequestsException("VM " + vm_name + " is not unique: " +
+                                             ", ".join(vm_uuids))
+    vm_uuid = vm_uuids[0]
 
     print_info(vm_name + ": " + vm_uuid)
 
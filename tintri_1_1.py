@@ -23,10 +23,36 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import io
+import os
+import re
 import sys
 import json
+import time
+import random
+import calendar
+import socket
+import threading
+import collections
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from requests.compat import cookielib
+from email.utils import parsedate_tz, mktime_tz
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson decodes and encodes JSON several times faster than json, and
+# ijson decodes chosen fields of a page without building the whole page,
+# see set_low_memory_pages().  Both are optional.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # disable security warnings
 requests.packages.urllib3.disable_warnings()
@@ -36,6 +62,16 @@ requests.packages.urllib3.disable_warnings()
  of supporting Tintri's python examples.
 
  1.1 - added exceptions
+     - pooled keep-alive HTTP sessions per server
+     - TintriClient with lazy login and a session cache
+     - parallel paginator for collections
+     - streaming collection generator
+     - server-side field projection (includeFields)
+     - per-request instrumentation hooks
+     - automatic retries with backoff and Retry-After
+     - adaptive rate limiting per server and endpoint class
+     - faster JSON with orjson and field-subset page decoding
+     - resumable, parallel ranged file downloads
 
  This library was NOT designed to be a general purpose Python library.
 
@@ -43,6 +79,77 @@ requests.packages.urllib3.disable_warnings()
 
 API = "/api"
 
+# URL scheme of the API.  TINTRI_API_SCHEME=http talks to a local mock
+# server without TLS.
+API_SCHEME = os.environ.get("TINTRI_API_SCHEME", "https")
+
+# Connection pool defaults.  pool_connections is the number of per-host
+# connection pools cached by a session and pool_maxsize is the number of
+# keep-alive connections kept per host.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+# Request timeouts in seconds: for connecting, and for the server to send
+# the next bytes of a response.  A hung server fails the request instead
+# of stalling the caller.
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+
+# Paginator defaults.  max_workers bounds both the threads and the number
+# of pages fetched ahead of the caller.
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_PAGE_WORKERS = 4
+
+# Download defaults.  A file the server serves ranges of is downloaded in
+# up to DEFAULT_DOWNLOAD_SEGMENTS parallel ranged segments, each at least
+# MIN_DOWNLOAD_SEGMENT_SIZE bytes.  A dropped download is resumed up to
+# DEFAULT_DOWNLOAD_RESUMES times.
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_DOWNLOAD_SEGMENTS = 4
+MIN_DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_DOWNLOAD_RESUMES = 3
+
+# Minimal VM field projections (includeFields) for common uses.  Asking
+# the server for only these fields keeps stats and QoS out of the pages.
+VM_UUID_FIELDS = ["uuid"]
+VM_NAME_UUID_FIELDS = ["uuid", "vmware"]
+VM_STAT_FIELDS = ["uuid", "vmware", "stat"]
+VM_VMSTORE_FIELDS = ["uuid", "vmware", "vmstoreName", "isLive"]
+
+# Field paths for decoding only the UUID, or the UUID and name, of VMs.
+# See decode_page_fields().
+VM_UUID_PATHS = ["uuid.uuid"]
+VM_UUID_NAME_PATHS = ["uuid.uuid", "vmware.name"]
+
+# Retry defaults.  Requests are retried on connection errors, timeouts
+# and these statuses.  Only idempotent methods are retried unless a call
+# opts in.
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_MAX_RETRY_BACKOFF = 30.0
+DEFAULT_RETRY_DEADLINE = 300.0
+DEFAULT_RETRY_STATUSES = (429, 502, 503, 504)
+DEFAULT_RETRY_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+# Rate limiter defaults per endpoint class: requests per second, burst
+# size, maximum requests in flight and the latency in seconds above which
+# the server is taken to be busy.
+DEFAULT_RATE_LIMITS = {
+    'read':  {'rate': 50.0, 'burst': 20, 'max_in_flight': 16, 'latency_target': 2.0},
+    'write': {'rate': 25.0, 'burst': 10, 'max_in_flight': 16, 'latency_target': 5.0},
+    'login': {'rate': 2.0, 'burst': 4, 'max_in_flight': 2, 'latency_target': 5.0},
+}
+
+# UUIDs in API paths, collapsed to {uuid} in endpoint templates.  Tintri
+# UUIDs have a type suffix such as -VIM-0000...
+UUID_RE = re.compile(r"[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Za-z-]+")
+
+# API times: a date and time, optional fraction and optional zone.
+API_TIME_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$")
+
+# Default file to cache login sessions in between runs.
+DEFAULT_SESSION_CACHE = os.path.join(os.path.expanduser("~"), ".tintri_sessions.json")
+
 
 # Exception class for requests errors
 class TintriRequestsException(Exception):
@@ -69,6 +176,654 @@ class TintriApiException(Exception):
             (self._message, self.status_code, self.url, self.payload, self.response)
 
 
+# When and how long to wait before retrying a request.  The wait doubles
+# with each retry from backoff up to max_backoff, with jitter so that
+# concurrent clients spread out.  A Retry-After header from the server
+# sets the wait instead.  No retry starts once deadline seconds have
+# passed since the first attempt.  Add 'POST' to methods to retry all
+# POSTs, or pass retry=True to a call.
+class TintriRetryPolicy:
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_RETRY_BACKOFF,
+                 max_backoff=DEFAULT_MAX_RETRY_BACKOFF, deadline=DEFAULT_RETRY_DEADLINE,
+                 statuses=DEFAULT_RETRY_STATUSES, methods=DEFAULT_RETRY_METHODS):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.statuses = tuple(statuses)
+        self.methods = tuple(method.upper() for method in methods)
+
+
+    # Return the seconds to wait before retrying, or None to not retry.
+    # r is the response, or None after a connection error or timeout.
+    # retry=True or False overrides the methods of the policy.
+    def retry_delay(self, method, retries, started, r=None, retry=None):
+        if retry is None:
+            retry = method.upper() in self.methods
+        if not retry or retries >= self.max_retries:
+            return None
+        if r is not None and r.status_code not in self.statuses:
+            return None
+
+        delay = min(self.backoff * (2 ** retries), self.max_backoff)
+        delay = random.uniform(delay / 2, delay)
+        if r is not None:
+            retry_after = parse_retry_after(r.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = retry_after
+
+        if time.time() - started + delay > self.deadline:
+            return None
+        return delay
+
+
+# Return the seconds of a Retry-After header, given in seconds or as an
+# HTTP date, or None.
+def parse_retry_after(retry_after):
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    retry_time = parsedate_tz(retry_after)
+    if retry_time is None:
+        return None
+    return max(0.0, mktime_tz(retry_time) - time.time())
+
+
+# The retry policy of all the API helper functions.  None disables retries.
+_retry_policy = TintriRetryPolicy()
+
+
+def get_retry_policy():
+    return _retry_policy
+
+
+def set_retry_policy(retry_policy):
+    global _retry_policy
+    _retry_policy = retry_policy
+
+
+# A token bucket and a limit of requests in flight for one endpoint class
+# of one server.  The rate and the in flight limit adapt: a 5xx, a 429 or
+# a latency above latency_target halves both, at most once per
+# adapt_interval seconds, and each good response adds back a little, up
+# to the configured rate and max_in_flight.
+class TintriRateLimit:
+    def __init__(self, rate, burst, max_in_flight, latency_target,
+                 min_rate=0.5, adapt_interval=1.0):
+        self.max_rate = float(rate)
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.latency_target = latency_target
+        self.min_rate = min(min_rate, self.max_rate)
+        self.adapt_interval = adapt_interval
+
+        self.rate = self.max_rate
+        self.in_flight_limit = max_in_flight
+        self.in_flight = 0
+        self._tokens = float(burst)
+        self._refilled = time.time()
+        self._slowed = 0.0
+        self._good = 0
+        self._cond = threading.Condition()
+
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+
+    # Take a token and an in flight slot if both are free.  Returns 0 when
+    # taken, the seconds until the next token when only the token is
+    # missing, or None when no slot is free.  Call with the lock held.
+    def _take(self):
+        self._refill(time.time())
+        if self.in_flight >= self.in_flight_limit:
+            return None
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        self._tokens -= 1
+        self.in_flight += 1
+        return 0.0
+
+
+    # Wait for a token and a free in flight slot.  Returns the seconds
+    # waited.
+    def acquire(self):
+        start = time.time()
+        with self._cond:
+            while True:
+                wait = self._take()
+                if wait == 0.0:
+                    return time.time() - start
+                self._cond.wait(wait)
+
+
+    # Take a token and a free in flight slot without waiting, for callers
+    # that cannot block such as asyncio.  Returns as _take().
+    def try_acquire(self):
+        with self._cond:
+            return self._take()
+
+
+    # Free the slot of a request and adapt to how it went.  status is None
+    # for a request that failed without a response.
+    def release(self, latency, status):
+        with self._cond:
+            self.in_flight -= 1
+            busy = status is None or status == 429 or status >= 500 or \
+                latency > self.latency_target
+            now = time.time()
+            if busy:
+                self._good = 0
+                if now - self._slowed >= self.adapt_interval:
+                    self._slowed = now
+                    self._refill(now)
+                    self.rate = max(self.min_rate, self.rate / 2)
+                    self.in_flight_limit = max(1, self.in_flight_limit // 2)
+            else:
+                self._refill(now)
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+                self._good += 1
+                if self._good >= self.in_flight_limit:
+                    self._good = 0
+                    self.in_flight_limit = min(self.max_in_flight, self.in_flight_limit + 1)
+            self._cond.notify_all()
+
+
+# Return the endpoint class of a request: 'login', 'read' or 'write'.
+def endpoint_class(method, url):
+    if '/session/' in url:
+        return 'login'
+    if method.upper() in ('GET', 'HEAD', 'OPTIONS'):
+        return 'read'
+    return 'write'
+
+
+# Keeps a TintriRateLimit per server and endpoint class, so that parallel
+# callers do not flood a server.  limits overrides DEFAULT_RATE_LIMITS per
+# class, e.g. {'write': {'rate': 10.0}}.
+class TintriGovernor:
+    def __init__(self, limits=None):
+        self.limits = {}
+        for name in DEFAULT_RATE_LIMITS:
+            self.limits[name] = dict(DEFAULT_RATE_LIMITS[name])
+            self.limits[name].update((limits or {}).get(name, {}))
+        self._rate_limits = {}
+        self._lock = threading.Lock()
+
+
+    def get_rate_limit(self, server_name, method, url):
+        key = (server_name, endpoint_class(method, url))
+        with self._lock:
+            rate_limit = self._rate_limits.get(key)
+            if rate_limit is None:
+                rate_limit = TintriRateLimit(**self.limits[key[1]])
+                self._rate_limits[key] = rate_limit
+        return rate_limit
+
+
+# The governor of all the API helper functions.  None, the default, does
+# not limit requests.
+_governor = None
+
+
+def get_governor():
+    return _governor
+
+
+def set_governor(governor):
+    global _governor
+    _governor = governor
+
+
+# Decode JSON with orjson when installed.  content can be bytes or str.
+def json_loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    return json.loads(content)
+
+
+# Encode JSON with orjson when installed.  Returns bytes with orjson.
+def json_dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload)
+
+
+# Return the value at a dotted path such as 'vmware.name' in a decoded
+# item, or None if the path is missing.
+def get_path(item, path):
+    value = item
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+# The JSON events of scalar values in ijson.
+_IJSON_SCALARS = ('string', 'number', 'boolean', 'null')
+
+# Whether decode_page_fields() streams pages with ijson.  Off, the default,
+# a page is decoded whole, with orjson when installed, which is several
+# times faster; on, only the field tuples are built, which bounds memory
+# on very large pages.  Has no effect without ijson.
+_low_memory_pages = False
+
+
+def get_low_memory_pages():
+    return _low_memory_pages
+
+
+def set_low_memory_pages(enabled):
+    global _low_memory_pages
+    _low_memory_pages = enabled
+
+
+# Decode a collection page keeping only some fields of its items.  fields
+# are dotted paths to scalar values in an item, such as 'uuid.uuid' or
+# 'vmware.name'.  Returns (filteredTotal, list of tuples of the field
+# values in fields order).  The page is decoded whole and dropped, or
+# parsed as a stream with ijson in the low memory mode.
+def decode_page_fields(content, fields):
+    if ijson is None or not _low_memory_pages:
+        page = json_loads(content)
+        items = [tuple(get_path(item, field) for field in fields) for item in page["items"]]
+        return (int(page["filteredTotal"]), items)
+
+    wanted = dict(("items.item." + field, index) for (index, field) in enumerate(fields))
+    total = None
+    items = []
+    record = None
+    for (prefix, event, value) in ijson.parse(io.BytesIO(content), use_float=True):
+        if prefix == "items.item":
+            if event == 'start_map':
+                record = [None] * len(fields)
+            elif event == 'end_map':
+                items.append(tuple(record))
+                record = None
+        elif record is not None:
+            index = wanted.get(prefix)
+            if index is not None and event in _IJSON_SCALARS:
+                record[index] = value
+        elif prefix == "filteredTotal" and event == 'number':
+            total = int(value)
+    return (total, items)
+
+
+# Return the endpoint template of a URL: the path after /api with the
+# UUIDs collapsed to {uuid}, e.g. /v310/vm/{uuid}/affinity.
+def endpoint_template(url):
+    path = requests.compat.urlparse(url).path
+    if path.startswith(API + '/'):
+        path = path[len(API):]
+    return UUID_RE.sub("{uuid}", path)
+
+
+# One API request, as seen by the request hooks.  timings holds the
+# seconds spent in each phase:
+#   dns      - resolving the server name, for a new connection
+#   connect  - the TCP connect, for a new connection
+#   tls      - the TLS handshake, for a new connection
+#   server   - sending the request until the response headers arrive
+#   transfer - reading the response body
+#   decode   - decoding a JSON response body
+#   total    - the whole request
+#   backoff  - waiting between retries
+#   throttle - waiting for the rate limiter
+# status and bytes are None when the request failed with error.  retries
+# is the number of times the request was retried.
+class TintriRequestEvent:
+    def __init__(self, server_name, method, url):
+        self.server_name = server_name
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint_template(url)
+        self.start = time.time()
+        self.status = None
+        self.bytes = None
+        self.retries = 0
+        self.error = None
+        self.timings = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0, 'server': 0.0,
+                        'transfer': 0.0, 'decode': 0.0, 'backoff': 0.0,
+                        'throttle': 0.0, 'total': 0.0}
+
+
+    def as_dict(self):
+        return {'server': self.server_name,
+                'method': self.method,
+                'endpoint': self.endpoint,
+                'start': self.start,
+                'status': self.status,
+                'bytes': self.bytes,
+                'retries': self.retries,
+                'error': self.error,
+                'timings': dict(self.timings)}
+
+
+# Base class of the request hooks.  before_request() is called before a
+# request is sent and after_request() once it has completed or failed.
+# Hooks are called on the thread of the request, so they must be thread
+# safe.  See tintri_metrics for hooks that aggregate and export events.
+class TintriRequestHook:
+    def before_request(self, event):
+        pass
+
+
+    def after_request(self, event):
+        pass
+
+
+# The installed request hooks.  The list is replaced, never changed in
+# place, so requests in flight keep a consistent list.
+_request_hooks = []
+_request_hooks_lock = threading.Lock()
+
+
+def add_request_hook(hook):
+    global _request_hooks
+    with _request_hooks_lock:
+        _request_hooks = _request_hooks + [hook]
+
+
+def remove_request_hook(hook):
+    global _request_hooks
+    with _request_hooks_lock:
+        _request_hooks = [h for h in _request_hooks if h is not hook]
+
+
+def get_request_hooks():
+    return list(_request_hooks)
+
+
+# The timings of the request on the current thread, filled in by the
+# connection classes below when a request opens a new connection, and the
+# fields a paginator decodes the page of the request to.
+_request_context = threading.local()
+
+
+# Open the socket of a connection, timing the name resolution and the
+# TCP connect separately.  The name is resolved first and the connection
+# is made to the address, the TLS server name stays the host name.
+def _timed_new_conn(conn, conn_class):
+    timings = getattr(_request_context, 'timings', None)
+    if timings is None:
+        return conn_class._new_conn(conn)
+
+    dns_host = conn._dns_host
+    start = time.time()
+    try:
+        conn._dns_host = socket.getaddrinfo(dns_host, conn.port, 0, socket.SOCK_STREAM)[0][4][0]
+    except socket.gaierror:
+        pass    # The connect reports the error.
+    resolved = time.time()
+    try:
+        sock = conn_class._new_conn(conn)
+    finally:
+        conn._dns_host = dns_host
+    timings['dns'] = resolved - start
+    timings['connect'] = time.time() - resolved
+    return sock
+
+
+class _TimedHTTPConnection(urllib3.connection.HTTPConnection):
+    def _new_conn(self):
+        return _timed_new_conn(self, urllib3.connection.HTTPConnection)
+
+
+class _TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def _new_conn(self):
+        return _timed_new_conn(self, urllib3.connection.HTTPSConnection)
+
+
+    def connect(self):
+        start = time.time()
+        urllib3.connection.HTTPSConnection.connect(self)
+        timings = getattr(_request_context, 'timings', None)
+        if timings is not None:
+            timings['tls'] = max(0.0, time.time() - start - timings['dns'] - timings['connect'])
+
+
+class _TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+# An HTTPAdapter whose connections report their set up timings to the
+# request hooks.
+class TintriHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+# Holds one requests Session per server so that API calls reuse keep-alive
+# connections instead of doing a TCP connect and TLS handshake per call.
+class TintriSessionPool:
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+
+    # Return the session for a server, creating it on first use.
+    def get_session(self, server_name):
+        with self._lock:
+            session = self._sessions.get(server_name)
+            if session is None:
+                session = self._new_session()
+                self._sessions[server_name] = session
+        return session
+
+
+    def _new_session(self):
+        session = requests.Session()
+        session.verify = False
+
+        # The session ID is passed explicitly on every call, so the
+        # shared session must not remember cookies between calls.
+        session.cookies.set_policy(cookielib.DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = TintriHTTPAdapter(pool_connections=self.pool_connections,
+                                    pool_maxsize=self.pool_maxsize,
+                                    pool_block=self.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+
+    # Close the session of one server, or of all servers.
+    def close(self, server_name=None):
+        with self._lock:
+            if server_name is None:
+                sessions = list(self._sessions.values())
+                self._sessions.clear()
+            else:
+                sessions = [self._sessions.pop(server_name)] \
+                    if server_name in self._sessions else []
+        for session in sessions:
+            session.close()
+
+
+# The session pool shared by all the API helper functions.
+_session_pool = TintriSessionPool()
+
+
+# Return the shared session pool.
+def get_session_pool():
+    return _session_pool
+
+
+# Replace the shared session pool with one using new connection limits.
+# pool_block=True makes callers wait for a free connection instead of
+# opening connections beyond pool_maxsize.
+def set_pool_limits(pool_connections=DEFAULT_POOL_CONNECTIONS,
+                    pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+    global _session_pool
+    old_pool = _session_pool
+    _session_pool = TintriSessionPool(pool_connections, pool_maxsize, pool_block)
+    old_pool.close()
+
+
+# Return the URL for an API on a server.
+def api_url(server_name, api):
+    return API_SCHEME + '://' + server_name + API + api
+
+
+# Invoke a request on the pooled session of a server and map the requests
+# exceptions to TintriRequestsException.  The prefix is prepended to the
+# error messages.  Each attempt waits for the governor, if one is set.
+# The request is retried per the retry policy; retry=True or False
+# overrides the policy for the call, and a TintriRetryPolicy replaces it
+# for the call.  The request hooks, if any, see the
+# request once, with its retry count.
+def api_request(server_name, method, url, prefix="", retry=None, **kwargs):
+    session = _session_pool.get_session(server_name)
+    kwargs.setdefault('timeout', (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT))
+
+    hooks = _request_hooks
+    if not hooks:
+        r = _send_request(session, server_name, method, url, prefix, retry, None, **kwargs)
+        _use_fast_json(r, kwargs.get('stream', False))
+        return r
+
+    event = TintriRequestEvent(server_name, method, url)
+    for hook in hooks:
+        hook.before_request(event)
+
+    _request_context.timings = event.timings
+    try:
+        r = _send_request(session, server_name, method, url, prefix, retry, event, **kwargs)
+        _use_fast_json(r, kwargs.get('stream', False))
+        _time_response(event, r, kwargs.get('stream', False))
+        return r
+    except TintriRequestsException as tre:
+        event.error = tre.__str__()
+        raise
+    finally:
+        _request_context.timings = None
+        event.timings['total'] = time.time() - event.start
+        for hook in hooks:
+            hook.after_request(event)
+
+
+# Make r.json() decode with orjson, when installed.  The closure holds the
+# content rather than the response to not make a reference cycle.
+def _use_fast_json(r, stream):
+    if orjson is None or stream:
+        return
+    content = r.content
+    r.json = lambda **kwargs: orjson.loads(content)
+
+
+# Fill in the event from a response.  A JSON body is decoded here to time
+# the decode; r.json() then returns the decoded body.  A page requested by
+# a paginator with fields is decoded with decode_page_fields() instead,
+# and the result is left in r.page_fields.
+def _time_response(event, r, stream):
+    timings = event.timings
+    elapsed = r.elapsed.total_seconds()
+    timings['server'] = max(0.0, elapsed - timings['dns'] - timings['connect'] - timings['tls'])
+    timings['transfer'] = max(0.0, time.time() - event.start - elapsed -
+                              timings['backoff'] - timings['throttle'])
+    event.status = r.status_code
+
+    if stream:
+        length = r.headers.get('Content-Length')
+        event.bytes = int(length) if length is not None else None
+        return
+    event.bytes = len(r.content)
+
+    if 'json' not in r.headers.get('Content-Type', ""):
+        return
+    fields = getattr(_request_context, 'page_fields', None)
+    start = time.time()
+    try:
+        if fields is not None and r.status_code == 200:
+            r.page_fields = decode_page_fields(r.content, fields)
+        else:
+            value = r.json()
+            r.json = lambda **kwargs: value
+    except (ValueError, KeyError, TypeError):
+        return
+    timings['decode'] = time.time() - start
+
+
+# Send a request, retrying per the retry policy.
+def _send_request(session, server_name, method, url, prefix, retry, event, **kwargs):
+    retry_policy = _retry_policy
+    if isinstance(retry, TintriRetryPolicy):
+        (retry_policy, retry) = (retry, None)
+    started = time.time()
+    retries = 0
+
+    try:
+        while True:
+            try:
+                r = _send_once(session, server_name, method, url, event, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if retry_policy is None:
+                    raise
+                delay = retry_policy.retry_delay(method, retries, started, None, retry)
+                if delay is None:
+                    raise
+            else:
+                if retry_policy is None:
+                    return r
+                delay = retry_policy.retry_delay(method, retries, started, r, retry)
+                if delay is None:
+                    return r
+                r.close()
+
+            retries += 1
+            if event is not None:
+                event.retries = retries
+                event.timings['backoff'] += delay
+            time.sleep(delay)
+    except requests.ConnectionError:
+        raise TintriRequestsException(prefix + "API Connection error occurred.")
+    except requests.HTTPError:
+        raise TintriRequestsException(prefix + "HTTP error occurred.")
+    except requests.Timeout:
+        raise TintriRequestsException(prefix + "Request timed out.")
+    except Exception:
+        raise TintriRequestsException(prefix + "An unexpected error " +
+                                      str(sys.exc_info()[0]) + " occurred.")
+
+
+# Send one attempt of a request, paced by the governor.
+def _send_once(session, server_name, method, url, event, **kwargs):
+    governor = _governor
+    if governor is None:
+        return session.request(method, url, **kwargs)
+
+    rate_limit = governor.get_rate_limit(server_name, method, url)
+    waited = rate_limit.acquire()
+    if event is not None:
+        event.timings['throttle'] += waited
+
+    start = time.time()
+    try:
+        r = session.request(method, url, **kwargs)
+    except Exception:
+        rate_limit.release(time.time() - start, None)
+        raise
+    rate_limit.release(time.time() - start, r.status_code)
+    return r
+
+
 # API GET without query string.  The session ID can be 'None'.  This is for
 # the info API.
 def api_get(server_name, api, session_id=None):
@@ -82,19 +837,10 @@ def api_get_query(server_name, api, query, session_id):
     if session_id is not None:
         headers['cookie'] = 'JSESSIONID=' + session_id
 
-    url = 'https://' + server_name + API + api
+    url = api_url(server_name, api)
 
-    try:
-        # Invoke the API.
-        r = requests.get(url, headers=headers, params=query, verify=False)
-    except requests.ConnectionError:
-        raise TintriRequestsException("GET: API Connection error occurred.")
-    except requests.HTTPError:
-        raise TintriRequestsException("HTTP error occurred.")
-    except requests.Timeout:
-        raise TintriRequestsException("Request timed out.")
-    except:
-        raise TintriRequestsException("An unexpected error " + sys.exc_info()[0] + " occurred.")
+    # Invoke the API.
+    r = api_request(server_name, 'GET', url, "GET: ", headers=headers, params=query)
 
     # if HTTP Response is not 200 then raise an exception
     if r.status_code != 200:
@@ -113,65 +859,38 @@ def api_delete(server_name, api, session_id):
     headers = {'content-type': 'application/json',
                'cookie': 'JSESSIONID='+session_id }
 
-    url = 'https://' + server_name + API + api
+    url = api_url(server_name, api)
 
-    try:
-        # Invoke the API.
-        r = requests.delete(url, headers=headers, verify=False)
-    except requests.ConnectionError:
-        raise TintrRequestsiApiException("API Connection error occurred.")
-    except requests.HTTPError:
-        raise TintriRequestsException("HTTP error occurred.")
-    except requests.Timeout:
-        raise TintriRequestsException("Request timed out.")
-    except:
-        raise TintriRequestsException("An unexpected error " + sys.exc_info()[0] + " occurred.")
+    # Invoke the API.
+    r = api_request(server_name, 'DELETE', url, headers=headers)
 
     return r
 
 
-# PUT
-def api_put(server_name, api, payload, session_id):
+# PUT.  retry is as for api_request().
+def api_put(server_name, api, payload, session_id, retry=None):
     headers = {'content-type': 'application/json',
                'cookie': 'JSESSIONID='+session_id }
 
-    url = 'https://' + server_name + API + api
+    url = api_url(server_name, api)
 
-    try:
-        # Invoke the API.
-        r = requests.put(url, data=json.dumps(payload),
-                         headers=headers, verify=False)
-    except requests.ConnectionError:
-        raise TintriRequestsException("API Connection error occurred.")
-    except requests.HTTPError:
-        raise TintriRequestsException("HTTP error occurred.")
-    except requests.Timeout:
-        raise TintriRequestsException("Request timed out.")
-    except:
-        raise TintriRequestsException("An unexpected error " + sys.exc_info()[0] + " occurred.")
+    # Invoke the API.
+    r = api_request(server_name, 'PUT', url, retry=retry, data=json_dumps(payload),
+                    headers=headers)
 
     return r
 
 
-# POST
-def api_post(server_name, api, payload, session_id):
+# POST.  POSTs are not retried unless retry is True.
+def api_post(server_name, api, payload, session_id, retry=None):
     headers = {'content-type': 'application/json',
                'cookie': 'JSESSIONID='+session_id }
 
-    url = 'https://' + server_name + API + api
+    url = api_url(server_name, api)
 
-    try:
-        # Invoke the API.
-        r = requests.post(url, data=json.dumps(payload),
-                          headers=headers, verify=False)
-    except requests.ConnectionError:
-        raise TintriRequestsException("API Connection error occurred.")
-    except requests.HTTPError:
-        raise TintriRequestsException("HTTP error occurred.")
-    except requests.Timeout:
-        raise TintriRequestsException("Request timed out.")
-    except:
-        raise TintriRequestsException("An unexpected error " + sys.exc_info()[0] + " occurred.")
+    # Invoke the API.
+    r = api_request(server_name, 'POST', url, retry=retry, data=json_dumps(payload),
+                    headers=headers)
 
     return r
 
@@ -184,21 +903,11 @@ def api_login(server_name, user_name, password):
     payload = {'username': user_name,
                'password': password,
                'typeId': 'com.tintri.api.rest.vcommon.dto.rbac.RestApiCredentials'}
-    url_login = 'https://'+ server_name + API + '/v310/session/login'
+    url_login = api_url(server_name, '/v310/session/login')
 
-    try:
-        # Invoke the login API.
-        r = requests.post(url_login, data=json.dumps(payload),
-                          headers=headers, verify=False)
-    except requests.ConnectionError:
-        raise TintriRequestsException("Login: API Connection error occurred.")
-    except requests.HTTPError:
-        raise TintriRequestsException("Login: HTTP error occurred.")
-    except requests.Timeout:
-        raise TintriRequestsException("Login: Request timed out.")
-    except:
-        raise TintriRequestsException("Login: An unexpected error " + sys.exc_info()[0] +
-            " occurred.")
+    # Invoke the login API.  A retried login only makes a new session.
+    r = api_request(server_name, 'POST', url_login, "Login: ", retry=True,
+                    data=json_dumps(payload), headers=headers)
 
     # if HTTP Response is not 200 then raise an exception
     if r.status_code != 200:
@@ -215,20 +924,10 @@ def api_logout(server_name, session_id):
     #Header and URL for logout call
     headers = {'content-type': 'application/json',
                'cookie': 'JSESSIONID='+session_id }
-    url_logout = 'https://' + server_name + API + '/v310/session/logout'
+    url_logout = api_url(server_name, '/v310/session/logout')
 
-    try:
-        # Send the logout request.
-        r = requests.get(url_logout, headers=headers, verify=False)
-    except requests.ConnectionError:
-        raise TintriRequestsException("Logout: API Connection error occurred.")
-    except requests.HTTPError:
-        raise TintrRequestsiApiException("Logout: HTTP error occurred.")
-    except requests.Timeout:
-        raise TintriRequestsException("Logout: Request timed out.")
-    except:
-        raise TintriRequestsException("Logout: An unexpected error " + sys.exc_info()[0] +
-            " occurred.")
+    # Send the logout request.
+    r = api_request(server_name, 'GET', url_logout, "Logout: ", headers=headers)
 
     # if HTTP Response is not 204 then raise an exception
     if r.status_code != 204:
@@ -244,21 +943,554 @@ def api_version(server_name):
     return r
 
 
-# Download a file
-def download_file(server_name, report_url, session_id, file_name):
-    headers = {'content-type': 'application/json'}
+# Format epoch seconds as an API time, e.g. 2017-03-14T09:30:00.000Z.
+def format_api_time(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch)) + \
+        (".%03dZ" % (int(epoch * 1000) % 1000))
+
+
+# Parse an API time such as 2017-03-14T09:30:00.000-07:00 or
+# 2017-03-14T16:30:00Z into epoch seconds.
+def parse_api_time(api_time):
+    match = API_TIME_RE.match(api_time)
+    if match is None:
+        raise ValueError("Not an API time: " + api_time)
+    (date_time, fraction, zone) = match.groups()
+    epoch = calendar.timegm(time.strptime(date_time, "%Y-%m-%dT%H:%M:%S"))
+    if fraction:
+        epoch += float("0" + fraction)
+    if zone and zone != "Z":
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:]) * 60
+        epoch -= offset if zone[0] == "+" else -offset
+    return epoch
+
+
+# Fetches all the items of a paginated collection such as /v310/vm.
+# The first page returns filteredTotal, so the remaining offset/limit
+# windows are known up front and are fetched over a bounded thread pool.
+# Items are yielded in collection order.  get_query is a function that
+# takes an API and a query and returns the response.  include_fields is
+# an optional list of the item fields the server should return.  With
+# fields, a list of dotted paths such as 'uuid.uuid', the items are
+# tuples of those fields decoded by decode_page_fields() instead of dicts.
+# page_size must be at least 1.
+class TintriPaginator:
+    def __init__(self, get_query, api, query=None, page_size=DEFAULT_PAGE_SIZE,
+                 max_workers=DEFAULT_PAGE_WORKERS, include_fields=None, fields=None):
+        if page_size < 1:
+            raise ValueError("Page size must be at least 1, not " + str(page_size))
+        self.get_query = get_query
+        self.api = api
+        self.query = query
+        self.page_size = page_size
+        self.max_workers = max(1, max_workers)
+        self.fields = fields
+        if include_fields is None and fields is not None:
+            include_fields = sorted(set(field.split('.')[0] for field in fields))
+        self.include_fields = include_fields
+        self.total = None
+
+
+    # Return the page that starts at offset.
+    def get_page(self, offset):
+        query = dict(self.query) if self.query is not None else {}
+        query['offset'] = offset
+        query['limit'] = self.page_size
+        if self.include_fields is not None:
+            query['includeFields'] = self.include_fields
+
+        if self.fields is None:
+            return self.get_query(self.api, query).json()
+
+        # Have the request hooks, if any, decode and time the fields.
+        _request_context.page_fields = self.fields
+        try:
+            r = self.get_query(self.api, query)
+        finally:
+            _request_context.page_fields = None
+        page_fields = getattr(r, 'page_fields', None)
+        if page_fields is None:
+            page_fields = decode_page_fields(r.content, self.fields)
+        (total, items) = page_fields
+        return {'filteredTotal': total, 'items': items}
+
+
+    def __iter__(self):
+        page = self.get_page(0)
+        self.total = int(page["filteredTotal"])
+        for item in page["items"]:
+            yield item
+
+        offsets = iter(range(self.page_size, self.total, self.page_size))
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = collections.deque()
+        try:
+            # Keep at most max_workers pages in flight ahead of the caller.
+            for offset in offsets:
+                pending.append(executor.submit(self.get_page, offset))
+                if len(pending) >= self.max_workers:
+                    break
+
+            while pending:
+                page = pending.popleft().result()
+                for offset in offsets:
+                    pending.append(executor.submit(self.get_page, offset))
+                    break
+
+                for item in page["items"]:
+                    yield item
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+# Return a paginator over a collection API.
+def api_paginator(server_name, api, query, session_id, page_size=DEFAULT_PAGE_SIZE,
+                  max_workers=DEFAULT_PAGE_WORKERS, include_fields=None, fields=None):
+    def get_query(page_api, page_query):
+        return api_get_query(server_name, page_api, page_query, session_id)
+
+    return TintriPaginator(get_query, api, query, page_size, max_workers, include_fields,
+                           fields)
+
+
+# Generator that yields the items of a collection API page by page, so the
+# caller can print, filter or PUT the first items while the next page is in
+# flight.  At most max_workers pages are fetched ahead of the caller, so
+# with the default only one or two pages are held in memory.
+def iter_collection(server_name, api, query, session_id, page_size=DEFAULT_PAGE_SIZE,
+                    max_workers=1, include_fields=None, fields=None):
+    pages = api_paginator(server_name, api, query, session_id, page_size, max_workers,
+                          include_fields, fields)
+    for item in pages:
+        yield item
+
+
+# Read the session cache file.  Returns an empty cache if the file
+# doesn't exist or can't be parsed.
+def read_session_cache(cache_file):
+    try:
+        with open(cache_file, 'r') as cache_h:
+            cache = json.load(cache_h)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+
+# Write the session cache file.  The file holds session IDs, so it is only
+# readable by the owner.
+def write_session_cache(cache_file, cache):
+    temp_file = cache_file + ".tmp"
+    fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as cache_h:
+        json.dump(cache, cache_h)
+
+    if hasattr(os, 'replace'):
+        os.replace(temp_file, cache_file)
+    else:
+        os.rename(temp_file, cache_file)
+
+
+# Client for one Tintri server.  Holds the server name, the session ID and
+# the /info version data.  Logs in on first use and logs in again when the
+# server answers 401.  With a cache file, the session ID and version data
+# are saved so that the next run can reuse the session instead of logging
+# in again.  The password is never written to the cache.
+class TintriClient:
+    def __init__(self, server_name, user_name, password, cache_file=None):
+        self.server_name = server_name
+        self.user_name = user_name
+        self._password = password
+        self.cache_file = cache_file
+        self.session_id = None
+        self.info = None
+        self._lock = threading.Lock()
+
+        if self.cache_file is not None:
+            entry = read_session_cache(self.cache_file).get(self._cache_key())
+            if entry is not None:
+                self.session_id = entry.get('session_id')
+                self.info = entry.get('info')
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def _cache_key(self):
+        return self.user_name + "@" + self.server_name
+
 
+    # Save the current session in the cache, or remove it when there is
+    # no session.
+    def _save_cache(self):
+        if self.cache_file is None:
+            return
+
+        cache = read_session_cache(self.cache_file)
+        if self.session_id is None:
+            cache.pop(self._cache_key(), None)
+        else:
+            cache[self._cache_key()] = {'session_id': self.session_id,
+                                        'info': self.info}
+        write_session_cache(self.cache_file, cache)
+
+
+    # Return the /info version data.
+    def get_info(self):
+        if self.info is None:
+            r = api_version(self.server_name)
+            self.info = r.json()
+            if self.session_id is not None:
+                self._save_cache()
+        return self.info
+
+
+    def get_preferred_version(self):
+        return self.get_info()['preferredVersion']
+
+
+    def get_product_name(self):
+        return self.get_info()['productName']
+
+
+    # Login and return the new session ID.
+    def login(self):
+        with self._lock:
+            self.session_id = api_login(self.server_name, self.user_name, self._password)
+            self._save_cache()
+        return self.session_id
+
+
+    # Return the session ID, logging in if there isn't one.
+    def get_session_id(self):
+        with self._lock:
+            if self.session_id is None:
+                self.session_id = api_login(self.server_name, self.user_name, self._password)
+                self._save_cache()
+            return self.session_id
+
+
+    # Login again unless another thread already replaced the stale session.
+    def _relogin(self, stale_session_id):
+        with self._lock:
+            if self.session_id == stale_session_id:
+                self.session_id = api_login(self.server_name, self.user_name, self._password)
+                self._save_cache()
+            return self.session_id
+
+
+    # Logout and remove the session from the cache.
+    def logout(self):
+        with self._lock:
+            session_id = self.session_id
+            self.session_id = None
+            self._save_cache()
+
+        if session_id is not None:
+            api_logout(self.server_name, session_id)
+
+
+    # Done with the client.  A cached session is kept for the next run;
+    # otherwise logout.
+    def close(self):
+        if self.cache_file is None:
+            self.logout()
+
+
+    # Invoke an API helper with the session ID.  If the session expired,
+    # login again and retry once.
+    def _invoke(self, invoke):
+        session_id = self.get_session_id()
+        try:
+            r = invoke(session_id)
+        except TintriApiException as tae:
+            if tae.status_code != 401:
+                raise
+            r = None
+
+        if r is None or r.status_code == 401:
+            session_id = self._relogin(session_id)
+            r = invoke(session_id)
+
+        return r
+
+
+    def get(self, api, query=None):
+        return self._invoke(lambda session_id:
+                            api_get_query(self.server_name, api, query, session_id))
+
+
+    def put(self, api, payload):
+        return self._invoke(lambda session_id:
+                            api_put(self.server_name, api, payload, session_id))
+
+
+    def post(self, api, payload, retry=None):
+        return self._invoke(lambda session_id:
+                            api_post(self.server_name, api, payload, session_id, retry))
+
+
+    def delete(self, api):
+        return self._invoke(lambda session_id:
+                            api_delete(self.server_name, api, session_id))
+
+
+    # Return a paginator over a collection API.
+    def paginator(self, api, query=None, page_size=DEFAULT_PAGE_SIZE,
+                  max_workers=DEFAULT_PAGE_WORKERS, include_fields=None, fields=None):
+        return TintriPaginator(self.get, api, query, page_size, max_workers, include_fields,
+                               fields)
+
+
+    # Generator that yields the items of a collection API page by page.
+    # See iter_collection().
+    def iter_collection(self, api, query=None, page_size=DEFAULT_PAGE_SIZE, max_workers=1,
+                        include_fields=None, fields=None):
+        for item in self.paginator(api, query, page_size, max_workers, include_fields, fields):
+            yield item
+
+
+# Return the first byte and the total size from the Content-Range header
+# of a response, such as 'bytes 100-999/1000' or 'bytes */1000'.  Either
+# is None when not known.
+def _content_range(r):
+    content_range = r.headers.get('Content-Range', "")
+    (byte_range, _, total) = content_range.rpartition("/")
+    first = byte_range.rpartition(" ")[2].partition("-")[0]
+    return (int(first) if first.isdigit() else None,
+            int(total) if total.isdigit() else None)
+
+
+# GET a file from byte start to byte end, or to the end when end is None.
+# The body is not content-encoded so the ranges are file offsets.  A
+# validator, the ETag or Last-Modified of the file, is sent as If-Range so
+# the server sends the whole file rather than a range of a changed file.
+def _get_file_range(server_name, file_url, start, end=None, validator=None):
+    headers = {'content-type': 'application/json',
+               'Accept-Encoding': 'identity'}
+    if start > 0 or end is not None:
+        headers['Range'] = "bytes=%d-%s" % (start, "" if end is None else str(end))
+        if validator:
+            headers['If-Range'] = validator
+    return api_request(server_name, 'GET', file_url, headers=headers, stream=True)
+
+
+# Return the validator of a file response, its ETag or else its
+# Last-Modified, or None.
+def _file_validator(r):
+    return r.headers.get('ETag') or r.headers.get('Last-Modified')
+
+
+# Raised when the file changed during a segmented download.
+class _TintriFileChanged(Exception):
+    pass
+
+
+# The state of a download is kept in part_name + '.json' next to the part
+# file: the file URL, validator and size, and for a segmented download the
+# next and last byte of each segment.  A part file is only resumed when
+# the state says it is of the same URL.
+def _read_download_state(state_name):
     try:
-        r = requests.get(report_url, headers=headers, verify=False, stream=True)
-        # if HTTP Response is not 200 then raise an exception
+        with open(state_name, 'r') as state_h:
+            return json.load(state_h)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_download_state(state_name, state):
+    tmp_name = state_name + ".tmp"
+    with open(tmp_name, 'w') as state_h:
+        json.dump(state, state_h)
+    os.replace(tmp_name, state_name)
+
+
+def _remove_download(part_name):
+    for name in (part_name, part_name + ".json"):
+        if os.path.isfile(name):
+            os.remove(name)
+
+
+# Download a file in parallel ranged segments into part_name, a file of
+# the full size.  The next byte and the last byte of each segment are
+# saved in the download state after each chunk is written, so an
+# interrupted download resumes each segment where it stopped.  state is
+# the saved state to resume, or None.  Returns the number of bytes
+# downloaded.
+def _download_segments(server_name, file_url, part_name, total, validator, state,
+                       chunk_size, segments):
+    state_name = part_name + ".json"
+    if state is not None and os.path.isfile(part_name):
+        ranges = state['ranges']
+    else:
+        segment_size = max(MIN_DOWNLOAD_SEGMENT_SIZE, -(-total // segments))
+        ranges = [[start, min(start + segment_size, total) - 1]
+                  for start in range(0, total, segment_size)]
+        with open(part_name, 'wb') as file_h:
+            file_h.truncate(total)
+    state = {'url': file_url, 'validator': validator, 'total': total, 'ranges': ranges}
+
+    lock = threading.Lock()
+
+    def download_segment(segment):
+        if segment[0] > segment[1]:
+            return
+        r = _get_file_range(server_name, file_url, segment[0], segment[1], validator)
+        with r:
+            if r.status_code == 200 and validator:
+                raise _TintriFileChanged()
+            if r.status_code != 206 or _content_range(r)[0] != segment[0]:
+                message = "The HTTP response for ranged get call to the server is not 206."
+                raise TintriApiException(message, r.status_code, file_url, "No Payload",
+                                         "Range: bytes=%d-%d" % tuple(segment))
+
+            # Unbuffered, so the saved progress never runs ahead of the file.
+            with open(part_name, 'r+b', buffering=0) as file_h:
+                file_h.seek(segment[0])
+                for block in r.iter_content(chunk_size):
+                    if len(block) > segment[1] + 1 - segment[0]:
+                        raise TintriRequestsException("Received more than the requested range.")
+                    file_h.write(block)
+                    with lock:
+                        segment[0] += len(block)
+                        _write_download_state(state_name, state)
+
+    with lock:
+        _write_download_state(state_name, state)
+
+    executor = ThreadPoolExecutor(max_workers=len(ranges))
+    try:
+        futures = [executor.submit(download_segment, segment) for segment in ranges]
+    finally:
+        executor.shutdown()
+    for future in futures:
+        future.result()
+
+    return total - sum(segment[1] + 1 - segment[0] for segment in ranges)
+
+
+# Download a file into part_name.  A part file of the same URL is resumed
+# from its end with a Range request and If-Range, and any other part file
+# is discarded.  A file that is big enough and served in ranges is
+# downloaded by _download_segments().  Returns the number of bytes
+# downloaded and the file size, None when the server does not say.
+def _download(server_name, file_url, part_name, chunk_size, segments):
+    state_name = part_name + ".json"
+    state = _read_download_state(state_name)
+    if state is None or state.get('url') != file_url:
+        state = None
+        _remove_download(part_name)
+
+    segmented = state is not None and 'ranges' in state
+    offset = 0
+    if state is not None and not segmented and os.path.isfile(part_name):
+        offset = os.path.getsize(part_name)
+
+    r = _get_file_range(server_name, file_url, offset, None,
+                        None if state is None else state.get('validator'))
+    if r.status_code == 416 and offset > 0:
+        # The part file is complete, or is not of this file.
+        r.close()
+        total = _content_range(r)[1]
+        if total == offset and total == state.get('total'):
+            return (offset, total)
+        offset = 0
+        r = _get_file_range(server_name, file_url, offset)
+
+    if r.status_code == 206 and offset > 0 and _content_range(r)[0] == offset:
+        total = _content_range(r)[1]
+        mode = 'ab'
+    elif r.status_code == 200 or (r.status_code == 206 and offset > 0):
+        if r.status_code == 206:
+            # The server did not resume where asked, start over.
+            r.close()
+            r = _get_file_range(server_name, file_url, 0)
         if r.status_code != 200:
             message = "The HTTP response for get call to the server is not 200."
-            raise TintriApiException(message, r.status_code, report_url, "No Payload", r.text)
+            raise TintriApiException(message, r.status_code, file_url, "No Payload", r.text)
+
+        length = r.headers.get('Content-Length', "")
+        total = int(length) if length.isdigit() else None
+        validator = _file_validator(r)
+        ranges = r.headers.get('Accept-Ranges', "") == "bytes"
+        if ranges and total is not None and \
+                (segmented or (segments > 1 and total >= 2 * MIN_DOWNLOAD_SEGMENT_SIZE)):
+            r.close()
+            # Resume the segments only of the same file.
+            if not segmented or state.get('validator') != validator or \
+                    state.get('total') != total:
+                state = None
+            downloaded = _download_segments(server_name, file_url, part_name, total,
+                                            validator, state, chunk_size, segments)
+            return (downloaded, total)
 
-        with open(file_name, 'w') as file_h:
-            for block in r.iter_content(4096):
+        _write_download_state(state_name, {'url': file_url, 'validator': validator,
+                                           'total': total})
+        mode = 'wb'
+    else:
+        message = "The HTTP response for get call to the server is not 200."
+        raise TintriApiException(message, r.status_code, file_url, "No Payload", r.text)
+
+    with r:
+        with open(part_name, mode) as file_h:
+            for block in r.iter_content(chunk_size):
                 file_h.write(block)
 
+    return (os.path.getsize(part_name), total)
+
+
+# Download a file.  The file is written to file_name + '.part' and only
+# renamed to file_name once its size matches the size the server sent.
+# A dropped connection is resumed from the bytes already written, up to
+# resumes times.  A .part file left by an earlier run is resumed too when
+# it is of the same URL, and the server is asked with If-Range to only
+# send the rest of an unchanged file.  Files the server serves ranges of
+# are downloaded in parallel segments.
+def download_file(server_name, report_url, session_id, file_name,
+                  chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE, segments=DEFAULT_DOWNLOAD_SEGMENTS,
+                  resumes=DEFAULT_DOWNLOAD_RESUMES):
+    part_name = file_name + ".part"
+
+    try:
+        attempt = 0
+        while True:
+            try:
+                (downloaded, total) = _download(server_name, report_url, part_name,
+                                                chunk_size, segments)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if attempt >= resumes:
+                    raise
+                attempt += 1
+                continue
+            except _TintriFileChanged:
+                _remove_download(part_name)
+                if attempt >= resumes:
+                    raise TintriRequestsException("The file changed during the download.")
+                attempt += 1
+                continue
+
+            if total is None or downloaded == total:
+                break
+            if downloaded > total or attempt >= resumes:
+                _remove_download(part_name)
+                raise TintriRequestsException("Downloaded " + str(downloaded) + " of " +
+                                              str(total) + " bytes.")
+            attempt += 1
+
+        os.replace(part_name, file_name)
+        _remove_download(part_name)
+
+    except TintriRequestsException:
+        raise
     except requests.ConnectionError:
         raise TintriRequestsException("API Connection error occurred.")
     except requests.HTTPError:
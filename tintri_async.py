@@ -0,0 +1,455 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import time
+import asyncio
+import aiohttp
+import tintri_1_1 as tintri
+
+"""
+ Asyncio versions of the tintri_1_1 API helpers for scripts that work on
+ hundreds of servers at once in one process.  The responses have the same
+ status_code, text and json() as the tintri_1_1 responses, and errors raise
+ the tintri_1_1 exceptions.  The tintri_1_1 request hooks see the requests,
+ with the TLS handshake timed as part of the connect.  The tintri_1_1 retry
+ policy and governor apply to the requests too.
+
+ Requires Python 3 and aiohttp.
+
+ This library was NOT designed to be a general purpose Python library.
+
+"""
+
+# Maximum number of requests in flight across all servers.
+DEFAULT_CONCURRENCY = 100
+
+# Maximum number of connections per server.
+DEFAULT_LIMIT_PER_HOST = 10
+
+# Maximum seconds for a request, on top of the tintri_1_1 connect and read
+# timeouts.
+DEFAULT_TIMEOUT = 300.0
+
+# Seconds between checks for a free in flight slot of the governor.
+GOVERNOR_POLL_INTERVAL = 0.02
+
+
+# Wait for a token and a free in flight slot of a tintri_1_1 rate limit
+# without blocking the event loop.  Returns the seconds waited.
+async def _acquire(rate_limit):
+    start = time.time()
+    while True:
+        wait = rate_limit.try_acquire()
+        if wait == 0.0:
+            return time.time() - start
+        await asyncio.sleep(GOVERNOR_POLL_INTERVAL if wait is None else wait)
+
+
+# A hung server fails its requests with "Request timed out." instead of
+# stalling the callers.  timeout bounds the whole request, None for no
+# bound.
+def _client_timeout(timeout):
+    return aiohttp.ClientTimeout(total=timeout,
+                                 sock_connect=tintri.DEFAULT_CONNECT_TIMEOUT,
+                                 sock_read=tintri.DEFAULT_READ_TIMEOUT)
+
+
+# A response whose body has been read, so that it can be used after the
+# connection is released.
+class TintriAsyncResponse:
+    def __init__(self, status_code, headers, content, cookies):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.cookies = cookies
+
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+    def json(self):
+        return tintri.json_loads(self.content)
+
+
+# Holds an aiohttp session and a semaphore that caps the requests in
+# flight.  Use as an async context manager:
+#
+#     async with TintriAsyncPool() as pool:
+#         session_id = await pool.api_login(server_name, user_name, password)
+class TintriAsyncPool:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+                 limit_per_host=DEFAULT_LIMIT_PER_HOST, timeout=DEFAULT_TIMEOUT):
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._semaphore = None
+        self._http = None
+
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    # Create the aiohttp session.  Needs a running event loop.
+    def open(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        # The session ID is passed explicitly on every call, so the
+        # session must not remember cookies between calls.
+        connector = aiohttp.TCPConnector(ssl=False, limit=self.concurrency,
+                                         limit_per_host=self.limit_per_host)
+        self._http = aiohttp.ClientSession(connector=connector,
+                                           cookie_jar=aiohttp.DummyCookieJar(),
+                                           timeout=_client_timeout(self.timeout),
+                                           trace_configs=[_timing_trace_config()])
+
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+
+    # Invoke a request and map the aiohttp exceptions to
+    # TintriRequestsException.  The prefix is prepended to the error
+    # messages.  The request hooks, if any, see the request.
+    async def api_request(self, method, url, prefix="", retry=None, **kwargs):
+        hooks = tintri.get_request_hooks()
+        if not hooks:
+            return await self._send_request(method, url, prefix, retry, None, **kwargs)
+
+        server_name = tintri.requests.compat.urlparse(url).netloc
+        event = tintri.TintriRequestEvent(server_name, method, url)
+        for hook in hooks:
+            hook.before_request(event)
+
+        try:
+            r = await self._send_request(method, url, prefix, retry, event, **kwargs)
+            event.status = r.status_code
+            event.bytes = len(r.content)
+            return r
+        except tintri.TintriRequestsException as tre:
+            event.error = tre.__str__()
+            raise
+        finally:
+            event.timings['total'] = time.time() - event.start
+            for hook in hooks:
+                hook.after_request(event)
+
+
+    # Send a request, retrying per the tintri_1_1 retry policy.  The
+    # semaphore is not held while waiting to retry.
+    async def _send_request(self, method, url, prefix, retry, event, **kwargs):
+        retry_policy = tintri.get_retry_policy()
+        if isinstance(retry, tintri.TintriRetryPolicy):
+            (retry_policy, retry) = (retry, None)
+        started = time.time()
+        retries = 0
+
+        try:
+            while True:
+                try:
+                    r = await self._send_once(method, url, event, **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if retry_policy is None:
+                        raise
+                    delay = retry_policy.retry_delay(method, retries, started, None, retry)
+                    if delay is None:
+                        raise
+                else:
+                    if retry_policy is None:
+                        return r
+                    delay = retry_policy.retry_delay(method, retries, started, r, retry)
+                    if delay is None:
+                        return r
+
+                retries += 1
+                if event is not None:
+                    event.retries = retries
+                    event.timings['backoff'] += delay
+                await asyncio.sleep(delay)
+        except aiohttp.ClientResponseError:
+            raise tintri.TintriRequestsException(prefix + "HTTP error occurred.")
+        except aiohttp.ServerTimeoutError:
+            raise tintri.TintriRequestsException(prefix + "Request timed out.")
+        except aiohttp.ClientConnectionError:
+            raise tintri.TintriRequestsException(prefix + "API Connection error occurred.")
+        except asyncio.TimeoutError:
+            raise tintri.TintriRequestsException(prefix + "Request timed out.")
+        except Exception:
+            raise tintri.TintriRequestsException(prefix + "An unexpected error " +
+                                                 str(sys.exc_info()[0]) + " occurred.")
+
+
+    # Send a request once.  Each attempt waits on the tintri_1_1 governor,
+    # if one is set, with the same rate limit per server and endpoint class
+    # as the tintri_1_1 helpers.
+    async def _send_once(self, method, url, event, **kwargs):
+        governor = tintri.get_governor()
+        if governor is None:
+            return await self._send(method, url, event, **kwargs)
+
+        server_name = tintri.requests.compat.urlparse(url).netloc
+        rate_limit = governor.get_rate_limit(server_name, method, url)
+        waited = await _acquire(rate_limit)
+        if event is not None:
+            event.timings['throttle'] += waited
+
+        start = time.time()
+        try:
+            r = await self._send(method, url, event, **kwargs)
+        except BaseException:
+            rate_limit.release(time.time() - start, None)
+            raise
+        rate_limit.release(time.time() - start, r.status_code)
+        return r
+
+
+    async def _send(self, method, url, event, **kwargs):
+        if event is not None:
+            kwargs['trace_request_ctx'] = event
+
+        async with self._semaphore:
+            start = time.time()
+            async with self._http.request(method, url, **kwargs) as resp:
+                headers_received = time.time()
+                content = await resp.read()
+                if event is not None:
+                    timings = event.timings
+                    timings['server'] = max(0.0, headers_received - start -
+                                            timings['dns'] - timings['connect'])
+                    timings['transfer'] = time.time() - headers_received
+                cookies = dict((name, morsel.value) for name, morsel in resp.cookies.items())
+                return TintriAsyncResponse(resp.status, resp.headers, content, cookies)
+
+
+    # API GET without query string.  The session ID can be 'None'.
+    async def api_get(self, server_name, api, session_id=None):
+        return await self.api_get_query(server_name, api, None, session_id)
+
+
+    # API GET with query string.  The query and session ID can be 'None'.
+    async def api_get_query(self, server_name, api, query, session_id):
+        headers = {'content-type': 'application/json'}
+        if session_id is not None:
+            headers['cookie'] = 'JSESSIONID=' + session_id
+
+        url = tintri.api_url(server_name, api)
+
+        r = await self.api_request('GET', url, "GET: ", headers=headers,
+                                   params=_query_params(query))
+
+        # if HTTP Response is not 200 then raise an exception
+        if r.status_code != 200:
+            message = "The HTTP response for get call to the server is not 200."
+            if (query is None):
+                raise tintri.TintriApiException(message, r.status_code, url, "No Payload", r.text)
+            else:
+                raise tintri.TintriApiException(message, r.status_code, url, query, r.text)
+
+        return r
+
+
+    # API DELETE.
+    async def api_delete(self, server_name, api, session_id):
+        headers = {'content-type': 'application/json',
+                   'cookie': 'JSESSIONID='+session_id }
+
+        url = tintri.api_url(server_name, api)
+        return await self.api_request('DELETE', url, headers=headers)
+
+
+    # PUT
+    async def api_put(self, server_name, api, payload, session_id):
+        headers = {'content-type': 'application/json',
+                   'cookie': 'JSESSIONID='+session_id }
+
+        url = tintri.api_url(server_name, api)
+        return await self.api_request('PUT', url, data=tintri.json_dumps(payload), headers=headers)
+
+
+    # POST.  POSTs are not retried unless retry is True.
+    async def api_post(self, server_name, api, payload, session_id, retry=None):
+        headers = {'content-type': 'application/json',
+                   'cookie': 'JSESSIONID='+session_id }
+
+        url = tintri.api_url(server_name, api)
+        return await self.api_request('POST', url, retry=retry, data=tintri.json_dumps(payload),
+                                      headers=headers)
+
+
+    # Login.  Returns the session ID.
+    async def api_login(self, server_name, user_name, password):
+        headers = {'content-type': 'application/json'}
+        payload = {'username': user_name,
+                   'password': password,
+                   'typeId': 'com.tintri.api.rest.vcommon.dto.rbac.RestApiCredentials'}
+        url_login = tintri.api_url(server_name, '/v310/session/login')
+
+        r = await self.api_request('POST', url_login, "Login: ", retry=True,
+                                   data=tintri.json_dumps(payload), headers=headers)
+
+        # if HTTP Response is not 200 then raise an exception
+        if r.status_code != 200:
+            message = "The HTTP response for login call to the server is not 200."
+            raise tintri.TintriApiException(message, r.status_code, url_login, str(payload), r.text)
+
+        return r.cookies['JSESSIONID']
+
+
+    # Logout
+    async def api_logout(self, server_name, session_id):
+        headers = {'content-type': 'application/json',
+                   'cookie': 'JSESSIONID='+session_id }
+        url_logout = tintri.api_url(server_name, '/v310/session/logout')
+
+        r = await self.api_request('GET', url_logout, "Logout: ", headers=headers)
+
+        # if HTTP Response is not 204 then raise an exception
+        if r.status_code != 204:
+            message = "The HTTP response for logout call to the server is not 204."
+            raise tintri.TintriApiException(message, r.status_code, url_logout, "No Payload", r.text)
+
+
+    # Return API version information
+    async def api_version(self, server_name):
+        return await self.api_get(server_name, '/info')
+
+
+    # Async generator that yields the items of a collection API in order.
+    # The first page returns filteredTotal; the remaining offset/limit
+    # windows are fetched with at most max_workers pages in flight.
+    # include_fields is an optional list of the item fields to return.
+    # With fields the items are tuples, see tintri_1_1.TintriPaginator.
+    async def iter_collection(self, server_name, api, query, session_id,
+                              page_size=tintri.DEFAULT_PAGE_SIZE,
+                              max_workers=tintri.DEFAULT_PAGE_WORKERS,
+                              include_fields=None, fields=None):
+        if page_size < 1:
+            raise ValueError("Page size must be at least 1, not " + str(page_size))
+        if include_fields is None and fields is not None:
+            include_fields = sorted(set(field.split('.')[0] for field in fields))
+
+        async def get_page(offset):
+            page_query = dict(query) if query is not None else {}
+            page_query['offset'] = offset
+            page_query['limit'] = page_size
+            if include_fields is not None:
+                page_query['includeFields'] = include_fields
+            r = await self.api_get_query(server_name, api, page_query, session_id)
+            if fields is None:
+                return r.json()
+
+            (page_total, items) = tintri.decode_page_fields(r.content, fields)
+            return {'filteredTotal': page_total, 'items': items}
+
+        page = await get_page(0)
+        total = int(page["filteredTotal"])
+        for item in page["items"]:
+            yield item
+
+        offsets = iter(range(page_size, total, page_size))
+        pending = []
+        try:
+            for offset in offsets:
+                pending.append(asyncio.ensure_future(get_page(offset)))
+                if len(pending) >= max(1, max_workers):
+                    break
+
+            while pending:
+                page = await pending.pop(0)
+                for offset in offsets:
+                    pending.append(asyncio.ensure_future(get_page(offset)))
+                    break
+
+                for item in page["items"]:
+                    yield item
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+# An aiohttp trace config that times the name resolution and the connect
+# of new connections into the TintriRequestEvent passed as
+# trace_request_ctx.
+def _timing_trace_config():
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_dns_start(session, context, params):
+        context.dns_start = time.time()
+
+    async def on_dns_end(session, context, params):
+        if isinstance(context.trace_request_ctx, tintri.TintriRequestEvent):
+            context.trace_request_ctx.timings['dns'] = time.time() - context.dns_start
+
+    async def on_connect_start(session, context, params):
+        context.connect_start = time.time()
+
+    async def on_connect_end(session, context, params):
+        if isinstance(context.trace_request_ctx, tintri.TintriRequestEvent):
+            timings = context.trace_request_ctx.timings
+            timings['connect'] = max(0.0, time.time() - context.connect_start - timings['dns'])
+
+    trace_config.on_dns_resolvehost_start.append(on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_end)
+    trace_config.on_connection_create_start.append(on_connect_start)
+    trace_config.on_connection_create_end.append(on_connect_end)
+    return trace_config
+
+
+# aiohttp only takes string query values.
+def _query_params(query):
+    if query is None:
+        return None
+
+    params = []
+    for key, value in query.items():
+        if isinstance(value, (list, tuple)):
+            params.extend((key, str(v)) for v in value)
+        else:
+            params.append((key, str(value)))
+    return params
+
+
+# Run func(item) for every item with at most concurrency calls at a time.
+# Returns the results in item order; a call that raised returns its
+# exception instead of a result.
+async def run_all(func, items, concurrency=DEFAULT_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*[run_one(item) for item in items],
+                                return_exceptions=True)
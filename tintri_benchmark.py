@@ -0,0 +1,381 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tintri_1_1 as tintri
+import tintri_metrics
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+"""
+ Benchmarks the core example flows through tintri_1_1 against a TGC,
+ a VMstore or a local mock server, and writes the results to a JSON file
+ so that runs before and after a change to tintri_1_1 can be compared.
+
+ For each flow it reports the p50/p95/p99 request latency, the requests
+ per second, the bytes received and the peak RSS of the process, and a
+ per-endpoint breakdown from the tintri_1_1 request hooks.
+
+ The flows are:
+   paginate  - list all VMs page by page, as get_vms_paged.py
+   vm_stats  - collect the latest stats of the live VMs, as get_vm_stats.py
+   sg_add    - add VMs to a service group in batches, as add_vms_to_service_group.py
+   affinity  - set VM affinity rules concurrently, as set_reco_vm_affinity.py
+   report    - create and download a VM report, as reports/get_vm_report.py
+
+ sg_add and affinity change the server, so against a real server they
+ only run with --allow_writes.
+
+ Command usage:
+ tintri_benchmark.py [--mock [--vms N]] [server_name user_name password]
+                     [--flows paginate,vm_stats] [--iterations 3] [--output benchmark.json]
+
+"""
+
+FLOWS = ['paginate', 'vm_stats', 'sg_add', 'affinity', 'report']
+WRITE_FLOWS = ['sg_add', 'affinity']
+
+BEANS = "com.tintri.api.rest.v310.dto.domain.beans."
+
+# For exhaustive messages on console, make it to True; otherwise keep it False
+debug_mode = False
+
+
+def print_with_prefix(prefix, out):
+    print(prefix + out)
+    return
+
+
+def print_debug(out):
+    if debug_mode:
+        print_with_prefix("[DEBUG] : ", out)
+    return
+
+
+def print_info(out):
+    print_with_prefix("[INFO] : ", out)
+    return
+
+
+def print_error(out):
+    print_with_prefix("[ERROR] : ", out)
+    return
+
+
+# Records the latency and size of each request with the tintri_1_1
+# request hooks, plus a histogram per endpoint.
+class ResponseRecorder(tintri.TintriRequestHook):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histogram = tintri_metrics.TintriRequestHistogram()
+        self.reset()
+
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+            self.num_bytes = 0
+            self.errors = 0
+            self.retries = 0
+        self.histogram.reset()
+
+
+    def after_request(self, event):
+        with self._lock:
+            self.latencies.append(event.timings['total'])
+            if event.bytes is not None:
+                self.num_bytes += event.bytes
+            if event.error is not None or event.status >= 500:
+                self.errors += 1
+            self.retries += event.retries
+        self.histogram.after_request(event)
+
+
+# Nearest rank percentile of a sorted list.
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = int(round(percent / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+# Peak resident set size of the process in KiB.  The peak never goes
+# down, so later flows report at least the peak of the earlier ones.
+def peak_rss_kib():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak // 1024
+    return peak
+
+
+# Return the VM UUIDs to change in the write flows.
+def get_vm_uuids(server_name, session_id, options):
+    vm_uuids = []
+    for vm in tintri.iter_collection(server_name, "/v310/vm", None, session_id,
+                                     options.page_size, include_fields=tintri.VM_UUID_FIELDS):
+        vm_uuids.append(vm["uuid"]["uuid"])
+        if len(vm_uuids) >= options.write_vms:
+            break
+    return vm_uuids
+
+
+def flow_paginate(server_name, session_id, options):
+    count = 0
+    vm_pages = tintri.api_paginator(server_name, "/v310/vm", None, session_id,
+                                    options.page_size, options.workers,
+                                    tintri.VM_NAME_UUID_FIELDS)
+    for vm in vm_pages:
+        count += 1
+    return count
+
+
+def flow_vm_stats(server_name, session_id, options):
+    count = 0
+    for vm in tintri.iter_collection(server_name, "/v310/vm", {'live': "TRUE"}, session_id,
+                                     options.page_size, options.workers,
+                                     tintri.VM_STAT_FIELDS):
+        sorted_stats = vm["stat"]["sortedStats"]
+        if len(sorted_stats) > 0:
+            count += 1
+    return count
+
+
+def flow_sg_add(server_name, session_id, options, vm_uuids):
+    r = tintri.api_get(server_name, "/v310/servicegroup", session_id)
+    service_groups = r.json()["items"]
+    if len(service_groups) == 0:
+        raise tintri.TintriRequestsException("No Service Groups present")
+    sg_uuid = service_groups[0]["uuid"]["uuid"]
+    add_members_url = "/v310/servicegroup/" + sg_uuid + "/members/static"
+
+    for start in range(0, len(vm_uuids), options.batch_size):
+        members_to_add = {'typeId': 'com.tintri.api.rest.v310.dto.CollectionChangeRequest',
+                          'objectIdsAdded': vm_uuids[start:start + options.batch_size]}
+        r = tintri.api_put(server_name, add_members_url, members_to_add, session_id)
+        if r.status_code != 204:
+            raise tintri.TintriApiException("Add to service group failed.", r.status_code,
+                                            add_members_url, "", r.text)
+    return len(vm_uuids)
+
+
+def flow_affinity(server_name, session_id, options, vm_uuids):
+    affinity_rule = {"typeId": BEANS + "vm.VirtualMachineAffinityRule"}
+
+    def put_affinity(vm_uuid):
+        return tintri.api_put(server_name, "/v310/vm/" + vm_uuid + "/affinity",
+                              affinity_rule, session_id)
+
+    executor = ThreadPoolExecutor(max_workers=options.workers)
+    try:
+        failed = [r for r in executor.map(put_affinity, vm_uuids) if r.status_code != 204]
+    finally:
+        executor.shutdown()
+    if failed:
+        raise tintri.TintriApiException(str(len(failed)) + " affinity rules failed.",
+                                        failed[0].status_code, "affinity", "", failed[0].text)
+    return len(vm_uuids)
+
+
+def flow_report(server_name, session_id, options):
+    url = "/v310/vm/vmListDownloadable"
+    report_filter = {"typeId": BEANS + "vm.VirtualMachineDownloadableReportFilter",
+                     "attachment": "benchmark.csv",
+                     "attributes": ["VmName", "Uuid", "VMstoreName", "SpaceUsedGiB"],
+                     "since": "",
+                     "until": "",
+                     "format": "CSV"}
+    r = tintri.api_post(server_name, url, report_filter, session_id)
+    if r.status_code != 200:
+        raise tintri.TintriApiException("Report request failed.", r.status_code,
+                                        url, report_filter, r.text)
+
+    (handle, file_name) = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+        tintri.download_file(server_name, r.text, session_id, file_name)
+        return os.path.getsize(file_name)
+    finally:
+        os.remove(file_name)
+
+
+# Run a flow for a number of iterations and return its results.
+def run_flow(flow, server_name, session_id, options, recorder):
+    print_info("Running " + flow + " for " + str(options.iterations) + " iterations.")
+
+    args = (server_name, session_id, options)
+    if flow in WRITE_FLOWS:
+        args += (get_vm_uuids(server_name, session_id, options),)
+    run = globals()["flow_" + flow]
+
+    recorder.reset()
+    durations = []
+    items = 0
+    error = None
+    start = time.time()
+    for iteration in range(options.iterations):
+        iteration_start = time.time()
+        try:
+            items = run(*args)
+        except (tintri.TintriRequestsException, tintri.TintriApiException) as e:
+            error = e.__str__()
+            print_error(flow + ": " + error)
+            break
+        durations.append(time.time() - iteration_start)
+    elapsed = time.time() - start
+
+    latencies = sorted(recorder.latencies)
+    result = {'iterations': len(durations),
+              'items': items,
+              'requests': len(latencies),
+              'server_errors': recorder.errors,
+              'retries': recorder.retries,
+              'elapsed_s': round(elapsed, 4),
+              'iteration_s': [round(duration, 4) for duration in durations],
+              'requests_per_s': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+              'bytes': recorder.num_bytes,
+              'peak_rss_kib': peak_rss_kib(),
+              'endpoints': recorder.histogram.snapshot()}
+    for percent in (50, 95, 99):
+        value = percentile(latencies, percent)
+        result['p' + str(percent) + '_ms'] = round(value * 1000, 3) if value is not None else None
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def print_results(results):
+    print("")
+    print("%-10s %8s %10s %10s %10s %10s %12s %10s" %
+          ("flow", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms", "bytes", "rss KiB"))
+    for flow in results:
+        result = results[flow]
+        print("%-10s %8s %10s %10s %10s %10s %12s %10s" %
+              (flow, result['requests'], result['requests_per_s'], result['p50_ms'],
+               result['p95_ms'], result['p99_ms'], result['bytes'], result['peak_rss_kib']))
+
+
+# main
+parser = argparse.ArgumentParser(description="Benchmark the tintri_1_1 example flows")
+
+parser.add_argument("server_name", nargs="?", help="TGC or VMstore server name or IP address")
+parser.add_argument("user_name", nargs="?", default="admin", help="user name")
+parser.add_argument("password", nargs="?", default="", help="password")
+parser.add_argument("--mock", action="store_true",
+                    help="benchmark against an in-process tintri_mock_server")
+parser.add_argument("--vms", type=int, default=1000, help="number of VMs of the mock server")
+parser.add_argument("--latency_ms", type=float, default=0.0,
+                    help="latency of every endpoint of the mock server")
+parser.add_argument("--error_rate", type=float, default=0.0,
+                    help="fraction of the mock server requests answered 503 busy")
+parser.add_argument("--flows", default=",".join(FLOWS),
+                    help="comma separated flows to run. Default: " + ",".join(FLOWS))
+parser.add_argument("--iterations", type=int, default=3, help="iterations per flow")
+parser.add_argument("--page_size", type=int, default=tintri.DEFAULT_PAGE_SIZE,
+                    help="page size of the VM listings")
+parser.add_argument("--workers", type=int, default=tintri.DEFAULT_PAGE_WORKERS,
+                    help="concurrent requests of the paged and affinity flows")
+parser.add_argument("--batch_size", type=int, default=100,
+                    help="VMs per service group add")
+parser.add_argument("--write_vms", type=int, default=200,
+                    help="VMs changed by the sg_add and affinity flows")
+parser.add_argument("--allow_writes", action="store_true",
+                    help="run the sg_add and affinity flows against a real server")
+parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+parser.add_argument("--label", default="", help="label stored with the results")
+
+options = parser.parse_args()
+
+flows = [flow.strip() for flow in options.flows.split(",") if flow.strip()]
+for flow in flows:
+    if flow not in FLOWS:
+        parser.error("unknown flow " + flow + ".  Flows are " + ", ".join(FLOWS))
+
+mock_server = None
+if options.mock:
+    import tintri_mock_server
+    inventory = tintri_mock_server.MockInventory(num_vms=options.vms)
+    mock_server = tintri_mock_server.TintriMockServer(
+        inventory=inventory, default_latency=options.latency_ms / 1000.0,
+        default_error_rate=options.error_rate).start()
+    tintri.API_SCHEME = "http"
+    server_name = mock_server.server_host
+    print_info("Mock server with " + str(options.vms) + " VMs at " + server_name)
+elif options.server_name is None:
+    parser.error("server_name is required without --mock")
+else:
+    server_name = options.server_name
+    if not options.allow_writes:
+        skipped = [flow for flow in flows if flow in WRITE_FLOWS]
+        if skipped:
+            print_info("Skipping " + ", ".join(skipped) + " without --allow_writes.")
+        flows = [flow for flow in flows if flow not in WRITE_FLOWS]
+
+recorder = ResponseRecorder()
+tintri.add_request_hook(recorder)
+
+session_id = None
+results = {}
+try:
+    session_id = tintri.api_login(server_name, options.user_name, options.password)
+    for flow in flows:
+        results[flow] = run_flow(flow, server_name, session_id, options, recorder)
+except tintri.TintriRequestsException as tre:
+    print_error(tre.__str__())
+    sys.exit(2)
+except tintri.TintriApiException as tae:
+    print_error(tae.__str__())
+    sys.exit(3)
+finally:
+    if session_id is not None:
+        tintri.api_logout(server_name, session_id)
+    if mock_server is not None:
+        mock_server.stop()
+
+print_results(results)
+
+run_info = {'label': options.label,
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+            'target': "mock" if options.mock else server_name,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': vars(options),
+            'flows': results}
+del run_info['options']['password']
+with open(options.output, 'w') as output_file:
+    json.dump(run_info, output_file, indent=2, sort_keys=True)
+print_info("Results written to " + options.output)
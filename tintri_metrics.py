@@ -0,0 +1,273 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import json
+import threading
+import tintri_1_1 as tintri
+
+"""
+ Request hooks for tintri_1_1 that show where the time of the API calls
+ goes:
+
+   TintriRequestHistogram - aggregates latency histograms, bytes, errors,
+                            retries and phase timings per endpoint in
+                            process
+   TintriPrometheusSink   - a histogram that renders the Prometheus text
+                            exposition format
+   TintriJsonLinesSink    - writes one JSON line per request to a trace file
+
+ Example:
+     histogram = tintri_metrics.TintriRequestHistogram()
+     tintri.add_request_hook(histogram)
+     ...
+     print(histogram.report())
+
+ This library was NOT designed to be a general purpose Python library.
+
+"""
+
+# Latency histogram bucket upper bounds in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Phases summed per endpoint.
+PHASES = ('dns', 'connect', 'tls', 'server', 'transfer', 'decode', 'backoff', 'throttle')
+
+
+# The statistics of one method and endpoint.
+class EndpointStats:
+    def __init__(self, method, endpoint, buckets):
+        self.method = method
+        self.endpoint = endpoint
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+        self.statuses = {}
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+
+    def add(self, event):
+        timings = event.timings
+        latency = timings['total']
+
+        self.count += 1
+        self.total += latency
+        self.retries += event.retries
+        if event.bytes is not None:
+            self.bytes += event.bytes
+        if event.error is not None or (event.status is not None and event.status >= 500):
+            self.errors += 1
+        status = str(event.status) if event.status is not None else "error"
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        for phase in PHASES:
+            self.phases[phase] += timings.get(phase, 0.0)
+
+        index = 0
+        while index < len(self.buckets) and latency > self.buckets[index]:
+            index += 1
+        self.bucket_counts[index] += 1
+
+
+    # Estimate a percentile from the histogram, interpolating within the
+    # bucket.  Above the last bucket the last bound is returned.
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            if index == len(self.buckets):
+                return self.buckets[-1]
+            upper = self.buckets[index]
+            if bucket_count > 0 and seen + bucket_count >= rank:
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.buckets[-1]
+
+
+    def as_dict(self):
+        result = {'method': self.method,
+                  'endpoint': self.endpoint,
+                  'count': self.count,
+                  'errors': self.errors,
+                  'retries': self.retries,
+                  'bytes': self.bytes,
+                  'total_s': self.total,
+                  'mean_s': self.total / self.count if self.count else None,
+                  'statuses': dict(self.statuses),
+                  'phases_s': dict(self.phases)}
+        for percent in (50, 95, 99):
+            result['p' + str(percent) + '_s'] = self.percentile(percent)
+        return result
+
+
+# Aggregates the requests per method and endpoint template.
+class TintriRequestHistogram(tintri.TintriRequestHook):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+
+    def after_request(self, event):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = EndpointStats(event.method, event.endpoint, self.buckets)
+                self._stats[key] = stats
+            stats.add(event)
+
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+    # Return the statistics of each endpoint as dictionaries, the endpoints
+    # with the most total time first.
+    def snapshot(self):
+        with self._lock:
+            stats = [endpoint_stats.as_dict() for endpoint_stats in self._stats.values()]
+        return sorted(stats, key=lambda s: s['total_s'], reverse=True)
+
+
+    # Return a text table of the endpoints, slowest total first.
+    def report(self):
+        lines = ["%-6s %-45s %7s %6s %7s %9s %9s %9s %9s %12s" %
+                 ("method", "endpoint", "count", "errors", "retries", "mean ms", "p95 ms",
+                  "server ms", "decode ms", "bytes")]
+        for stats in self.snapshot():
+            count = stats['count']
+            lines.append("%-6s %-45s %7d %6d %7d %9.1f %9.1f %9.1f %9.1f %12d" %
+                         (stats['method'], stats['endpoint'], count, stats['errors'],
+                          stats['retries'],
+                          stats['mean_s'] * 1000, stats['p95_s'] * 1000,
+                          stats['phases_s']['server'] * 1000 / count,
+                          stats['phases_s']['decode'] * 1000 / count,
+                          stats['bytes']))
+        return "\n".join(lines)
+
+
+# Escape a Prometheus label value.
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(stats, **extra):
+    labels = [('method', stats.method), ('endpoint', stats.endpoint)]
+    labels.extend(sorted(extra.items()))
+    return "{" + ",".join('%s="%s"' % (name, _label_value(value))
+                          for (name, value) in labels) + "}"
+
+
+# A histogram that renders the Prometheus text exposition format, e.g. for
+# the node_exporter textfile collector.
+class TintriPrometheusSink(TintriRequestHistogram):
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix="tintri_api"):
+        TintriRequestHistogram.__init__(self, buckets)
+        self.prefix = prefix
+
+
+    def exposition(self):
+        prefix = self.prefix
+        with self._lock:
+            all_stats = sorted(self._stats.values(), key=lambda s: (s.endpoint, s.method))
+            lines = ["# HELP " + prefix + "_request_duration_seconds API request latency.",
+                     "# TYPE " + prefix + "_request_duration_seconds histogram"]
+            for stats in all_stats:
+                cumulative = 0
+                for index, bound in enumerate(stats.buckets):
+                    cumulative += stats.bucket_counts[index]
+                    lines.append(prefix + "_request_duration_seconds_bucket" +
+                                 _labels(stats, le=repr(float(bound))) + " " + str(cumulative))
+                lines.append(prefix + "_request_duration_seconds_bucket" +
+                             _labels(stats, le="+Inf") + " " + str(stats.count))
+                lines.append(prefix + "_request_duration_seconds_sum" + _labels(stats) +
+                             " " + repr(stats.total))
+                lines.append(prefix + "_request_duration_seconds_count" + _labels(stats) +
+                             " " + str(stats.count))
+
+            counters = [('requests_total', "API requests by status.", None),
+                        ('errors_total', "API requests that failed or returned 5xx.", 'errors'),
+                        ('retries_total', "API request retries.", 'retries'),
+                        ('response_bytes_total', "API response body bytes.", 'bytes')]
+            for (name, help_text, attribute) in counters:
+                lines.append("# HELP " + prefix + "_" + name + " " + help_text)
+                lines.append("# TYPE " + prefix + "_" + name + " counter")
+                for stats in all_stats:
+                    if attribute is None:
+                        for status in sorted(stats.statuses):
+                            lines.append(prefix + "_" + name + _labels(stats, status=status) +
+                                         " " + str(stats.statuses[status]))
+                    else:
+                        lines.append(prefix + "_" + name + _labels(stats) + " " +
+                                     str(getattr(stats, attribute)))
+
+            lines.append("# HELP " + prefix + "_phase_seconds_total Time spent per request phase.")
+            lines.append("# TYPE " + prefix + "_phase_seconds_total counter")
+            for stats in all_stats:
+                for phase in PHASES:
+                    lines.append(prefix + "_phase_seconds_total" + _labels(stats, phase=phase) +
+                                 " " + repr(stats.phases[phase]))
+        return "\n".join(lines) + "\n"
+
+
+    # Write the exposition to a file.  The file is replaced atomically so
+    # a collector never reads a partial file.
+    def write(self, file_name):
+        tmp_file = file_name + ".tmp"
+        with open(tmp_file, 'w') as prom_file:
+            prom_file.write(self.exposition())
+        os.rename(tmp_file, file_name)
+
+
+# Writes each request as a JSON line to a trace file.
+class TintriJsonLinesSink(tintri.TintriRequestHook):
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._file = open(file_name, 'a')
+
+
+    def after_request(self, event):
+        line = json.dumps(event.as_dict(), sort_keys=True) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self._file.flush()
+
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
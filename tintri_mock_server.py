@@ -0,0 +1,806 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import re
+import ssl
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import calendar
+import threading
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+try:
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+"""
+ A local stand-in for a Tintri VMstore or Tintri Global Center, for
+ benchmarking and regression testing the examples and tintri_1_1 without
+ an appliance.  It serves a synthetic inventory of VMs, VMstores and
+ service groups, with a configurable latency and rate of 503 busy
+ responses per endpoint.
+
+ The examples use https by default.  Either give the server a
+ certificate with --certfile and --keyfile, or run the examples with
+ TINTRI_API_SCHEME=http.
+
+ Command usage:
+ tintri_mock_server.py [--port 8443] [--vms 1000] [--vmstores 4]
+                       [--service_groups 8] [--latency 'GET /v310/vm=50']
+                       [--error_rate 'PUT /v310/vm/{uuid}/affinity=0.1']
+
+ Example:
+   tintri_mock_server.py --port 8080 --vms 15000 --latency 'GET /v310/vm=200'
+   TINTRI_API_SCHEME=http get_vms_paged.py localhost:8080 admin password
+
+ Requires Python 3.
+
+"""
+
+BEANS = "com.tintri.api.rest.v310.dto.domain.beans."
+API = "/api"
+API_VERSION = "v310.51"
+
+# Stat fields in the synthetic VM stats.
+STAT_FIELDS = ['spaceUsedGiB', 'spaceProvisionedGiB', 'operationsTotalIops',
+               'operationsReadIops', 'operationsWriteIops', 'latencyTotalMs',
+               'latencyHostMs', 'latencyNetworkMs', 'latencyStorageMs',
+               'latencyDiskMs', 'throughputTotalMBps', 'flashHitPercent']
+
+# Minutes between the samples of the historical stats.
+STAT_INTERVAL_MINUTES = 10
+
+UUID_RE = re.compile(r"[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Za-z-]+")
+
+
+# Return the endpoint template of a path, with UUIDs collapsed to {uuid}.
+def endpoint_template(method, path):
+    return method + " " + UUID_RE.sub("{uuid}", path)
+
+
+# Return a VM or object UUID in the Tintri format.
+def new_uuid(rand, suffix):
+    return str(uuid.UUID(int=rand.getrandbits(128))).upper() + "-" + suffix
+
+
+# A synthetic inventory of VMs, VMstores, service groups and pools.
+class MockInventory:
+    def __init__(self, num_vms=1000, num_vmstores=4, num_service_groups=8,
+                 num_pools=2, seed=1):
+        rand = random.Random(seed)
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+        self.vmstores = ["vmstore%02d" % i for i in range(num_vmstores)]
+
+        self.service_groups = []
+        for i in range(num_service_groups):
+            self.service_groups.append({'name': "sg%02d" % i,
+                                        'uuid': new_uuid(rand, "SG-00000000000000000000"),
+                                        'members': set()})
+
+        self.pools = []
+        for i in range(num_pools):
+            self.pools.append({'name': "pool%02d" % i,
+                               'uuid': new_uuid(rand, "POOL-0000000000000000000"),
+                               'vmstores': self.vmstores[i::num_pools]})
+
+        self.vms = []
+        self.vms_by_uuid = {}
+        for i in range(num_vms):
+            vm_uuid = new_uuid(rand, "VIM-00000000000000000000")
+            stats = {}
+            for field in STAT_FIELDS:
+                stats[field] = round(rand.uniform(0, 1000), 2)
+            vm = {'uuid': vm_uuid,
+                  'name': "vm%06d" % i,
+                  'vmstore': self.vmstores[i % num_vmstores],
+                  'live': (i % 20) != 19,
+                  'stats': stats,
+                  'qos': {'minNormalizedIops': 0, 'maxNormalizedIops': 0},
+                  'affinity': None}
+            self.vms.append(vm)
+            self.vms_by_uuid[vm_uuid] = vm
+
+        # Put every VM in one service group.
+        for i, vm in enumerate(self.vms):
+            if num_service_groups > 0:
+                self.service_groups[i % num_service_groups]['members'].add(vm['uuid'])
+
+
+    def get_service_group(self, sg_uuid):
+        for sg in self.service_groups:
+            if sg['uuid'] == sg_uuid:
+                return sg
+        return None
+
+
+    def get_pool(self, pool_uuid):
+        for pool in self.pools:
+            if pool['uuid'] == pool_uuid:
+                return pool
+        return None
+
+
+    # Return the latest stats of a VM at a time, varying over time.
+    def stats_at(self, vm, at_time):
+        stats = {}
+        # The field index offsets the wave of each field, so the stats are
+        # the same in every run.
+        for (index, field) in enumerate(STAT_FIELDS):
+            wave = 1.0 + 0.25 * ((int(at_time) // 600 + index) % 8) / 8.0
+            stats[field] = round(vm['stats'][field] * wave, 2)
+        stats['timeEnd'] = format_time(at_time)
+        stats['typeId'] = BEANS + "stat.VirtualMachineStat"
+        return stats
+
+
+    # Return the VM DTO.
+    def vm_dto(self, vm):
+        sg_ids = [sg['uuid'] for sg in self.service_groups if vm['uuid'] in sg['members']]
+        now = time.time()
+        return {'typeId': BEANS + "vm.VirtualMachine",
+                'uuid': {'typeId': "com.tintri.api.rest.vcommon.dto.Uuid",
+                         'uuid': vm['uuid']},
+                'vmware': {'typeId': BEANS + "vm.VirtualMachineVMware",
+                           'name': vm['name'],
+                           'vcenterName': "vcenter01",
+                           'isPowered': vm['live']},
+                'vmstoreName': vm['vmstore'],
+                'isLive': vm['live'],
+                'serviceGroupIds': sg_ids,
+                'qosConfig': dict(vm['qos'], typeId=BEANS + "vm.VirtualMachineQoSConfig"),
+                'stat': {'typeId': BEANS + "stat.VirtualMachineStatSummary",
+                         'sortedStats': [self.stats_at(vm, now - (now % 600))]}}
+
+
+# Return a time in the Tintri API format.
+def format_time(at_time):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(at_time))
+
+
+# Parse a time in the Tintri API format or epoch seconds.
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    value = value.split(".")[0].rstrip("Z")
+    return calendar.timegm(time.strptime(value, "%Y-%m-%dT%H:%M:%S"))
+
+
+# Keep only the included top level fields of a DTO.
+def project(dto, include_fields):
+    if not include_fields:
+        return dto
+    projected = {'typeId': dto['typeId']}
+    for field in include_fields:
+        if field in dto:
+            projected[field] = dto[field]
+    return projected
+
+
+# The request handler.  Each do_* method dispatches on the path.
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "TintriMock/1.0"
+
+    # The headers and body are separate writes.  Without TCP_NODELAY the
+    # body waits for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+
+    def do_HEAD(self):
+        self.dispatch('HEAD')
+
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        path = url.path
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length > 0 else b""
+        self.payload = json.loads(body.decode('utf-8')) if body else None
+
+        template = endpoint_template(method, path[len(API):] if path.startswith(API) else path)
+        self.server.count_request(template)
+        latency = self.server.get_latency(template)
+        if latency > 0:
+            time.sleep(latency)
+
+        if self.server.is_busy(template):
+            headers = {}
+            if self.server.retry_after is not None:
+                headers['Retry-After'] = str(self.server.retry_after)
+            return self.send_json(503, {'message': "Server busy"}, headers)
+
+        if path.startswith("/reports/"):
+            return self.send_report(method, path[len("/reports/"):])
+
+        if not path.startswith(API):
+            return self.send_json(404, {'message': "Not found"})
+        path = path[len(API):]
+
+        if path == "/info":
+            return self.send_json(200, self.server.info())
+        if path == "/v310/session/login" and method == 'POST':
+            return self.login()
+
+        # Everything else needs a session.
+        if not self.has_session():
+            return self.send_json(401, {'message': "Not logged in"})
+
+        for (route_method, route, handler) in ROUTES:
+            if route_method != method:
+                continue
+            match = route.match(path)
+            if match is not None:
+                return handler(self, *match.groups())
+
+        self.send_json(404, {'message': "Not found: " + method + " " + path})
+
+
+    def has_session(self):
+        cookie = self.headers.get('Cookie', "")
+        for part in cookie.split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "JSESSIONID" and value in self.server.sessions:
+                return True
+        return False
+
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_bytes(status, content, "application/json", headers)
+
+
+    def send_bytes(self, status, content, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+        self.server.count_bytes(len(content))
+
+
+    def send_empty(self, status=204):
+        self.send_response(status)
+        self.send_header('Content-Length', "0")
+        self.end_headers()
+
+
+    def get_param(self, name, default=None):
+        values = self.query.get(name)
+        if not values:
+            return default
+        return values[0]
+
+
+    def login(self):
+        credentials = self.payload or {}
+        if not self.server.check_credentials(credentials.get('username'),
+                                             credentials.get('password')):
+            return self.send_json(401, {'message': "Bad credentials"})
+        session_id = self.server.new_session()
+        self.send_json(200, {'typeId': "com.tintri.api.rest.vcommon.dto.rbac.RestApiCredentials"},
+                       {'Set-Cookie': "JSESSIONID=" + session_id + "; Path=/; HttpOnly"})
+
+
+    def logout(self):
+        cookie = self.headers.get('Cookie', "")
+        self.server.end_session(cookie.split("JSESSIONID=")[-1].split(";")[0])
+        self.send_empty()
+
+
+    # Send a page of a collection.
+    def send_page(self, items, dto=None):
+        offset = int(self.get_param('offset', 0))
+        limit = int(self.get_param('limit', self.server.default_limit))
+        include_fields = self.query.get('includeFields')
+
+        page = items[offset:offset + limit]
+        if dto is not None:
+            page = [project(dto(item), include_fields) for item in page]
+
+        result = {'typeId': "com.tintri.api.rest.v310.dto.Page",
+                  'absoluteTotal': len(items),
+                  'filteredTotal': len(items),
+                  'offset': offset,
+                  'limit': limit,
+                  'items': page}
+        if offset + limit < len(items):
+            next_query = [('offset', offset + limit), ('limit', limit)]
+            next_query += [(key, self.query[key]) for key in sorted(self.query)
+                           if key not in ('offset', 'limit')]
+            result['next'] = urlencode(next_query, doseq=True)
+        self.send_json(200, result)
+
+
+    def get_vms(self):
+        inventory = self.server.inventory
+        vms = inventory.vms
+        if self.get_param('live', "").upper() == "TRUE":
+            vms = [vm for vm in vms if vm['live']]
+        sg_uuid = self.get_param('serviceGroupIds')
+        if sg_uuid is not None:
+            sg = inventory.get_service_group(sg_uuid)
+            members = sg['members'] if sg is not None else set()
+            vms = [vm for vm in vms if vm['uuid'] in members]
+        name = self.get_param('name')
+        if name is not None:
+            vms = [vm for vm in vms if name in vm['name']]
+        self.send_page(vms, inventory.vm_dto)
+
+
+    def get_vm(self, vm_uuid):
+        vm = self.server.inventory.vms_by_uuid.get(vm_uuid)
+        if vm is None:
+            return self.send_json(404, {'message': "VM not found"})
+        self.send_json(200, self.server.inventory.vm_dto(vm))
+
+
+    # Historical stats of a VM from 'since' to 'until', one sample per
+    # STAT_INTERVAL_MINUTES.
+    def get_vm_stats_historic(self, vm_uuid):
+        inventory = self.server.inventory
+        vm = inventory.vms_by_uuid.get(vm_uuid)
+        if vm is None:
+            return self.send_json(404, {'message': "VM not found"})
+
+        interval = STAT_INTERVAL_MINUTES * 60
+        now = time.time()
+        until = parse_time(self.get_param('until')) if self.get_param('until') else now
+        since = parse_time(self.get_param('since')) if self.get_param('since') else until - 86400
+        until = min(until, now)
+        first = int(since // interval + 1) * interval
+
+        stats = []
+        at_time = first
+        while at_time <= until:
+            stats.append(inventory.stats_at(vm, at_time))
+            at_time += interval
+        self.send_json(200, {'typeId': BEANS + "stat.VirtualMachineStatSummary",
+                             'sortedStats': stats})
+
+
+    def put_vm_affinity(self, vm_uuid):
+        vm = self.server.inventory.vms_by_uuid.get(vm_uuid)
+        if vm is None:
+            return self.send_json(404, {'message': "VM not found"})
+        vm['affinity'] = (self.payload or {}).get('ruleType')
+        self.send_empty()
+
+
+    def put_vm_qos(self):
+        request = self.payload or {}
+        new_value = request.get('newValue', {})
+        for vm_uuid in request.get('ids', []):
+            vm = self.server.inventory.vms_by_uuid.get(vm_uuid)
+            if vm is None:
+                return self.send_json(400, {'message': "Unknown VM " + vm_uuid})
+            for name in request.get('propertyNames', []):
+                vm['qos'][name] = new_value.get(name)
+        self.send_empty()
+
+
+    def get_service_groups(self):
+        items = []
+        for sg in self.server.inventory.service_groups:
+            items.append({'typeId': BEANS + "sg.ServiceGroup",
+                          'name': sg['name'],
+                          'uuid': {'uuid': sg['uuid']},
+                          'memberCount': len(sg['members'])})
+        self.send_page(items)
+
+
+    # Apply a CollectionChangeRequest.  Unknown VMs fail the whole request.
+    def put_service_group_members(self, sg_uuid):
+        inventory = self.server.inventory
+        sg = inventory.get_service_group(sg_uuid)
+        if sg is None:
+            return self.send_json(404, {'message': "Service group not found"})
+
+        request = self.payload or {}
+        added = request.get('objectIdsAdded') or []
+        removed = request.get('objectIdsRemoved') or []
+        if not isinstance(added, list):
+            added = [added]
+        if not isinstance(removed, list):
+            removed = [removed]
+
+        for vm_uuid in added + removed:
+            if vm_uuid not in inventory.vms_by_uuid:
+                return self.send_json(400, {'message': "Unknown VM " + vm_uuid})
+        with inventory.lock:
+            sg['members'].update(added)
+            sg['members'].difference_update(removed)
+        self.send_empty()
+
+
+    def post_snapshot(self):
+        snapshot_uuids = []
+        for spec in self.payload or []:
+            if spec.get('sourceVmTintriUUID') not in self.server.inventory.vms_by_uuid:
+                return self.send_json(400, {'message': "Unknown VM"})
+            snapshot_uuids.append(str(uuid.uuid4()).upper() + "-SST-00000000000000000000")
+        self.send_json(200, snapshot_uuids)
+
+
+    def get_dns(self):
+        self.send_json(200, dict(self.server.dns,
+                                 typeId=BEANS + "hardware.ApplianceDns"))
+
+
+    def put_appliance(self):
+        request = self.payload or {}
+        new_appliance = request.get('objectsWithNewValues', {})
+        if 'dnsConfig' in request.get('propertiesToBeUpdated', []):
+            dns_config = new_appliance.get('dnsConfig', {})
+            self.server.dns['dnsPrimary'] = dns_config.get('dnsPrimary')
+            self.server.dns['dnsSecondary'] = dns_config.get('dnsSecondary')
+        self.send_empty()
+
+
+    def get_pools(self):
+        items = []
+        for pool in self.server.inventory.pools:
+            items.append({'typeId': BEANS + "vmstorepool.VmstorePool",
+                          'name': pool['name'],
+                          'uuid': {'uuid': pool['uuid']}})
+        self.send_page(items)
+
+
+    # Every other pool has a recommendation.
+    def get_current_reco(self, pool_uuid):
+        inventory = self.server.inventory
+        pool = inventory.get_pool(pool_uuid)
+        if pool is None:
+            return self.send_json(404, {'message': "Pool not found"})
+
+        index = inventory.pools.index(pool)
+        if index % 2 == 1 or len(pool['vmstores']) < 2:
+            return self.send_json(200, {'state': "NO_RECOMMENDATION_NEEDED"})
+
+        source = pool['vmstores'][0]
+        destination = pool['vmstores'][1]
+        vm = [vm for vm in inventory.vms if vm['vmstore'] == source][0]
+        self.send_json(200, {
+            'id': "RECO-" + pool_uuid,
+            'state': "AVAILABLE",
+            'issues': [{'vmStoreDisplayName': source,
+                        'spaceInfo': {'summary': "Space used is over 90 percent"}}],
+            'actionGroups': [{'actions': [{
+                'issueTypes': ["SPACE"],
+                'targetVmDisplayName': vm['name'],
+                'targetVmTintriUuid': vm['uuid'],
+                'sourceDatastoreDisplayName': source,
+                'destinationDatastoreDisplayName': destination}]}],
+            'expectedOutcomes': [
+                {'vmStoreDisplayName': source,
+                 'spaceInfo': {'issueType': "SPACE", 'spaceChangedPhysicalGiB': -100}},
+                {'vmStoreDisplayName': destination,
+                 'protectionInfo': {'issueType': "PROTECTION",
+                                    'vmTintriUuids': [vm['uuid']]}}]})
+
+
+    def accept_reco(self, pool_uuid, reco_uuid):
+        self.send_empty()
+
+
+    # Create a CSV report of the VMs and return its URL.
+    def post_vm_report(self):
+        report_filter = self.payload or {}
+        attributes = report_filter.get('attributes', ["VmName"])
+        report_id = self.server.new_report(attributes, report_filter)
+        host = self.headers.get('Host', "localhost")
+        scheme = "https" if self.server.use_tls else "http"
+        report_url = scheme + "://" + host + "/reports/" + report_id + ".csv"
+        self.send_bytes(200, report_url.encode('utf-8'), "text/plain")
+
+
+    # Serve a report.  Supports Range requests.
+    def send_report(self, method, name):
+        content = self.server.reports.get(name.split(".")[0])
+        if content is None:
+            return self.send_json(404, {'message': "Report not found"})
+
+        headers = {'Accept-Ranges': "bytes"}
+        range_header = self.headers.get('Range')
+        if range_header is None or not range_header.startswith("bytes="):
+            return self.send_bytes(200, content, "text/csv", headers)
+
+        start, _, end = range_header[len("bytes="):].partition("-")
+        start = int(start)
+        end = int(end) if end else len(content) - 1
+        if start >= len(content):
+            return self.send_bytes(416, b"", "text/csv",
+                                   {'Content-Range': "bytes */" + str(len(content))})
+        end = min(end, len(content) - 1)
+        headers['Content-Range'] = "bytes %d-%d/%d" % (start, end, len(content))
+        self.send_bytes(206, content[start:end + 1], "text/csv", headers)
+
+
+# Routes after /api, tried in order.
+ROUTES = [
+    ('GET', re.compile(r"^/v310/session/logout$"), MockHandler.logout),
+    ('GET', re.compile(r"^/v310/vm$"), MockHandler.get_vms),
+    ('PUT', re.compile(r"^/v310/vm/qosConfig$"), MockHandler.put_vm_qos),
+    ('POST', re.compile(r"^/v310/vm/vmListDownloadable$"), MockHandler.post_vm_report),
+    ('GET', re.compile(r"^/v310/vm/([^/]+)/statsHistoric$"), MockHandler.get_vm_stats_historic),
+    ('PUT', re.compile(r"^/v310/vm/([^/]+)/affinity$"), MockHandler.put_vm_affinity),
+    ('GET', re.compile(r"^/v310/vm/([^/]+)$"), MockHandler.get_vm),
+    ('GET', re.compile(r"^/v310/servicegroup$"), MockHandler.get_service_groups),
+    ('PUT', re.compile(r"^/v310/servicegroup/([^/]+)/members/static$"),
+     MockHandler.put_service_group_members),
+    ('POST', re.compile(r"^/v310/snapshot$"), MockHandler.post_snapshot),
+    ('GET', re.compile(r"^/v310/appliance/default/dns$"), MockHandler.get_dns),
+    ('PUT', re.compile(r"^/v310/appliance/default$"), MockHandler.put_appliance),
+    ('GET', re.compile(r"^/v310/vmstorePool$"), MockHandler.get_pools),
+    ('GET', re.compile(r"^/v310/vmstorePool/([^/]+)/recommendation/current$"),
+     MockHandler.get_current_reco),
+    ('POST', re.compile(r"^/v310/vmstorePool/([^/]+)/recommendation/([^/]+)/accept$"),
+     MockHandler.accept_reco),
+]
+
+
+# The mock server.  latencies maps endpoint templates such as
+# 'GET /v310/vm' or 'PUT /v310/vm/{uuid}/affinity' to seconds and
+# error_rates maps them to the fraction of requests answered 503, with a
+# Retry-After of retry_after seconds if set.
+class TintriMockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), inventory=None,
+                 product_name="Tintri Global Center", latencies=None,
+                 default_latency=0.0, user_name=None, password=None,
+                 certfile=None, keyfile=None, verbose=False, error_rates=None,
+                 default_error_rate=0.0, retry_after=None):
+        ThreadingHTTPServer.__init__(self, address, MockHandler)
+        self.inventory = inventory if inventory is not None else MockInventory()
+        self.product_name = product_name
+        self.latencies = latencies or {}
+        self.default_latency = default_latency
+        self.error_rates = error_rates or {}
+        self.default_error_rate = default_error_rate
+        self.retry_after = retry_after
+        self._random = random.Random()
+        self.user_name = user_name
+        self.password = password
+        self.verbose = verbose
+        self.default_limit = 100
+        self.sessions = set()
+        self.reports = {}
+        self.dns = {'dnsPrimary': "10.0.0.1", 'dnsSecondary': "10.0.0.2"}
+        self.request_counts = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.use_tls = certfile is not None
+        if self.use_tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+
+    # Clients closing keep-alive connections are not errors.
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+    # The server name to give the examples, host:port.
+    @property
+    def server_host(self):
+        return "%s:%d" % self.server_address[:2]
+
+
+    def info(self):
+        return {'typeId': "com.tintri.api.rest.v310.dto.ApiVersion",
+                'preferredVersion': API_VERSION,
+                'productName': self.product_name,
+                'supportedVersions': ["v310.1", API_VERSION]}
+
+
+    def check_credentials(self, user_name, password):
+        if self.user_name is None:
+            return True
+        return user_name == self.user_name and password == self.password
+
+
+    def new_session(self):
+        session_id = uuid.uuid4().hex.upper()
+        with self._lock:
+            self.sessions.add(session_id)
+        return session_id
+
+
+    def end_session(self, session_id):
+        with self._lock:
+            self.sessions.discard(session_id)
+
+
+    def get_latency(self, template):
+        return self.latencies.get(template, self.default_latency)
+
+
+    def is_busy(self, template):
+        error_rate = self.error_rates.get(template, self.default_error_rate)
+        return error_rate > 0 and self._random.random() < error_rate
+
+
+    def count_request(self, template):
+        with self._lock:
+            self.request_counts[template] = self.request_counts.get(template, 0) + 1
+
+
+    def count_bytes(self, num_bytes):
+        with self._lock:
+            self.bytes_sent += num_bytes
+
+
+    # Build a CSV report of the VMs with the attributes as columns.
+    def new_report(self, attributes, report_filter):
+        lines = [",".join(attributes)]
+        for vm in self.inventory.vms:
+            row = []
+            for attribute in attributes:
+                row.append(report_value(vm, attribute))
+            lines.append(",".join(row))
+        report_id = str(uuid.uuid4())
+        with self._lock:
+            self.reports[report_id] = ("\r\n".join(lines) + "\r\n").encode('utf-8')
+        return report_id
+
+
+    # Serve in a background thread.
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# Return the report value of a VM attribute.
+def report_value(vm, attribute):
+    stats = vm['stats']
+    if attribute == "VmName":
+        return vm['name']
+    if attribute == "Uuid":
+        return vm['uuid']
+    if attribute == "VMstoreName":
+        return vm['vmstore']
+    if attribute == "PowerOn":
+        return "true" if vm['live'] else "false"
+    if attribute.endswith("Latency"):
+        return str(stats['latencyTotalMs'])
+    if attribute.endswith("Iops"):
+        return str(stats['operationsTotalIops'])
+    if attribute.endswith("MBps"):
+        return str(stats['throughputTotalMBps'])
+    if attribute.startswith("Space"):
+        return str(stats['spaceUsedGiB'])
+    if attribute.endswith("Percent"):
+        return str(stats['flashHitPercent'] / 10.0)
+    return ""
+
+
+# Parse 'template=value' arguments such as --latency 'GET /v310/vm=50'
+# into values by template, multiplied by scale.
+def parse_template_values(template_args, scale=1.0):
+    values = {}
+    for template_arg in template_args or []:
+        template, _, value = template_arg.rpartition("=")
+        values[template.strip()] = float(value) * scale
+    return values
+
+
+# main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock Tintri VMstore or TGC server")
+
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8443, help="port to listen on")
+    parser.add_argument("--vms", type=int, default=1000, help="number of VMs")
+    parser.add_argument("--vmstores", type=int, default=4, help="number of VMstores")
+    parser.add_argument("--service_groups", type=int, default=8, help="number of service groups")
+    parser.add_argument("--pools", type=int, default=2, help="number of VMstore pools")
+    parser.add_argument("--seed", type=int, default=1, help="inventory random seed")
+    parser.add_argument("--vmstore", action="store_true", help="act as a VMstore instead of a TGC")
+    parser.add_argument("--latency", action="append",
+                        help="latency of an endpoint in ms, e.g. 'GET /v310/vm=50'. Repeatable.")
+    parser.add_argument("--default_latency", type=float, default=0.0,
+                        help="latency of the other endpoints in ms")
+    parser.add_argument("--error_rate", action="append",
+                        help="fraction of requests to an endpoint answered 503, " +
+                             "e.g. 'PUT /v310/vm/{uuid}/affinity=0.1'. Repeatable.")
+    parser.add_argument("--default_error_rate", type=float, default=0.0,
+                        help="fraction of the requests to the other endpoints answered 503")
+    parser.add_argument("--retry_after", type=int, help="Retry-After seconds of the 503 responses")
+    parser.add_argument("--user", help="only accept this user name")
+    parser.add_argument("--password", help="only accept this password")
+    parser.add_argument("--certfile", help="TLS certificate file; serves https")
+    parser.add_argument("--keyfile", help="TLS key file")
+    parser.add_argument("--verbose", action="store_true", help="log the requests")
+
+    args = parser.parse_args()
+
+    inventory = MockInventory(args.vms, args.vmstores, args.service_groups,
+                              args.pools, args.seed)
+    product_name = "Tintri VMstore" if args.vmstore else "Tintri Global Center"
+    server = TintriMockServer((args.host, args.port), inventory, product_name,
+                              parse_template_values(args.latency, 0.001),
+                              args.default_latency / 1000.0, args.user, args.password,
+                              args.certfile, args.keyfile, args.verbose,
+                              parse_template_values(args.error_rate), args.default_error_rate,
+                              args.retry_after)
+
+    scheme = "https" if server.use_tls else "http"
+    print("[INFO] : " + product_name + " mock with " + str(args.vms) + " VMs at " +
+          scheme + "://" + server.server_host)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
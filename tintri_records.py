@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from array import array
+
+"""
+ Compact record types shared by the examples.  The records use __slots__
+ so they have no per-instance __dict__, and VmStat keeps only the
+ requested statistics in a typed array, so that holding tens of
+ thousands of VMs stays cheap.
+
+ This library was NOT designed to be a general purpose Python library.
+
+"""
+
+NAN = float('nan')
+
+
+# Holds VM name, UUID, and statistics.  fields is the tuple of the
+# statistic names to keep; pass the same tuple to all the VmStat objects so
+# it is shared.  Numeric statistics are kept in an array of doubles with
+# NaN for the missing ones.  If a statistic is not a number the values
+# are kept in a tuple instead.
+class VmStat(object):
+    __slots__ = ('name', 'uuid', 'fields', 'values')
+
+    def __init__(self, name, uuid, stats, fields):
+        self.name = name
+        self.uuid = uuid
+        self.fields = fields
+        try:
+            self.values = array('d', [NAN if stats.get(field) is None else stats[field]
+                                      for field in fields])
+        except TypeError:
+            self.values = tuple(stats.get(field) for field in fields)
+
+    def get_name(self):
+        return self.name
+
+    def get_uuid(self):
+        return self.uuid
+
+    # Return the kept statistics as a dictionary.
+    def get_stats(self):
+        stats = {}
+        for field in self.fields:
+            stat = self.get_stat(field)
+            if stat is not None:
+                stats[field] = stat
+        return stats
+
+    def get_stat(self, stat):
+        try:
+            value = self.values[self.fields.index(stat)]
+        except ValueError:
+            return None
+        if value != value:    # NaN
+            return None
+        return value
+
+
+# Holds the VM information.
+class VmInfo(object):
+    __slots__ = ('name', 'uuid', 'vmstore')
+
+    def __init__(self, name, uuid, vmstore):
+        self.name = name
+        self.uuid = uuid
+        self.vmstore = vmstore
+
+    def __str__(self):
+        return ("VM name: " + self.name + " UUID: " + self.uuid +
+               " (" + self.vmstore + ")")
+
+
+# Class to hold the VM name, UUID, and QOS information, min and max IOPs.
+class VmQosInfo(object):
+    __slots__ = ('name', 'uuid', 'min_value', 'max_value')
+
+    def __init__(self, name, uuid, min_value, max_value):
+        self.name = name
+        self.uuid = uuid
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def get_name(self):
+        return self.name
+
+    def get_uuid(self):
+        return self.uuid
+
+    def get_min_value(self):
+        return self.min_value
+
+    def get_max_value(self):
+        return self.max_value
+
+    def set_min_value(self, new_value):
+        self.min_value = new_value
+
+    def set_max_value(self, new_value):
+        self.max_value = new_value
+
+    def __str__(self):
+        return ("VM name: " + self.name + " UUID: " + self.uuid +
+               " (" + str(self.min_value) + ", " + str(self.max_value) + ")")
+
+
+# Class for VMstore pool.
+class VmstorePool(object):
+    __slots__ = ('name', 'uuid', 'reco_uuid')
+
+    def __init__(self, name, uuid):
+        self.name = name
+        self.uuid = uuid
+        self.reco_uuid = None
+
+    def get_name(self):
+        return self.name
+
+    def get_uuid(self):
+        return self.uuid
+
+    def get_reco_uuid(self):
+        return self.reco_uuid
+
+    def set_reco_uuid(self, reco_uuid):
+        self.reco_uuid = reco_uuid
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import operator
+from array import array
+import numpy as np
+
+"""
+ A columnar table of VM statistics backed by NumPy arrays, for sorting,
+ ranking, filtering and aggregating the stats of tens of thousands of VMs
+ without Python loops.
+
+ Requires NumPy.
+
+ This library was NOT designed to be a general purpose Python library.
+
+"""
+
+# Comparison operators for VmStatsFrame.where().
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+             '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+# Aggregations for VmStatsFrame.group_by().
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max')
+
+
+# VM statistics stored as one contiguous float64 column per stat field,
+# with NaN for a missing stat, plus name, UUID and VMstore columns.  Row i
+# of every column is the same VM.  The methods that select rows return
+# new frames.
+class VmStatsFrame(object):
+    def __init__(self, names, uuids, vmstores, columns):
+        self.names = np.asarray(names, dtype=object)
+        self.uuids = np.asarray(uuids, dtype=object)
+        self.vmstores = np.asarray(vmstores, dtype=object)
+        self.columns = {}
+        for field in columns:
+            self.columns[field] = np.asarray(columns[field], dtype=np.float64)
+        self.fields = list(columns)
+        self._index = None
+
+
+    # Build a frame from VM items of /v310/vm with the stat field, keeping
+    # the stat_fields of the latest sample.
+    @classmethod
+    def from_vms(cls, vms, stat_fields):
+        names = []
+        uuids = []
+        vmstores = []
+        values = dict((field, array('d')) for field in stat_fields)
+        nan = float('nan')
+
+        for vm in vms:
+            names.append(vm["vmware"]["name"])
+            uuids.append(vm["uuid"]["uuid"])
+            vmstores.append(vm.get("vmstoreName", ""))
+            sorted_stats = vm["stat"]["sortedStats"]
+            latest_stats = sorted_stats[0] if len(sorted_stats) > 0 else {}
+            for field in stat_fields:
+                stat = latest_stats.get(field)
+                values[field].append(nan if stat is None else stat)
+
+        columns = dict((field, np.frombuffer(values[field], dtype=np.float64))
+                       for field in stat_fields)
+        return cls(names, uuids, vmstores, columns)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def column(self, field):
+        return self.columns[field]
+
+
+    # Return the row of a VM by name or UUID, or None.
+    def index_of(self, name_or_uuid):
+        if self._index is None:
+            index = dict(zip(self.names.tolist(), range(len(self))))
+            index.update(zip(self.uuids.tolist(), range(len(self))))
+            self._index = index
+        return self._index.get(name_or_uuid)
+
+
+    # Return the stats of a VM by name or UUID as a dictionary, None for a
+    # missing stat.  Returns None for an unknown VM.
+    def get_stats(self, name_or_uuid):
+        row = self.index_of(name_or_uuid)
+        if row is None:
+            return None
+        stats = {}
+        for field in self.fields:
+            value = self.columns[field][row]
+            stats[field] = None if np.isnan(value) else float(value)
+        return stats
+
+
+    # Return a frame of the rows at the indices, in that order.
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        columns = dict((field, self.columns[field][indices]) for field in self.fields)
+        frame = VmStatsFrame(self.names[indices], self.uuids[indices], self.vmstores[indices],
+                             columns)
+        frame.fields = list(self.fields)
+        return frame
+
+
+    # Return a frame of the rows where mask is True.
+    def filter(self, mask):
+        return self.take(np.flatnonzero(mask))
+
+
+    # Return a frame of the VMs whose stat compares to value, e.g.
+    # where('latencyTotalMs', '>', 5.0).  Missing stats never match.
+    def where(self, field, op, value):
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator " + op)
+        column = self.columns[field]
+        with np.errstate(invalid='ignore'):
+            mask = OPERATORS[op](column, value) & ~np.isnan(column)
+        return self.filter(mask)
+
+
+    # Return a frame of the VMs on a VMstore.
+    def on_vmstore(self, vmstore):
+        return self.filter(self.vmstores == vmstore)
+
+
+    # Return a frame sorted by a stat field, or by name when field is None.
+    # Missing stats sort last.
+    def sort(self, field=None, descending=False):
+        if field is None:
+            order = np.argsort(self.names, kind='stable')
+            if descending:
+                order = order[::-1]
+            return self.take(order)
+
+        column = self.columns[field]
+        keys = -column if descending else column
+        return self.take(np.argsort(keys, kind='stable'))
+
+
+    # Return a frame of the n VMs with the largest, or smallest, stat,
+    # sorted.  Missing stats are never picked ahead of present ones.
+    def top(self, field, n, largest=True):
+        column = self.columns[field]
+        keys = np.where(np.isnan(column), np.inf, -column if largest else column)
+        n = min(n, len(keys))
+        if n <= 0:
+            return self.take([])
+        picked = np.argpartition(keys, n - 1)[:n]
+        return self.take(picked[np.argsort(keys[picked], kind='stable')])
+
+
+    # Return the q-th percentile, or percentiles, of a stat, ignoring
+    # missing stats.
+    def percentile(self, field, q):
+        column = self.columns[field]
+        if np.all(np.isnan(column)):
+            return np.nan if np.isscalar(q) else np.full(len(q), np.nan)
+        return np.nanpercentile(column, q)
+
+
+    # Aggregate a stat per VMstore.  Returns a dictionary of VMstore name
+    # to count, sum, mean, min or max, ignoring missing stats.
+    def group_by_vmstore(self, field, aggregation='mean'):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError("Unknown aggregation " + aggregation)
+
+        (vmstores, codes) = np.unique(self.vmstores.astype(str), return_inverse=True)
+        column = self.columns[field]
+        present = ~np.isnan(column)
+        codes = codes.ravel()[present]
+        values = column[present]
+
+        counts = np.bincount(codes, minlength=len(vmstores)).astype(np.float64)
+        if aggregation == 'count':
+            result = counts
+        elif aggregation in ('sum', 'mean'):
+            result = np.bincount(codes, weights=values, minlength=len(vmstores))
+            if aggregation == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = result / counts
+        else:
+            fill = np.inf if aggregation == 'min' else -np.inf
+            result = np.full(len(vmstores), fill)
+            ufunc = np.minimum if aggregation == 'min' else np.maximum
+            ufunc.at(result, codes, values)
+            result[counts == 0] = np.nan
+
+        return dict(zip(vmstores.tolist(), result.tolist()))
+
+
+    # Yield (name, uuid, list of stats) per row, None for a missing stat,
+    # for printing.
+    def rows(self, fields=None):
+        fields = self.fields if fields is None else fields
+        columns = [self.columns[field].tolist() for field in fields]
+        for row in range(len(self)):
+            stats = [column[row] for column in columns]
+            yield (self.names[row], self.uuids[row],
+                   [None if stat != stat else stat for stat in stats])
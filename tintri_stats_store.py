@@ -0,0 +1,470 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import json
+import time
+import numpy as np
+import tintri_1_1 as tintri
+import tintri_stats
+
+"""
+ A local columnar store of historical VM statistics.
+
+ The store of a server is a directory with one sub-directory per UTC day.
+ A day holds one append-only file per column, row i of every file being
+ one sample:
+
+   time.i8        sample end time, int64 epoch seconds
+   vm.i4          VM number, int32, an index into the VM list
+   <field>.f4     one float32 file per stat field, NaN when missing
+
+ state.json records the VM list, the last sample time stored per VM and
+ the committed row count of each day.  Rows past the committed count are
+ from an interrupted run and are dropped when the store is opened for
+ writing.  Readers only read the committed rows.
+
+ Requires NumPy.
+
+ This library was NOT designed to be a general purpose Python library.
+
+"""
+
+DEFAULT_STATS_STORE = os.path.join(os.path.expanduser("~"), ".tintri_stats")
+
+# Stat fields stored by default.
+DEFAULT_STAT_FIELDS = ['spaceUsedGiB', 'spaceProvisionedGiB', 'operationsTotalIops',
+                       'operationsReadIops', 'operationsWriteIops', 'latencyTotalMs',
+                       'latencyHostMs', 'latencyNetworkMs', 'latencyStorageMs',
+                       'latencyDiskMs', 'throughputTotalMBps', 'flashHitPercent']
+
+STATE_FILE = "state.json"
+TIME_COLUMN = "time.i8"
+VM_COLUMN = "vm.i4"
+
+TIME_DTYPE = np.dtype('<i8')
+VM_DTYPE = np.dtype('<i4')
+STAT_DTYPE = np.dtype('<f4')
+
+# Aggregations of TintriStatsStore.query().  'pNN', e.g. 'p99', is also
+# accepted for the NN-th percentile.
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max', 'last')
+
+
+# Return the directory of a server's store.
+def server_path(root, server_name):
+    return os.path.join(root, server_name.replace(":", "_").replace(os.sep, "_"))
+
+
+def stat_column(field):
+    return field + ".f4"
+
+
+# Return the UTC day of epoch seconds, the name of its partition.
+def day_of(epoch):
+    return time.strftime("%Y-%m-%d", time.gmtime(epoch))
+
+
+def read_state(path):
+    try:
+        with open(os.path.join(path, STATE_FILE), 'r') as state_file:
+            return json.load(state_file)
+    except (IOError, OSError, ValueError):
+        return {'vms': [], 'last': {}, 'days': {}}
+
+
+# Writes the samples of a server into its store.  Samples at or before
+# the last stored time of a VM are skipped, so a run can re-fetch an
+# overlapping window.  flush() commits the appended rows.
+class TintriStatsStoreWriter(object):
+    def __init__(self, root, server_name, fields=DEFAULT_STAT_FIELDS):
+        self.path = server_path(root, server_name)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        state = read_state(self.path)
+        self.vms = state['vms']
+        self.last = state['last']
+        self.days = state['days']
+        self.fields = list(fields)
+        self._vm_ids = dict((vm[0], number) for (number, vm) in enumerate(self.vms))
+        self._files = {}
+
+        # Drop the rows of an interrupted run.
+        for day in os.listdir(self.path):
+            day_path = os.path.join(self.path, day)
+            if os.path.isdir(day_path):
+                self._truncate(day, self.days.get(day, {'rows': 0, 'fields': []}))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def _truncate(self, day, info):
+        day_path = os.path.join(self.path, day)
+        columns = [TIME_COLUMN, VM_COLUMN] + [stat_column(field) for field in info['fields']]
+        for column in os.listdir(day_path):
+            rows = info['rows'] if column in columns else 0
+            itemsize = TIME_DTYPE.itemsize if column == TIME_COLUMN else 4
+            column_path = os.path.join(day_path, column)
+            if os.path.getsize(column_path) > rows * itemsize:
+                with open(column_path, 'r+b') as column_file:
+                    column_file.truncate(rows * itemsize)
+
+
+    # Return the last stored sample time of a VM, or None.
+    def get_last_time(self, vm_uuid):
+        return self.last.get(vm_uuid)
+
+
+    def _vm_id(self, vm_uuid, vm_name, vmstore):
+        vm_id = self._vm_ids.get(vm_uuid)
+        if vm_id is None:
+            vm_id = len(self.vms)
+            self.vms.append([vm_uuid, vm_name, vmstore])
+            self._vm_ids[vm_uuid] = vm_id
+        else:
+            self.vms[vm_id] = [vm_uuid, vm_name, vmstore]
+        return vm_id
+
+
+    def _file(self, day, column):
+        key = (day, column)
+        column_file = self._files.get(key)
+        if column_file is None:
+            column_file = open(os.path.join(self.path, day, column), 'ab')
+            self._files[key] = column_file
+        return column_file
+
+
+    # Return the day's partition, creating it or adding columns for new
+    # stat fields padded with NaN.
+    def _day(self, day):
+        info = self.days.get(day)
+        if info is None:
+            day_path = os.path.join(self.path, day)
+            if not os.path.isdir(day_path):
+                os.makedirs(day_path)
+            info = {'rows': 0, 'fields': [], 'pending': 0}
+            self.days[day] = info
+        info.setdefault('pending', info['rows'])
+
+        for field in self.fields:
+            if field not in info['fields']:
+                padding = np.full(info['pending'], np.nan, dtype=STAT_DTYPE)
+                padding.tofile(self._file(day, stat_column(field)))
+                info['fields'].append(field)
+        return info
+
+
+    # Append the samples of a VM.  samples are stat dictionaries with a
+    # timeEnd API time.  Returns the number of samples appended.
+    def append(self, vm_uuid, vm_name, vmstore, samples):
+        vm_id = self._vm_id(vm_uuid, vm_name, vmstore)
+        last = self.last.get(vm_uuid, 0)
+
+        by_day = {}
+        for sample in samples:
+            sample_time = int(tintri.parse_api_time(sample['timeEnd']))
+            if sample_time > last:
+                by_day.setdefault(day_of(sample_time), []).append((sample_time, sample))
+
+        count = 0
+        for day in sorted(by_day):
+            rows = sorted(by_day[day], key=lambda row: row[0])
+            info = self._day(day)
+
+            np.array([row[0] for row in rows], dtype=TIME_DTYPE).tofile(self._file(day, TIME_COLUMN))
+            np.full(len(rows), vm_id, dtype=VM_DTYPE).tofile(self._file(day, VM_COLUMN))
+            for field in info['fields']:
+                values = [row[1].get(field) for row in rows]
+                column = np.array([np.nan if value is None else value for value in values],
+                                  dtype=STAT_DTYPE)
+                column.tofile(self._file(day, stat_column(field)))
+
+            info['pending'] += len(rows)
+            count += len(rows)
+            last = max(last, rows[-1][0])
+
+        if count > 0:
+            self.last[vm_uuid] = last
+        return count
+
+
+    # Commit the appended rows by writing the state.
+    def flush(self):
+        for column_file in self._files.values():
+            column_file.flush()
+            os.fsync(column_file.fileno())
+
+        days = {}
+        for day in self.days:
+            info = self.days[day]
+            days[day] = {'rows': info.get('pending', info['rows']), 'fields': info['fields']}
+        state = {'vms': self.vms, 'last': self.last, 'days': days}
+
+        state_path = os.path.join(self.path, STATE_FILE)
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, state_path)
+
+        for day in days:
+            self.days[day]['rows'] = days[day]['rows']
+
+
+    def close(self):
+        self.flush()
+        for column_file in self._files.values():
+            column_file.close()
+        self._files = {}
+
+
+# Return the sorted values of each group with its start and end, and the
+# number of groups.  codes is the group of each value.  NaN is dropped.
+def _sort_groups(codes, values, groups, order_by=None):
+    present = ~np.isnan(values)
+    codes = codes[present]
+    values = values[present]
+    if order_by is None:
+        order = np.lexsort((values, codes))
+    else:
+        order = np.lexsort((order_by[present], codes))
+    codes = codes[order]
+    values = values[order]
+    starts = np.searchsorted(codes, np.arange(groups), side='left')
+    ends = np.searchsorted(codes, np.arange(groups), side='right')
+    return (values, starts, ends)
+
+
+# Aggregate values per group.  Returns a float64 array of one value per
+# group, NaN for a group with no values.  times orders the values for
+# 'last'.
+def aggregate(codes, values, groups, aggregation, times=None):
+    values = values.astype(np.float64)
+    if aggregation == 'last':
+        (values, starts, ends) = _sort_groups(codes, values, groups, times)
+    else:
+        (values, starts, ends) = _sort_groups(codes, values, groups)
+    counts = ends - starts
+    empty = counts == 0
+    last = np.maximum(ends - 1, 0)
+
+    if aggregation == 'count':
+        return counts.astype(np.float64)
+
+    result = np.full(groups, np.nan)
+    if len(values) == 0:
+        return result
+
+    if aggregation in ('sum', 'mean'):
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        result = sums[ends] - sums[starts]
+        if aggregation == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = result / counts
+    elif aggregation == 'min':
+        result = values[np.minimum(starts, len(values) - 1)]
+    elif aggregation in ('max', 'last'):
+        result = values[last]
+    elif aggregation.startswith('p'):
+        # Linear interpolation between the closest ranks, as NumPy does.
+        q = float(aggregation[1:]) / 100.0
+        position = starts + (np.maximum(counts - 1, 0)) * q
+        below = np.floor(position).astype(np.intp)
+        above = np.minimum(below + 1, last)
+        below = np.minimum(below, len(values) - 1)
+        above = np.minimum(above, len(values) - 1)
+        result = values[below] + (values[above] - values[below]) * (position - below)
+    else:
+        raise ValueError("Unknown aggregation " + aggregation)
+
+    result = np.asarray(result, dtype=np.float64)
+    result[empty] = np.nan
+    return result
+
+
+def check_aggregation(aggregation):
+    if aggregation in AGGREGATIONS:
+        return
+    if aggregation.startswith('p'):
+        try:
+            q = float(aggregation[1:])
+        except ValueError:
+            q = -1
+        if 0 <= q <= 100:
+            return
+    raise ValueError("Unknown aggregation " + aggregation)
+
+
+# Reads a server's store.  The column files of each day are memory-mapped
+# up to the committed row count, so a query only pages in the days and
+# columns it touches, and a writer may append while the store is read.
+class TintriStatsStore(object):
+    def __init__(self, root, server_name):
+        self.path = server_path(root, server_name)
+        if not os.path.isfile(os.path.join(self.path, STATE_FILE)):
+            raise IOError("No stats store for " + server_name + " in " + root)
+
+        state = read_state(self.path)
+        self.vms = state['vms']
+        self.last = state['last']
+        self.days = state['days']
+        self.fields = []
+        for day in sorted(self.days):
+            for field in self.days[day]['fields']:
+                if field not in self.fields:
+                    self.fields.append(field)
+
+        self.uuids = np.array([vm[0] for vm in self.vms], dtype=object)
+        self.names = np.array([vm[1] for vm in self.vms], dtype=object)
+        self.vmstores = np.array([vm[2] for vm in self.vms], dtype=object)
+        self._maps = {}
+
+
+    # Return the sorted days with samples between since and until, epoch
+    # seconds.  None is unbounded.
+    def get_days(self, since=None, until=None):
+        first = None if since is None else day_of(since)
+        last = None if until is None else day_of(until)
+        days = []
+        for day in sorted(self.days):
+            if self.days[day]['rows'] == 0:
+                continue
+            if (first is not None and day < first) or (last is not None and day > last):
+                continue
+            days.append(day)
+        return days
+
+
+    # Return a read-only memory map of a day's column, or None for a
+    # column the day does not have.
+    def _column(self, day, column, dtype):
+        key = (day, column)
+        if key not in self._maps:
+            column_path = os.path.join(self.path, day, column)
+            if os.path.isfile(column_path):
+                self._maps[key] = np.memmap(column_path, dtype=dtype, mode='r',
+                                            shape=(self.days[day]['rows'],))
+            else:
+                self._maps[key] = None
+        return self._maps[key]
+
+
+    # Return the VM numbers of VM names or UUIDs, and of the VMs on a
+    # VMstore.  Returns None for all the VMs.
+    def select_vms(self, vms=None, vmstore=None):
+        if vms is None and vmstore is None:
+            return None
+
+        selected = np.ones(len(self.vms), dtype=bool)
+        if vms is not None:
+            vms = set(vms)
+            selected &= np.array([vm[0] in vms or vm[1] in vms for vm in self.vms],
+                                 dtype=bool)
+        if vmstore is not None:
+            selected &= self.vmstores == vmstore
+        return np.flatnonzero(selected).astype(VM_DTYPE)
+
+
+    # Return the samples of the selected VMs between since and until as
+    # (times, VM numbers, dictionary of field to float32 column).  vms are
+    # VM names or UUIDs.  The samples are in store order.
+    def samples(self, vms=None, fields=None, since=None, until=None, vmstore=None):
+        fields = self.fields if fields is None else list(fields)
+        vm_ids = self.select_vms(vms, vmstore)
+
+        times = []
+        ids = []
+        columns = dict((field, []) for field in fields)
+        for day in self.get_days(since, until):
+            day_times = self._column(day, TIME_COLUMN, TIME_DTYPE)
+            day_ids = self._column(day, VM_COLUMN, VM_DTYPE)
+
+            mask = None
+            if since is not None:
+                mask = day_times >= since
+            if until is not None:
+                mask = day_times <= until if mask is None else mask & (day_times <= until)
+            if vm_ids is not None:
+                in_vms = np.isin(day_ids, vm_ids)
+                mask = in_vms if mask is None else mask & in_vms
+            rows = slice(None) if mask is None else np.flatnonzero(mask)
+
+            times.append(np.asarray(day_times[rows]))
+            ids.append(np.asarray(day_ids[rows]))
+            for field in fields:
+                column = self._column(day, stat_column(field), STAT_DTYPE)
+                if column is None:
+                    columns[field].append(np.full(len(times[-1]), np.nan, dtype=STAT_DTYPE))
+                else:
+                    columns[field].append(np.asarray(column[rows]))
+
+        if len(times) == 0:
+            return (np.empty(0, dtype=TIME_DTYPE), np.empty(0, dtype=VM_DTYPE),
+                    dict((field, np.empty(0, dtype=STAT_DTYPE)) for field in fields))
+        return (np.concatenate(times), np.concatenate(ids),
+                dict((field, np.concatenate(columns[field])) for field in fields))
+
+
+    # Aggregate the stat fields of the selected VMs between since and until.
+    # aggregation is one of AGGREGATIONS or 'pNN'.  Returns a VmStatsFrame
+    # of one row per VM with samples, or with by_vm False a dictionary of
+    # field to the aggregate over all the samples, None when there are
+    # none.  For example, the p99 latency of the VMs on a VMstore:
+    #   store.query(['latencyTotalMs'], since, until, 'p99', vmstore=name,
+    #               by_vm=False)
+    def query(self, fields=None, since=None, until=None, aggregation='mean',
+              vms=None, vmstore=None, by_vm=True):
+        check_aggregation(aggregation)
+        fields = self.fields if fields is None else list(fields)
+        (times, ids, columns) = self.samples(vms, fields, since, until, vmstore)
+
+        if not by_vm:
+            codes = np.zeros(len(ids), dtype=np.intp)
+            result = {}
+            for field in fields:
+                value = aggregate(codes, columns[field], 1, aggregation, times)[0]
+                result[field] = None if np.isnan(value) else float(value)
+            return result
+
+        (vm_ids, codes) = np.unique(ids, return_inverse=True)
+        codes = codes.ravel()
+        aggregates = dict((field, aggregate(codes, columns[field], len(vm_ids),
+                                            aggregation, times))
+                          for field in fields)
+        frame = tintri_stats.VmStatsFrame(self.names[vm_ids], self.uuids[vm_ids],
+                                          self.vmstores[vm_ids], aggregates)
+        frame.fields = fields
+        return frame
+
+
+    def close(self):
+        self._maps = {}
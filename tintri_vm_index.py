@@ -0,0 +1,251 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Tintri, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import time
+import sqlite3
+import tintri_1_1 as tintri
+
+"""
+ A local VM name to UUID index kept in a SQLite file, so that scripts can
+ resolve VM names and UUIDs without downloading the VM inventory on every
+ run.
+
+ The index is keyed by server.  When the index of a server is older than
+ the TTL, it is refreshed from the whole inventory.  Between full
+ refreshes, names and UUIDs that aren't in the index are looked up one
+ at a time.  VM names aren't unique, so name lookups return every UUID
+ with that name and the callers decide what to do with duplicates.
+
+ This library was NOT designed to be a general purpose Python library.
+
+"""
+
+DEFAULT_VM_INDEX = os.path.join(os.path.expanduser("~"), ".tintri_vm_index.db")
+
+# Seconds before the index of a server is refreshed from the whole inventory.
+DEFAULT_VM_INDEX_TTL = 3600
+
+# With more misses than this, one full refresh is cheaper than a lookup
+# per name.
+MAX_NAME_LOOKUPS = 20
+
+VM_URL = "/v310/vm"
+
+
+# VM name and UUID index for one server.  get_query is a function that
+# takes an API and a query and returns the response, like
+# TintriClient.get.
+class TintriVmIndex:
+    def __init__(self, server_name, get_query, db_file=DEFAULT_VM_INDEX,
+                 ttl=DEFAULT_VM_INDEX_TTL):
+        self.server_name = server_name
+        self.get_query = get_query
+        self.ttl = ttl
+        self.refreshed_now = False
+
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS vms " +
+                          "(server TEXT, uuid TEXT, name TEXT, refreshed REAL, " +
+                          "PRIMARY KEY (server, uuid))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS vms_name ON vms (server, name)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS refreshes " +
+                          "(server TEXT PRIMARY KEY, refreshed REAL)")
+        self.conn.commit()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        self.conn.close()
+
+
+    # Return when the index of the server was last fully refreshed, or None.
+    def get_refresh_time(self):
+        row = self.conn.execute("SELECT refreshed FROM refreshes WHERE server = ?",
+                                (self.server_name,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+
+    def is_fresh(self):
+        refreshed = self.get_refresh_time()
+        return refreshed is not None and (time.time() - refreshed) < self.ttl
+
+
+    # Refresh the index from the whole inventory if it is older than the
+    # TTL or if forced.
+    def refresh(self, force=False):
+        if not force and self.is_fresh():
+            return
+
+        now = time.time()
+        vm_pages = tintri.TintriPaginator(self.get_query, VM_URL,
+                                          fields=tintri.VM_UUID_NAME_PATHS)
+        rows = ((self.server_name, vm_uuid, vm_name, now) for (vm_uuid, vm_name) in vm_pages)
+
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO vms VALUES (?, ?, ?, ?)", rows)
+
+            # VMs that weren't seen are gone.
+            self.conn.execute("DELETE FROM vms WHERE server = ? AND refreshed < ?",
+                              (self.server_name, now))
+            self.conn.execute("INSERT OR REPLACE INTO refreshes VALUES (?, ?)",
+                              (self.server_name, now))
+
+        self.refreshed_now = True
+
+
+    def _add(self, vm):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO vms VALUES (?, ?, ?, ?)",
+                              (self.server_name, vm["uuid"]["uuid"], vm["vmware"]["name"],
+                               time.time()))
+
+
+    # Look up the VMs with a name on the server and replace the entries
+    # with that name in the index.
+    def refresh_name(self, name):
+        vm_filter = {'name': name}
+        vm_pages = tintri.TintriPaginator(self.get_query, VM_URL, vm_filter,
+                                          include_fields=tintri.VM_NAME_UUID_FIELDS)
+
+        # The name filter matches VMs that contain the name.
+        vms = [vm for vm in vm_pages if vm["vmware"]["name"] == name]
+
+        with self.conn:
+            self.conn.execute("DELETE FROM vms WHERE server = ? AND name = ?",
+                              (self.server_name, name))
+        for vm in vms:
+            self._add(vm)
+
+
+    # Look up a VM UUID on the server and replace its entry in the index.
+    def refresh_uuid(self, uuid):
+        with self.conn:
+            self.conn.execute("DELETE FROM vms WHERE server = ? AND uuid = ?",
+                              (self.server_name, uuid))
+        try:
+            r = self.get_query(VM_URL + "/" + uuid, None)
+        except tintri.TintriApiException as tae:
+            if tae.status_code == 404:
+                return
+            raise
+
+        self._add(r.json())
+
+
+    # Return the UUIDs of the VMs with a name in the index.
+    def get_uuids(self, name):
+        rows = self.conn.execute("SELECT uuid FROM vms WHERE server = ? AND name = ? " +
+                                 "ORDER BY uuid", (self.server_name, name))
+        return [row[0] for row in rows]
+
+
+    # Return the name of a VM UUID in the index, or None.
+    def get_name(self, uuid):
+        row = self.conn.execute("SELECT name FROM vms WHERE server = ? AND uuid = ?",
+                                (self.server_name, uuid)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+
+    # Return the names or UUIDs that have to be looked up on the server:
+    # all of them when the index is stale, otherwise the ones that aren't
+    # in the index.  Refreshes the whole index instead when there are
+    # too many to look up one at a time.
+    def _to_look_up(self, keys, in_index):
+        if self.is_fresh():
+            keys = [key for key in keys if not in_index(key)]
+            if self.refreshed_now:
+                return []
+
+        if len(keys) > MAX_NAME_LOOKUPS:
+            self.refresh(force=True)
+            return []
+
+        return keys
+
+
+    # Return the UUIDs of the VMs with a name.
+    def lookup_uuids(self, name):
+        if len(self._to_look_up([name], self.get_uuids)) > 0:
+            self.refresh_name(name)
+        return self.get_uuids(name)
+
+
+    # Resolve a list of VM names.  Returns a tuple of
+    # (name to UUID dictionary, list of unknown names,
+    #  dictionary of duplicate names to their UUIDs).
+    # Duplicate names are not in the name to UUID dictionary.
+    def resolve_names(self, names):
+        for name in self._to_look_up(list(set(names)), self.get_uuids):
+            self.refresh_name(name)
+
+        name_to_uuid = {}
+        unknown = []
+        duplicates = {}
+        for name in names:
+            uuids = self.get_uuids(name)
+            if len(uuids) == 0:
+                unknown.append(name)
+            elif len(uuids) == 1:
+                name_to_uuid[name] = uuids[0]
+            else:
+                duplicates[name] = uuids
+
+        return (name_to_uuid, unknown, duplicates)
+
+
+    # Resolve a list of VM UUIDs.  Returns a dictionary of UUID to name.
+    # UUIDs unknown to the server are not in the dictionary.
+    def resolve_uuids(self, uuids):
+        for uuid in self._to_look_up(list(set(uuids)), self.get_name):
+            self.refresh_uuid(uuid)
+
+        uuid_to_name = {}
+        for uuid in uuids:
+            name = self.get_name(uuid)
+            if name is not None:
+                uuid_to_name[uuid] = name
+
+        return uuid_to_name
+
+
+# Open the VM index of a server with a session ID.
+def open_vm_index(server_name, session_id, db_file=DEFAULT_VM_INDEX,
+                  ttl=DEFAULT_VM_INDEX_TTL):
+    def get_query(api, query):
+        return tintri.api_get_query(server_name, api, query, session_id)
+
+    return TintriVmIndex(server_name, get_query, db_file, ttl)